@@ -3,16 +3,43 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from routing import RoutingSession
 import os
+import sqlite3
 
 # Load environment variables
 load_dotenv()
 
 # Initialize Flask extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 jwt = JWTManager()
 
 
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite only enforces foreign keys (and ON DELETE CASCADE) when asked"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+def engine_options():
+    """Connection pool settings from the environment, applied to every bind"""
+    options = {
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    }
+    for option, variable in (('pool_size', 'DB_POOL_SIZE'),
+                             ('max_overflow', 'DB_MAX_OVERFLOW'),
+                             ('pool_recycle', 'DB_POOL_RECYCLE'),
+                             ('pool_timeout', 'DB_POOL_TIMEOUT')):
+        if os.getenv(variable):
+            options[option] = int(os.getenv(variable))
+    return options
+
+
 def create_app():
     app = Flask(__name__)
     
@@ -20,18 +47,132 @@ def create_app():
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'postgresql://localhost/blog_db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options()
+    app.config['DATABASE_REPLICA_URLS'] = [
+        url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()
+    ]
+    app.config['REPLICA_STICKY_SECONDS'] = float(os.getenv('REPLICA_STICKY_SECONDS', 5))
+    
+    # JSON Configuration (orjson or stdlib)
+    app.config['JSON_PROVIDER'] = os.getenv('JSON_PROVIDER', 'orjson')
+    
+    # Search Configuration
+    app.config['POST_SEARCH_MODE'] = os.getenv('POST_SEARCH_MODE', 'fulltext')
+    app.config['NICKNAME_INDEX_REFRESH'] = int(os.getenv('NICKNAME_INDEX_REFRESH', 30))
+    
+    # Deletion Configuration (posts with this many comments are purged in the background; 0 = never)
+    app.config['POST_PURGE_THRESHOLD'] = int(os.getenv('POST_PURGE_THRESHOLD', 1000))
+    app.config['POST_PURGE_BATCH_SIZE'] = int(os.getenv('POST_PURGE_BATCH_SIZE', 1000))
+    app.config['TASK_WORKERS'] = int(os.getenv('TASK_WORKERS', 2))
+    
+    # Threaded Comments Configuration (replies nest at most this many levels deep)
+    app.config['COMMENT_MAX_DEPTH'] = int(os.getenv('COMMENT_MAX_DEPTH', 32))
+    
+    # Live Updates Configuration (server-sent events)
+    app.config['PUBSUB_HISTORY'] = int(os.getenv('PUBSUB_HISTORY', 100))
+    app.config['PUBSUB_QUEUE_SIZE'] = int(os.getenv('PUBSUB_QUEUE_SIZE', 64))
+    app.config['COMMENT_STREAM_KEEPALIVE'] = int(os.getenv('COMMENT_STREAM_KEEPALIVE', 15))
+    app.config['COMMENT_STREAM_TIMEOUT'] = int(os.getenv('COMMENT_STREAM_TIMEOUT', 300))
+    
+    # Feed Configuration (authors with this many followers are pulled at read time)
+    app.config['FEED_TIMELINE_SIZE'] = int(os.getenv('FEED_TIMELINE_SIZE', 500))
+    app.config['FEED_FANOUT_MAX_FOLLOWERS'] = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 10000))
+    
+    # Trending Configuration
+    app.config['TRENDING_HALF_LIFE_HOURS'] = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 6))
+    app.config['TRENDING_SIZE'] = int(os.getenv('TRENDING_SIZE', 100))
+    app.config['TRENDING_RECONCILE_INTERVAL'] = int(os.getenv('TRENDING_RECONCILE_INTERVAL', 300))
+    
+    # View Counter Configuration (views are written to the database in batches)
+    app.config['VIEW_COUNTER_ENABLED'] = os.getenv('VIEW_COUNTER_ENABLED', 'true').lower() == 'true'
+    app.config['VIEW_COUNTER_FLUSH_INTERVAL'] = float(os.getenv('VIEW_COUNTER_FLUSH_INTERVAL', 10))
+    app.config['VIEW_COUNTER_FLUSH_THRESHOLD'] = int(os.getenv('VIEW_COUNTER_FLUSH_THRESHOLD', 1000))
+    
+    # Job Queue Configuration (TASK_BACKEND=jobs runs background work via `flask worker`)
+    app.config['TASK_BACKEND'] = os.getenv('TASK_BACKEND', 'thread')
+    app.config['WORKER_CONCURRENCY'] = int(os.getenv('WORKER_CONCURRENCY', 4))
+    app.config['JOB_MAX_ATTEMPTS'] = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+    app.config['JOB_BACKOFF_SECONDS'] = float(os.getenv('JOB_BACKOFF_SECONDS', 10))
+    app.config['JOB_TIMEOUT'] = int(os.getenv('JOB_TIMEOUT', 600))
+    app.config['JOB_POLL_INTERVAL'] = float(os.getenv('JOB_POLL_INTERVAL', 1))
+    app.config['JOB_RETENTION_HOURS'] = float(os.getenv('JOB_RETENTION_HOURS', 24))
+    
+    # ASGI Configuration (async driver URL for asgi.py; default: DATABASE_URL with asyncpg/aiosqlite)
+    app.config['ASYNC_DATABASE_URL'] = os.getenv('ASYNC_DATABASE_URL')
+    
+    # Password Hashing Configuration
+    app.config['PASSWORD_HASH_ALGORITHM'] = os.getenv('PASSWORD_HASH_ALGORITHM', 'bcrypt')
+    app.config['PASSWORD_HASH_COST'] = int(os.getenv('PASSWORD_HASH_COST', 0)) or None
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS') or os.cpu_count() or 1)
+    app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 0)) or None
+    
+    # Response Cache Configuration
+    app.config['RESPONSE_CACHE_ENABLED'] = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+    app.config['RESPONSE_CACHE_TTL'] = int(os.getenv('RESPONSE_CACHE_TTL', 30))
+    app.config['RESPONSE_CACHE_MAX_ENTRIES'] = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+    
+    # User Cache Configuration
+    app.config['USER_CACHE_TTL'] = int(os.getenv('USER_CACHE_TTL', 60))
+    app.config['USER_CACHE_MAX_ENTRIES'] = int(os.getenv('USER_CACHE_MAX_ENTRIES', 4096))
+    
+    # Metrics Configuration
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    app.config['METRICS_WINDOW'] = int(os.getenv('METRICS_WINDOW', 1024))
+    app.config['SLOW_QUERY_THRESHOLD_MS'] = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 200))
     
     # JWT Configuration
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'jwt-secret-key')
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = int(os.getenv('JWT_ACCESS_TOKEN_EXPIRES', 3600))
+    app.config['JWT_USER_CLAIMS'] = os.getenv('JWT_USER_CLAIMS', 'true').lower() == 'true'
     
     # Initialize extensions
+    from json_provider import init_json_provider
+    init_json_provider(app)
+    
+    from routing import replica_router
+    replica_router.init_app(app)
+    
     db.init_app(app)
     jwt.init_app(app)
     
+    from nickname_index import nickname_index
+    nickname_index.init_app(app)
+    
+    from cache import response_cache
+    response_cache.init_app(app)
+    
+    from passwords import password_hasher
+    password_hasher.init_app(app)
+    
+    from user_cache import user_cache
+    user_cache.init_app(app)
+    
+    from tasks import tasks
+    tasks.init_app(app)
+    
+    from jobs import job_queue, jobs_collector
+    job_queue.init_app(app)
+    
+    from pubsub import pubsub
+    pubsub.init_app(app)
+    
+    from trending import trending
+    trending.init_app(app)
+    
+    from view_counter import view_counter
+    view_counter.init_app(app)
+    
+    from instrumentation import instrumentation, cache_collector
+    instrumentation.init_app(app)
+    instrumentation.register_collector(cache_collector('response_cache', response_cache))
+    instrumentation.register_collector(cache_collector('user_cache', user_cache))
+    if app.config['TASK_BACKEND'] == 'jobs':
+        instrumentation.register_collector(jobs_collector(job_queue))
+    
     # Configure CORS
-    cors_origins = os.getenv('CORS_ORIGINS', 'http://localhost:3000').split(',')
-    CORS(app, origins=cors_origins)
+    app.config['CORS_ORIGINS'] = os.getenv('CORS_ORIGINS', 'http://localhost:3000').split(',')
+    # Credentials let the replica router's last-write cookie reach the API
+    CORS(app, origins=app.config['CORS_ORIGINS'], supports_credentials=True)
     
     # Register blueprints
     from routes.auth import auth_bp
@@ -44,14 +185,24 @@ def create_app():
     app.register_blueprint(posts_bp, url_prefix='/api/posts')
     app.register_blueprint(comments_bp, url_prefix='/api/comments')
     
-    # Create tables
-    @app.before_first_request
-    def create_tables():
-        db.create_all()
+    # Register CLI commands
+    from commands import register_commands
+    register_commands(app)
     
     return app
 
 
+def dispose_engines(app):
+    """Drop pooled connections inherited from a parent process
+
+    Call in a freshly forked child, e.g. from gunicorn's ``post_fork``.
+    The parent's sockets are left open for the parent to keep using.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
 if __name__ == '__main__':
     app = create_app()
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
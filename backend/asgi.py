@@ -0,0 +1,552 @@
+"""ASGI entry point serving the public read routes on an async engine
+
+    uvicorn --factory asgi:create_asgi_app --workers 4
+
+The post listing, post detail, post comments, user profile and search
+routes run as coroutines on SQLAlchemy's async engine (asyncpg on
+PostgreSQL, aiosqlite on SQLite), so a request waiting on the database
+holds no thread. They build the same statements and go through the same
+serializers, response cache, view counter and metrics as the Flask
+views, so responses are identical.
+
+Needs uvicorn (or another ASGI server), SQLAlchemy's asyncio extra and
+the async driver; asgiref too for the remaining routes. They are pinned
+in ``requirements-asgi.txt`` at the repository root:
+
+    pip install -r ../requirements-asgi.txt
+
+Every other request, including HEAD and OPTIONS, is handed to the Flask
+app through asgiref's ``WsgiToAsgi``, which runs it on a thread. Without
+asgiref installed those requests get a 501. Reads always go to the
+primary (or ``ASYNC_DATABASE_URL``); replica routing only applies to the
+Flask views.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from functools import wraps
+from urllib.parse import parse_qsl
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import configure_mappers, defer, joinedload
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_etags, quote_etag, unquote_etag
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:  # pragma: no cover - optional, for routes not served here
+    WsgiToAsgi = None
+
+from app import create_app
+from models import User, Post, Comment
+from queries import post_rows_select, comment_rows_select
+from serializers import serialize_post_row, serialize_post_rows, serialize_comment_rows
+from pagination import keyset_query, keyset_page, InvalidCursor
+from search import fulltext_statements, with_snippets
+from nickname_index import nickname_index
+from cache import response_cache
+from view_counter import view_counter
+from instrumentation import instrumentation, server_timing, current_query_stats, QueryStats
+from comment_threads import tree_select, tree_page
+
+log = logging.getLogger('blog.asgi')
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_database_url(url):
+    """Swap the driver of a database URL for its asyncio counterpart"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f'No async driver configured for {backend}')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+class Request:
+    """The parts of an ASGI request the read views need"""
+
+    def __init__(self, scope, app, session):
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'),
+                                        keep_blank_values=True))
+        self.headers = {name.decode('latin-1'): value.decode('latin-1')
+                        for name, value in scope['headers']}
+        self.app = app
+        self.session = session
+        self.serialize_time = 0.0
+
+
+class Response:
+    """Status, body and headers of a response from an async view"""
+
+    def __init__(self, body, status=200, headers=None, mimetype='application/json'):
+        self.body = body
+        self.status = status
+        self.headers = dict(headers or {})
+        self.headers.setdefault('content-type', mimetype)
+
+
+def cached(*tags):
+    """``response_cache.cached`` for async views, sharing its entries"""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, **kwargs):
+            if not response_cache.enabled:
+                return await view(request, **kwargs)
+
+            key = response_cache.key_for(request.path, request.args.items(multi=True), tags, kwargs)
+            entry = response_cache.lookup(key)
+            if entry is None:
+                response = await view(request, **kwargs)
+                if response.status != 200:
+                    return response
+                entry = response_cache.store(key, response.body, response.headers['content-type'])
+
+            etag = entry['etag']
+            if parse_etags(request.headers.get('if-none-match')).contains_weak(etag):
+                return Response(b'', 304, {'etag': quote_etag(etag)}, entry['mimetype'])
+            return Response(entry['body'], 200, {'etag': quote_etag(etag)}, entry['mimetype'])
+        return wrapper
+    return decorator
+
+
+def counts_views(arg):
+    """``view_counter.counts`` for async views"""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, **kwargs):
+            response = await view(request, **kwargs)
+            if response.status not in (200, 304):
+                return response
+
+            post_id = kwargs[arg]
+            with request.app.app_context():
+                view_counter.record(post_id)
+            if response.status != 200:
+                return response
+
+            stored = await request.session.scalar(select(Post.views).where(Post.id == post_id)) or 0
+            etag = unquote_etag(response.headers['etag'])[0] if 'etag' in response.headers \
+                else hashlib.sha1(response.body).hexdigest()
+            with request.app.app_context():
+                body, views = view_counter.with_views(response.body, post_id, stored)
+            etag = f'{etag}.{views}'
+            if parse_etags(request.headers.get('if-none-match')).contains_weak(etag):
+                return Response(b'', 304, {'etag': quote_etag(etag)}, response.headers['content-type'])
+            return Response(body, 200, {'etag': quote_etag(etag)}, response.headers['content-type'])
+        return wrapper
+    return decorator
+
+
+async def paginate(request, query, created_col, id_col, descending=True, default_per_page=10):
+    """``pagination.paginate`` for ``select()`` statements on the async session"""
+    session = request.session
+    per_page = request.args.get('per_page', default_per_page, type=int)
+
+    if 'cursor' in request.args:
+        cursor = request.args['cursor']
+        query, direction = keyset_query(query, created_col, id_col, cursor, per_page, descending)
+        items = (await session.execute(query)).all()
+        return keyset_page(items, created_col, id_col, cursor, per_page, direction)
+
+    page = request.args.get('page', 1, type=int)
+    if descending:
+        query = query.order_by(created_col.desc(), id_col.desc())
+    else:
+        query = query.order_by(created_col.asc(), id_col.asc())
+
+    items, total, pages = await offset_page(session, query, page, per_page)
+    return items, {
+        'total': total,
+        'pages': pages,
+        'current_page': page,
+        'per_page': per_page,
+        'has_next': max(page, 1) < pages,
+        'has_prev': page > 1
+    }
+
+
+async def offset_page(session, query, page, per_page):
+    """Flask-SQLAlchemy's ``paginate(error_out=False)``; returns ``(items, total, pages)``"""
+    # Same clamping as Flask-SQLAlchemy
+    page = max(page, 1)
+    if per_page < 1:
+        per_page = 20
+
+    items = (await session.execute(query.limit(per_page).offset((page - 1) * per_page))).all()
+    total = await session.scalar(select(func.count()).select_from(query.order_by(None).subquery()))
+    return items, total, math.ceil(total / per_page) if total else 0
+
+
+def json_response(request, data, status=200):
+    """Encode ``data`` exactly as ``jsonify`` would"""
+    started = time.perf_counter()
+    response = request.app.json.response(data)
+    request.serialize_time += time.perf_counter() - started
+    return Response(response.get_data(), status, mimetype=response.mimetype)
+
+
+@cached('posts')
+async def get_posts(request):
+    """Get all posts with page or cursor pagination"""
+    try:
+        posts, pagination = await paginate(request, post_rows_select(), Post.created_at, Post.id)
+
+        return json_response(request, {
+            'posts': serialize_post_rows(posts),
+            **pagination
+        }, 200)
+
+    except InvalidCursor:
+        return json_response(request, {'error': 'Invalid cursor'}, 400)
+    except Exception as e:
+        return json_response(request, {'error': 'Failed to get posts'}, 500)
+
+
+@counts_views('post_id')
+@cached('post:{post_id}')
+async def get_post(request, post_id):
+    """Get a specific post by ID"""
+    try:
+        post = await request.session.get(Post, post_id, options=[joinedload(Post.author)])
+
+        if not post or post.is_deleted:
+            return json_response(request, {'error': 'Post not found'}, 404)
+
+        return json_response(request, {
+            'post': post.to_dict(include_content=True)
+        }, 200)
+
+    except Exception as e:
+        return json_response(request, {'error': 'Failed to get post'}, 500)
+
+
+@cached('post:{post_id}:comments')
+async def get_post_comments(request, post_id):
+    """Get top-level comments (or replies to ?parent_id=) of a post, or ?view=tree"""
+    try:
+        session = request.session
+        post = await session.get(Post, post_id, options=[defer(Post.content)])
+
+        if not post or post.is_deleted:
+            return json_response(request, {'error': 'Post not found'}, 404)
+
+        view = request.args.get('view', 'list')
+        if view == 'tree':
+            depth = request.args.get('depth', request.app.config['COMMENT_MAX_DEPTH'], type=int)
+            per_page = request.args.get('per_page', 100, type=int)
+            if depth < 1 or per_page < 1:
+                return json_response(request, {'error': 'depth and per_page must be positive'}, 400)
+
+            root = None
+            if 'root' in request.args:
+                root = await session.get(Comment, request.args.get('root', 0, type=int),
+                                         options=[defer(Comment.content)])
+                if not root or root.post_id != post_id:
+                    return json_response(request, {'error': 'Comment not found'}, 404)
+
+            rows = (await session.execute(
+                tree_select(post_id, depth, root, request.args.get('cursor'), per_page)
+            )).all()
+            comments, pagination = tree_page(rows, per_page)
+
+            return json_response(request, {
+                'comments': comments,
+                **pagination
+            }, 200)
+
+        if view != 'list':
+            return json_response(request, {'error': 'view must be list or tree'}, 400)
+
+        parent_id = request.args.get('parent_id', type=int)
+        comments, pagination = await paginate(request,
+                                              comment_rows_select().where(Comment.post_id == post_id,
+                                                                          Comment.parent_id == parent_id),
+                                              Comment.created_at, Comment.id,
+                                              descending=False, default_per_page=20)
+
+        return json_response(request, {
+            'comments': serialize_comment_rows(comments),
+            **pagination
+        }, 200)
+
+    except InvalidCursor:
+        return json_response(request, {'error': 'Invalid cursor'}, 400)
+    except Exception as e:
+        return json_response(request, {'error': 'Failed to get comments'}, 500)
+
+
+async def search_posts(request):
+    """Search posts by title and content"""
+    try:
+        session = request.session
+        query = request.args.get('q', '').strip()
+
+        if not query:
+            return json_response(request, {'error': 'Search query is required'}, 400)
+
+        if len(query) < 2:
+            return json_response(request, {'error': 'Search query must be at least 2 characters'}, 400)
+
+        mode = request.args.get('mode', request.app.config['POST_SEARCH_MODE'])
+        sort = request.args.get('sort', 'rank')
+
+        if mode not in ('fulltext', 'substring'):
+            return json_response(request, {'error': 'Search mode must be fulltext or substring'}, 400)
+
+        if sort not in ('rank', 'recent'):
+            return json_response(request, {'error': 'Sort must be rank or recent'}, 400)
+
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = request.args.get('per_page', 10, type=int)
+        dialect = session.bind.dialect.name
+
+        if mode == 'fulltext' and dialect in ('postgresql', 'sqlite'):
+            results, total = [], 0
+            statements = fulltext_statements(query, dialect, sort)
+            if statements is not None:
+                count, rows = statements
+                total = await session.scalar(count)
+                rows = (await session.execute(rows.offset((page - 1) * per_page).limit(per_page))).all()
+                results = with_snippets(rows)
+
+            authors = {}
+            posts = []
+            for row, snippet in results:
+                data = serialize_post_row(row, authors)
+                data['snippet'] = snippet
+                posts.append(data)
+
+            pages = math.ceil(total / per_page) if per_page > 0 else 0
+
+            return json_response(request, {
+                'posts': posts,
+                'total': total,
+                'pages': pages,
+                'current_page': page,
+                'per_page': per_page,
+                'has_next': page < pages,
+                'has_prev': page > 1
+            }, 200)
+
+        posts, total, pages = await offset_page(session, post_rows_select().where(
+            (Post.title.ilike(f'%{query}%')) |
+            (Post.content.ilike(f'%{query}%'))
+        ).order_by(Post.created_at.desc()), page, per_page)
+
+        return json_response(request, {
+            'posts': serialize_post_rows(posts),
+            'total': total,
+            'pages': pages,
+            'current_page': page,
+            'per_page': per_page,
+            'has_next': page < pages,
+            'has_prev': page > 1
+        }, 200)
+
+    except Exception as e:
+        return json_response(request, {'error': 'Search failed'}, 500)
+
+
+async def get_user_profile(request, nickname):
+    """Get user profile by nickname"""
+    try:
+        user = (await request.session.scalars(
+            select(User).filter_by(nickname=nickname).limit(1)
+        )).first()
+
+        if not user:
+            return json_response(request, {'error': 'User not found'}, 404)
+
+        posts, pagination = await paginate(request, post_rows_select().where(Post.author_id == user.id),
+                                           Post.created_at, Post.id)
+
+        return json_response(request, {
+            'user': user.to_dict(),
+            'posts': {
+                'items': serialize_post_rows(posts),
+                **pagination
+            }
+        }, 200)
+
+    except InvalidCursor:
+        return json_response(request, {'error': 'Invalid cursor'}, 400)
+    except Exception as e:
+        return json_response(request, {'error': 'Failed to get user profile'}, 500)
+
+
+async def search_users(request):
+    """Search users by nickname"""
+    try:
+        query = request.args.get('q', '').strip()
+
+        if not query:
+            return json_response(request, {'error': 'Search query is required'}, 400)
+
+        if len(query) < 2:
+            return json_response(request, {'error': 'Search query must be at least 2 characters'}, 400)
+
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = max(request.args.get('per_page', 10, type=int), 1)
+
+        # The index is in memory, but loading or refreshing it queries the database
+        def search():
+            with request.app.app_context():
+                return nickname_index.search(query)
+
+        user_ids = await asyncio.to_thread(search)
+        page_ids = user_ids[(page - 1) * per_page:page * per_page]
+
+        users = {
+            user.id: user
+            for user in await request.session.scalars(select(User).where(User.id.in_(page_ids)))
+        } if page_ids else {}
+        total = len(user_ids)
+        pages = math.ceil(total / per_page)
+
+        return json_response(request, {
+            'users': [users[user_id].to_dict() for user_id in page_ids if user_id in users],
+            'total': total,
+            'pages': pages,
+            'current_page': page,
+            'per_page': per_page,
+            'has_next': page < pages,
+            'has_prev': page > 1
+        }, 200)
+
+    except Exception as e:
+        return json_response(request, {'error': 'Search failed'}, 500)
+
+
+# Flask endpoints served by the coroutines above
+VIEWS = {
+    'posts.get_posts': get_posts,
+    'posts.get_post': get_post,
+    'posts.search_posts': search_posts,
+    'comments.get_post_comments': get_post_comments,
+    'users.get_user_profile': get_user_profile,
+    'users.search_users': search_users,
+}
+
+
+class AsyncReadApp:
+    """ASGI application serving ``VIEWS`` itself and the rest through Flask"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.url_adapter = flask_app.url_map.bind('localhost')
+        self.cors_origins = set(flask_app.config['CORS_ORIGINS'])
+        self.database_url = flask_app.config['ASYNC_DATABASE_URL'] or \
+            async_database_url(flask_app.config['SQLALCHEMY_DATABASE_URI'])
+        self.engine = None
+        self.sessions = None
+        # Backrefs such as Post.author only exist once the mappers are configured,
+        # which Flask views trigger by querying but the async views reference first
+        configure_mappers()
+
+        if WsgiToAsgi is not None:
+            self.fallback = WsgiToAsgi(flask_app)
+        else:
+            log.warning('asgiref is not installed; only the read routes will be served')
+            self.fallback = self._not_served
+
+    def _get_sessions(self):
+        # The engine's connections belong to the event loop that opened them
+        if self.sessions is None:
+            options = dict(self.flask_app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+            if make_url(self.database_url).get_backend_name() == 'sqlite':
+                # aiosqlite otherwise gets a NullPool: a new connection and thread per request
+                options.setdefault('poolclass', AsyncAdaptedQueuePool)
+            self.engine = create_async_engine(self.database_url, **options)
+            self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        return self.sessions
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            try:
+                rule, view_args = self.url_adapter.match(scope['path'], method='GET', return_rule=True)
+            except HTTPException:
+                rule = None
+            view = VIEWS.get(rule.endpoint) if rule else None
+            if view is not None:
+                return await self._serve(view, rule, view_args, scope, send)
+
+        await self.fallback(scope, receive, send)
+
+    async def _serve(self, view, rule, view_args, scope, send):
+        started = time.perf_counter()
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+        try:
+            async with self._get_sessions()() as session:
+                request = Request(scope, self.flask_app, session)
+                response = await view(request, **view_args)
+        finally:
+            current_query_stats.reset(token)
+
+        duration = time.perf_counter() - started
+        headers = {
+            **response.headers,
+            'content-length': str(len(response.body)),
+            'server-timing': server_timing(stats.statements, stats.time, request.serialize_time, duration),
+        }
+        origin = request.headers.get('origin')
+        if origin in self.cors_origins:
+            headers['access-control-allow-origin'] = origin
+
+        instrumentation.record_request('GET', rule.rule, response.status,
+                                       duration, stats.time, stats.statements)
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status,
+            'headers': [(name.encode('latin-1'), value.encode('latin-1'))
+                        for name, value in headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': response.body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.engine is not None:
+                    await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _not_served(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        body = self.flask_app.json.dumps({'error': 'Not available on this server'}).encode() + b'\n'
+        await send({
+            'type': 'http.response.start',
+            'status': 501,
+            'headers': [(b'content-type', b'application/json'),
+                        (b'content-length', str(len(body)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def create_asgi_app(flask_app=None):
+    """Build the ASGI application around ``flask_app`` (default: ``create_app()``)"""
+    return AsyncReadApp(flask_app or create_app())
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:create_asgi_app', factory=True, host='0.0.0.0', port=8000)
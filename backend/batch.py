@@ -0,0 +1,49 @@
+"""Helpers for the ``GET /batch?ids=1,2,3`` endpoints"""
+from flask import request
+
+MAX_BATCH_IDS = 100
+
+
+class InvalidIds(ValueError):
+    """Raised when the ``ids`` query argument is malformed"""
+
+
+def parse_ids(limit=MAX_BATCH_IDS):
+    """Read ``?ids=`` as a list of unique ints, in request order"""
+    raw = request.args.get('ids', '')
+    try:
+        ids = [int(part) for part in raw.split(',') if part.strip()]
+    except ValueError:
+        raise InvalidIds('ids must be a comma-separated list of integers')
+
+    if not ids:
+        raise InvalidIds('ids is required')
+
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > limit:
+        raise InvalidIds(f'At most {limit} ids per request')
+    return ids
+
+
+def id_tags(prefix):
+    """Response cache tags ``<prefix>:<id>`` for every requested id
+
+    For use with ``response_cache.cached``, so a batch response is dropped
+    whenever any of its items is invalidated.
+    """
+    def tags(**kwargs):
+        try:
+            return [f'{prefix}:{item_id}' for item_id in parse_ids()]
+        except InvalidIds:
+            return []
+    return tags
+
+
+def fetch_by_ids(query, id_column, ids):
+    """Load ``ids`` with one ``IN`` query; return ``(items, missing_ids)``
+
+    Items come back in the order of ``ids``.
+    """
+    found = {item.id: item for item in query.filter(id_column.in_(ids))}
+    return [found[item_id] for item_id in ids if item_id in found], \
+           [item_id for item_id in ids if item_id not in found]
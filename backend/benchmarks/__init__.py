@@ -0,0 +1 @@
+"""Benchmarks for the blog backend, run from ``backend/`` with ``python -m``"""
@@ -0,0 +1,180 @@
+"""Read throughput of asgi.py vs. the threaded Flask app at high concurrency
+
+    pip install -r ../requirements-asgi.txt
+    python -m benchmarks.asgi_reads --database-url sqlite:///bench.db --concurrency 256
+
+Starts each server in turn as a single process on the same database:
+gunicorn with one gthread worker of ``--threads`` threads for Flask, and
+uvicorn for ``asgi.py``. It then keeps ``--concurrency`` keep-alive
+connections busy with the read routes that ``asgi.py`` serves and
+reports throughput and latency percentiles for each. The response cache
+is off unless ``--cache`` is passed, so every request reaches the
+database.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import quote
+
+from benchmarks.load import sample_database, percentile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    'flask': [sys.executable, '-m', 'gunicorn', '--worker-class', 'gthread', '--workers', '1',
+              '--threads', '{threads}', '--bind', '127.0.0.1:{port}', '--log-level', 'warning',
+              'app:create_app()'],
+    'asgi': [sys.executable, '-m', 'uvicorn', '--factory', 'asgi:create_asgi_app',
+             '--host', '127.0.0.1', '--port', '{port}', '--log-level', 'warning', '--no-access-log'],
+}
+
+
+def read_paths(sample, rng, routes=None, count=2000):
+    """A shuffled list of read requests weighted like the read-heavy load mix"""
+    users = sample['users']
+    mix = {
+        'list_posts': (30, lambda: f'/api/posts?page={rng.choice([1, 1, 1, 2, 3, rng.randint(1, 100)])}'),
+        'list_posts_cursor': (10, lambda: '/api/posts?cursor='),
+        'get_post': (20, lambda: f'/api/posts/{rng.randint(1, sample["max_post_id"])}'),
+        'post_comments': (15, lambda: f'/api/comments/post/{rng.choice(sample["popular_post_ids"])}'),
+        'search_posts': (4, lambda: f'/api/posts/search?q={rng.choice(["database", "cache", "python", "query"])}'),
+        'search_users': (2, lambda: f'/api/users/search?q=er{rng.randint(1, 99)}'),
+        'user_profile': (4, lambda: f'/api/users/{quote(rng.choice(users)["nickname"])}'),
+    }
+    choices = [mix[name] for name in (routes or mix)]
+    weights = [weight for weight, _ in choices]
+    return [rng.choices(choices, weights)[0][1]() for _ in range(count)]
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = dict(line.split(':', 1) for line in lines[1:] if ':' in line)
+    headers = {name.strip().lower(): value.strip() for name, value in headers.items()}
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection', '').lower() == 'close'
+
+
+async def client(port, paths, offset, deadline, results):
+    reader = writer = None
+    index = offset
+    while time.monotonic() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+            status, close = await read_response(reader)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            status, close = 599, True
+        results.append((time.perf_counter() - started, status))
+        if close and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def drive(port, paths, concurrency, duration):
+    results = []
+    deadline = time.monotonic() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(client(port, paths, i * 7, deadline, results) for i in range(concurrency)))
+    return results, time.perf_counter() - started
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with {process.returncode}')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+def run_server(name, args, paths, env):
+    port = free_port()
+    command = [part.format(port=port, threads=args.threads) for part in SERVERS[name]]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+    try:
+        wait_for_port(port, process)
+        # Warm up connections, caches and the nickname index
+        asyncio.run(drive(port, paths, min(args.concurrency, 16), 2))
+        results, elapsed = asyncio.run(drive(port, paths, args.concurrency, args.duration))
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        'requests': len(results),
+        'errors': sum(1 for _, status in results if status >= 400),
+        'rps': round(len(results) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL', 'sqlite:///bench.db'))
+    parser.add_argument('--concurrency', type=int, default=256)
+    parser.add_argument('--duration', type=float, default=15.0, help='Seconds per server')
+    parser.add_argument('--threads', type=int, default=16, help='Threads of the Flask worker')
+    parser.add_argument('--servers', default='flask,asgi')
+    parser.add_argument('--routes', help='Comma-separated subset of the mix, e.g. get_post,post_comments')
+    parser.add_argument('--cache', action='store_true', help='Leave the response cache on')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write results as JSON')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        sample = sample_database()
+    paths = read_paths(sample, random.Random(args.seed), args.routes and args.routes.split(','))
+
+    env = {
+        **os.environ,
+        'DATABASE_URL': args.database_url,
+        'RESPONSE_CACHE_ENABLED': 'true' if args.cache else 'false',
+        'TASK_WORKERS': '0',
+    }
+
+    report = {'concurrency': args.concurrency, 'threads': args.threads, 'routes': args.routes, 'servers': {}}
+    print(f'{"server":8} {"reqs":>8} {"err":>6} {"req/s":>9} {"p50":>9} {"p95":>9} {"p99":>9}')
+    for name in args.servers.split(','):
+        stats = report['servers'][name] = run_server(name, args, paths, env)
+        print(f'{name:8} {stats["requests"]:>8} {stats["errors"]:>6} {stats["rps"]:>9.1f} '
+              f'{stats["p50_ms"]:>9.2f} {stats["p95_ms"]:>9.2f} {stats["p99_ms"]:>9.2f}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
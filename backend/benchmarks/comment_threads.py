@@ -0,0 +1,193 @@
+"""Threaded comments: materialized-path reads vs. per-comment reply lookups
+
+    python -m benchmarks.comment_threads --database-url sqlite:///threads.db --comments 100000
+
+Adds one post with a thread of ``--comments`` comments, a ``--top-ratio``
+share of them top-level and the rest replies to a random earlier comment,
+then requests ``/api/comments/post/<id>`` in its list and tree views with
+the response cache off. Reports the median time and the number of SQL
+statements per request; the counts stay the same however large the
+thread is. For comparison, the same subtree is loaded the naive way, one
+query for the replies of each comment.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+
+def build_thread(post_id, author_ids, count, top_ratio, max_depth, first_id, rng, now):
+    """Build the comment rows of one thread, with paths, depths and reply counts"""
+    from models import comment_path
+
+    rows = []
+    for i in range(count):
+        comment_id = first_id + i
+        parent = None
+        if rows and rng.random() >= top_ratio:
+            parent = rng.choice(rows)
+            if parent['depth'] + 1 >= max_depth:
+                parent = None
+        created_at = now - timedelta(seconds=count - i)
+        rows.append({
+            'id': comment_id,
+            'content': f'comment {comment_id}',
+            'post_id': post_id,
+            'author_id': rng.choice(author_ids),
+            'parent_id': parent['id'] if parent else None,
+            'path': comment_path(comment_id, parent['path'] if parent else ''),
+            'depth': parent['depth'] + 1 if parent else 0,
+            'replies_count': 0,
+            'created_at': created_at,
+            'updated_at': created_at,
+        })
+        if parent:
+            parent['replies_count'] += 1
+    return rows
+
+
+def seed_thread(args, rng):
+    from app import db
+    from benchmarks.seed import insert_batches
+    from commands import rebuild_comment_counts, reset_id_sequences
+    from models import User, Post, Comment
+
+    db.create_all()
+    now = datetime.utcnow()
+    if not db.session.query(User.id).first():
+        insert_batches(User.__table__, ({
+            'id': i, 'nickname': f'user{i}', 'email': f'user{i}@example.org',
+            'password_hash': 'x', 'created_at': now, 'updated_at': now,
+        } for i in range(1, 101)), args.batch_size, 'users')
+    author_ids = db.session.scalars(db.select(User.id).limit(100)).all()
+
+    post = Post(title='A long thread', content='Discuss.', author_id=author_ids[0])
+    db.session.add(post)
+    db.session.commit()
+
+    first_id = (db.session.query(db.func.max(Comment.id)).scalar() or 0) + 1
+    rows = build_thread(post.id, author_ids, args.comments, args.top_ratio,
+                        args.max_depth, first_id, rng, now)
+    insert_batches(Comment.__table__, rows, args.batch_size, 'comments')
+    rebuild_comment_counts()
+    reset_id_sequences('users', 'posts', 'comments')
+    return post.id, rows
+
+
+def naive_subtree(root_id, depth):
+    """Load replies level by level with one query per comment, as without paths"""
+    from app import db
+    from queries import comment_rows_query
+    from models import Comment
+
+    count = 0
+    pending = [(root_id, 0)]
+    while pending:
+        parent_id, level = pending.pop()
+        if level >= depth:
+            continue
+        replies = comment_rows_query().filter(Comment.parent_id == parent_id)\
+            .order_by(Comment.created_at, Comment.id).all()
+        count += len(replies)
+        pending.extend((reply.id, level + 1) for reply in replies)
+    db.session.rollback()
+    return count
+
+
+def count_nested(comments):
+    return sum(1 + count_nested(comment.get('replies', ())) for comment in comments)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL', 'sqlite:///threads.db'))
+    parser.add_argument('--comments', type=int, default=100000)
+    parser.add_argument('--top-ratio', type=float, default=0.05,
+                        help='Share of top-level comments; the rest are replies')
+    parser.add_argument('--max-depth', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write results as JSON')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ['RESPONSE_CACHE_ENABLED'] = 'false'
+    os.environ['TASK_WORKERS'] = '0'
+    os.environ['COMMENT_MAX_DEPTH'] = str(args.max_depth)
+
+    from sqlalchemy import event
+    from app import create_app, db
+    from comment_threads import encode_path_cursor
+    from models import COMMENT_PATH_WIDTH
+
+    app = create_app()
+    with app.app_context():
+        post_id, rows = seed_thread(args, random.Random(args.seed))
+        statements = [0]
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda *_: statements.__setitem__(0, statements[0] + 1))
+
+    top = [row for row in rows if row['parent_id'] is None]
+    busiest = max(rows, key=lambda row: row['replies_count'])
+    # The top-level comment with the largest subtree, and its size
+    sizes = {}
+    for row in rows:
+        top_path = row['path'][:COMMENT_PATH_WIDTH + 1]
+        sizes[top_path] = sizes.get(top_path, 0) + 1
+    big_root = max(top, key=lambda row: sizes[row['path']])
+    deepest = max(row['depth'] for row in rows)
+    print(f'post {post_id}: {len(rows):,} comments, {len(top):,} top-level, '
+          f'deepest level {deepest}, largest subtree {sizes[big_root["path"]]:,}')
+
+    client = app.test_client()
+    base = f'/api/comments/post/{post_id}'
+    middle = encode_path_cursor(sorted(row['path'] for row in rows)[len(rows) // 2])
+    cases = {
+        'top-level, page 1': f'{base}',
+        'top-level, page 50': f'{base}?page=50',
+        'top-level, cursor': f'{base}?cursor=',
+        'replies of busiest comment': f'{base}?parent_id={busiest["id"]}&cursor=',
+        'tree depth 3, first 100': f'{base}?view=tree&depth=3',
+        'tree, first 1000': f'{base}?view=tree&per_page=1000',
+        'tree, 1000 from the middle': f'{base}?view=tree&per_page=1000&cursor={middle}',
+        'subtree of largest top-level': f'{base}?view=tree&root={big_root["id"]}&per_page={len(rows)}',
+        'whole thread': f'{base}?view=tree&per_page={len(rows)}',
+    }
+
+    report = {'comments': len(rows), 'top_level': len(top), 'deepest': deepest, 'requests': {}}
+    print(f'{"request":32} {"median ms":>10} {"queries":>8} {"comments":>9}')
+    for name, path in cases.items():
+        durations = []
+        for _ in range(args.repeat):
+            statements[0] = 0
+            started = time.perf_counter()
+            response = client.get(path)
+            durations.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, (path, response.get_json())
+
+        stats = report['requests'][name] = {
+            'median_ms': round(statistics.median(durations), 2),
+            'queries': statements[0],
+            'comments': count_nested(response.get_json()['comments']),
+        }
+        print(f'{name:32} {stats["median_ms"]:>10.2f} {stats["queries"]:>8} {stats["comments"]:>9,}')
+
+    with app.app_context():
+        statements[0] = 0
+        started = time.perf_counter()
+        loaded = naive_subtree(big_root['id'], args.max_depth)
+        naive_ms = (time.perf_counter() - started) * 1000
+        report['naive_subtree'] = {'ms': round(naive_ms, 2), 'queries': statements[0], 'comments': loaded}
+        print(f'{"subtree, query per comment":32} {naive_ms:>10.2f} {statements[0]:>8} {loaded:>9,}  (no serialization)')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
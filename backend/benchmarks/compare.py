@@ -0,0 +1,67 @@
+"""Compare two load-test reports and flag latency regressions
+
+    python -m benchmarks.compare results/base.json results/head.json --threshold 10
+
+Exits with status 1 when any route's p95 or SQL statements per request
+got worse by more than the threshold percentage. Statement averages
+include response-cache hits, which issue none, so they move a little
+between runs even when the code does not change.
+"""
+import argparse
+import json
+import sys
+
+
+def change(old, new):
+    if old in (None, 0) or new is None:
+        return None
+    return (new - old) / old * 100
+
+
+def compare(base, head, threshold):
+    regressions = []
+    print(f'base {base.get("revision")} ({base["rps"]} req/s) -> '
+          f'head {head.get("revision")} ({head["rps"]} req/s)')
+    print(f'{"route":40} {"p50 ms":>17} {"p95 ms":>17} {"sql/req":>13}')
+
+    for route in sorted(set(base['routes']) | set(head['routes'])):
+        old, new = base['routes'].get(route), head['routes'].get(route)
+        if old is None or new is None:
+            print(f'{route:40} only in {"head" if old is None else "base"}')
+            continue
+
+        p95_change = change(old['p95_ms'], new['p95_ms'])
+        sql_change = change(old['sql_per_request'], new['sql_per_request'])
+        flag = ''
+        if (p95_change or 0) > threshold or (sql_change or 0) > threshold:
+            flag = '  REGRESSION'
+            regressions.append(route)
+
+        print(f'{route:40} {old["p50_ms"]:>7.2f} -> {new["p50_ms"]:>7.2f} '
+              f'{old["p95_ms"]:>7.2f} -> {new["p95_ms"]:>7.2f} '
+              f'{old["sql_per_request"] or "-":>5} -> {new["sql_per_request"] or "-":>5}{flag}')
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark reports')
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Allowed p95 slowdown and SQL statement increase, in percent')
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    regressions = compare(base, head, args.threshold)
+    if regressions:
+        print(f'{len(regressions)} route(s) regressed')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
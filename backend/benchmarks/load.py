@@ -0,0 +1,382 @@
+"""Drive a weighted mix of API requests and report latency per route
+
+    python -m benchmarks.load --database-url sqlite:///bench.db \\
+        --concurrency 16 --duration 30 --output results/HEAD.json
+
+Requests go to an in-process app by default, or to a running server with
+``--url http://localhost:5000``. The database URL is always needed to
+sample existing ids and nicknames. Results (throughput, p50/p95/p99 and SQL
+statements per request, read from ``Server-Timing``) are printed and, with
+``--output``, saved as JSON for ``benchmarks.compare``.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from benchmarks.seed import PASSWORD, sentence
+
+SQL_STATEMENTS = re.compile(r'db;desc="(\d+) queries"')
+
+# Relative weights of each scenario in the default mix
+MIXES = {
+    'read-heavy': {
+        'list_posts': 30, 'list_posts_cursor': 10, 'get_post': 20, 'post_comments': 15,
+        'search_posts': 4, 'search_users': 2, 'autocomplete': 4, 'user_profile': 4,
+        'user_posts': 2, 'user_comments': 2, 'get_comment': 1, 'me': 2,
+        'create_comment': 2, 'edit_comment': 0.5, 'create_post': 1, 'edit_post': 0.5,
+        'login': 0.5, 'refresh': 0.5,
+    },
+    'write-heavy': {
+        'list_posts': 10, 'get_post': 10, 'post_comments': 10,
+        'create_comment': 20, 'edit_comment': 10, 'create_post': 10, 'edit_post': 5,
+        'signup': 2, 'login': 5,
+    },
+}
+
+
+class InProcessClient:
+    """Sends requests through the Flask test client"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.headers, response.get_json(silent=True)
+
+
+class HttpClient:
+    """Sends requests to a running server over one keep-alive connection per thread"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.local = threading.local()
+
+    def _connection(self):
+        if not hasattr(self.local, 'conn'):
+            self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        return self.local.conn
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+
+        conn = self._connection()
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            del self.local.conn
+            raise
+        data = response.read()
+        try:
+            data = json.loads(data) if data else None
+        except ValueError:
+            data = None
+        return response.status, response.headers, data
+
+
+class Workload:
+    """Picks scenarios from a weighted mix and records every request"""
+
+    def __init__(self, client, sample, mix, rng_seed):
+        self.client = client
+        self.sample = sample
+        self.scenarios = list(mix)
+        self.weights = [mix[name] for name in self.scenarios]
+        self.rng_seed = rng_seed
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.owned_posts = defaultdict(list)
+        self.owned_comments = defaultdict(list)
+
+    @property
+    def rng(self):
+        if not hasattr(self.local, 'rng'):
+            self.local.rng = random.Random(self.rng_seed + threading.get_ident())
+        return self.local.rng
+
+    def call(self, route, method, path, body=None, token=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else None
+        started = time.perf_counter()
+        try:
+            status, headers, data = self.client.request(method, path, body, headers)
+        except Exception:
+            status, headers, data = 599, {}, None
+        latency = time.perf_counter() - started
+
+        match = SQL_STATEMENTS.search(headers.get('Server-Timing', '') if headers else '')
+        statements = int(match.group(1)) if match else None
+
+        with self.lock:
+            self.samples[route].append((latency, statements))
+            if status >= 400:
+                self.errors[route] += 1
+        return status, data
+
+    def random_user(self):
+        return self.rng.choice(self.sample['users'])
+
+    def run_one(self):
+        name = self.rng.choices(self.scenarios, self.weights)[0]
+        getattr(self, f'scenario_{name}')()
+
+    # Read scenarios
+
+    def scenario_list_posts(self):
+        page = self.rng.choice([1, 1, 1, 2, 3, self.rng.randint(1, 100)])
+        self.call('GET /api/posts', 'GET', f'/api/posts?page={page}')
+
+    def scenario_list_posts_cursor(self):
+        status, data = self.call('GET /api/posts?cursor', 'GET', '/api/posts?cursor=')
+        if status == 200 and data.get('next_cursor'):
+            self.call('GET /api/posts?cursor', 'GET', f'/api/posts?cursor={data["next_cursor"]}')
+
+    def scenario_get_post(self):
+        self.call('GET /api/posts/<id>', 'GET', f'/api/posts/{self.rng.randint(1, self.sample["max_post_id"])}')
+
+    def scenario_post_comments(self):
+        post_id = self.rng.choice(self.sample['popular_post_ids'])
+        self.call('GET /api/comments/post/<id>', 'GET', f'/api/comments/post/{post_id}')
+
+    def scenario_get_comment(self):
+        comment_id = self.rng.randint(1, max(self.sample['max_comment_id'], 1))
+        self.call('GET /api/comments/<id>', 'GET', f'/api/comments/{comment_id}')
+
+    def scenario_search_posts(self):
+        query = self.rng.choice(['database', 'cache latency', 'python', 'lorem ipsum', 'query'])
+        self.call('GET /api/posts/search', 'GET', f'/api/posts/search?q={query.replace(" ", "+")}')
+
+    def scenario_search_users(self):
+        self.call('GET /api/users/search', 'GET', f'/api/users/search?q=er{self.rng.randint(1, 99)}')
+
+    def scenario_autocomplete(self):
+        nickname = self.random_user()['nickname']
+        for length in range(2, min(len(nickname), 6) + 1):
+            self.call('GET /api/users/autocomplete', 'GET', f'/api/users/autocomplete?q={nickname[:length]}')
+
+    def scenario_user_profile(self):
+        self.call('GET /api/users/<nickname>', 'GET', f'/api/users/{self.random_user()["nickname"]}')
+
+    def scenario_user_posts(self):
+        self.call('GET /api/users/<nickname>/posts', 'GET',
+                  f'/api/users/{self.random_user()["nickname"]}/posts')
+
+    def scenario_user_comments(self):
+        self.call('GET /api/comments/user/<id>', 'GET', f'/api/comments/user/{self.random_user()["id"]}')
+
+    # Authenticated scenarios
+
+    def token_for(self, user):
+        if 'token' not in user:
+            status, data = self.call('POST /api/auth/login', 'POST', '/api/auth/login',
+                                     {'email': user['email'], 'password': PASSWORD})
+            if status != 200:
+                return None
+            user['token'] = data['access_token']
+        return user['token']
+
+    def scenario_me(self):
+        self.call('GET /api/auth/me', 'GET', '/api/auth/me', token=self.token_for(self.random_user()))
+
+    def scenario_login(self):
+        user = self.random_user()
+        self.call('POST /api/auth/login', 'POST', '/api/auth/login',
+                  {'email': user['email'], 'password': PASSWORD})
+
+    def scenario_refresh(self):
+        self.call('POST /api/auth/refresh', 'POST', '/api/auth/refresh',
+                  token=self.token_for(self.random_user()))
+
+    def scenario_signup(self):
+        nickname = f'load{threading.get_ident() % 100000}x{self.rng.randint(0, 10**9)}'
+        self.call('POST /api/auth/signup', 'POST', '/api/auth/signup', {
+            'nickname': nickname, 'email': f'{nickname}@example.org', 'password': PASSWORD
+        })
+
+    def scenario_create_post(self):
+        user = self.random_user()
+        status, data = self.call('POST /api/posts', 'POST', '/api/posts', {
+            'title': sentence(self.rng, 3, 8), 'content': sentence(self.rng, 50, 300)
+        }, token=self.token_for(user))
+        if status == 201:
+            with self.lock:
+                self.owned_posts[user['id']].append(data['post']['id'])
+
+    def scenario_edit_post(self):
+        user = self.random_user()
+        with self.lock:
+            post_ids = list(self.owned_posts[user['id']])
+        if not post_ids:
+            return self.scenario_create_post()
+
+        post_id = self.rng.choice(post_ids)
+        token = self.token_for(user)
+        if self.rng.random() < 0.7:
+            self.call('PUT /api/posts/<id>', 'PUT', f'/api/posts/{post_id}',
+                      {'content': sentence(self.rng, 50, 300)}, token=token)
+        else:
+            status, _ = self.call('DELETE /api/posts/<id>', 'DELETE', f'/api/posts/{post_id}', token=token)
+            with self.lock:
+                if post_id in self.owned_posts[user['id']]:
+                    self.owned_posts[user['id']].remove(post_id)
+
+    def scenario_create_comment(self):
+        user = self.random_user()
+        status, data = self.call('POST /api/comments', 'POST', '/api/comments', {
+            'post_id': self.rng.choice(self.sample['popular_post_ids']),
+            'content': sentence(self.rng, 5, 40)
+        }, token=self.token_for(user))
+        if status == 201:
+            with self.lock:
+                self.owned_comments[user['id']].append(data['comment']['id'])
+
+    def scenario_edit_comment(self):
+        user = self.random_user()
+        with self.lock:
+            comment_ids = list(self.owned_comments[user['id']])
+        if not comment_ids:
+            return self.scenario_create_comment()
+
+        comment_id = self.rng.choice(comment_ids)
+        token = self.token_for(user)
+        if self.rng.random() < 0.7:
+            self.call('PUT /api/comments/<id>', 'PUT', f'/api/comments/{comment_id}',
+                      {'content': sentence(self.rng, 5, 40)}, token=token)
+        else:
+            self.call('DELETE /api/comments/<id>', 'DELETE', f'/api/comments/{comment_id}', token=token)
+            with self.lock:
+                if comment_id in self.owned_comments[user['id']]:
+                    self.owned_comments[user['id']].remove(comment_id)
+
+
+def sample_database(users=200):
+    """Collect ids and nicknames to aim requests at"""
+    from sqlalchemy import func
+    from app import db
+    from models import User, Post, Comment
+
+    rows = db.session.query(User.id, User.nickname, User.email)\
+                     .order_by(func.random()).limit(users).all()
+    popular = db.session.query(Post.id).order_by(Post.comments_count.desc()).limit(100).all()
+
+    return {
+        'users': [{'id': r.id, 'nickname': r.nickname, 'email': r.email} for r in rows],
+        'max_post_id': db.session.query(func.max(Post.id)).scalar() or 1,
+        'max_comment_id': db.session.query(func.max(Comment.id)).scalar() or 1,
+        'popular_post_ids': [r.id for r in popular] or [1],
+    }
+
+
+def percentile(ordered, q):
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def summarize(workload, elapsed):
+    routes = {}
+    total = 0
+    for route, samples in sorted(workload.samples.items()):
+        latencies = sorted(latency for latency, _ in samples)
+        statements = [s for _, s in samples if s is not None]
+        total += len(samples)
+        routes[route] = {
+            'requests': len(samples),
+            'errors': workload.errors[route],
+            'rps': round(len(samples) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'sql_per_request': round(sum(statements) / len(statements), 2) if statements else None,
+        }
+    return {'requests': total, 'rps': round(total / elapsed, 2), 'routes': routes}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report):
+    print(f'{report["requests"]} requests, {report["rps"]} req/s')
+    print(f'{"route":40} {"reqs":>7} {"err":>5} {"p50":>9} {"p95":>9} {"p99":>9} {"sql":>6}')
+    for route, stats in report['routes'].items():
+        print(f'{route:40} {stats["requests"]:>7} {stats["errors"]:>5} '
+              f'{stats["p50_ms"]:>9.2f} {stats["p95_ms"]:>9.2f} {stats["p99_ms"]:>9.2f} '
+              f'{stats["sql_per_request"] if stats["sql_per_request"] is not None else "-":>6}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the blog API')
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL', 'sqlite:///bench.db'))
+    parser.add_argument('--url', help='Base URL of a running server; default is in-process')
+    parser.add_argument('--mix', choices=sorted(MIXES), default='read-heavy')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the JSON report to this path')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        sample = sample_database()
+
+    client = HttpClient(args.url) if args.url else InProcessClient(app)
+    workload = Workload(client, sample, MIXES[args.mix], args.seed)
+
+    deadline = time.monotonic() + args.duration
+
+    def worker():
+        while time.monotonic() < deadline:
+            workload.run_one()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(args.concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'target': args.url or 'in-process',
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1],
+        'mix': args.mix,
+        'concurrency': args.concurrency,
+        'duration': round(elapsed, 3),
+        **summarize(workload, elapsed),
+    }
+    print_report(report)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Login throughput with inline vs pooled password hashing
+
+Runs concurrent logins against an in-process app while another thread
+reads ``GET /api/posts``, once with hashing in the request thread
+(``PASSWORD_HASH_WORKERS=0``) and once on the process pool.
+
+    python -m benchmarks.login_throughput --threads 16 --logins 200
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run(workers, args, database_url):
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['PASSWORD_HASH_WORKERS'] = str(workers)
+    os.environ['RESPONSE_CACHE_ENABLED'] = 'false'
+
+    from app import create_app, db
+    from models import User
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        if not User.query.count():
+            for i in range(args.users):
+                user = User(nickname=f'bench{i}', email=f'bench{i}@example.org')
+                user.set_password('password')
+                db.session.add(user)
+            db.session.commit()
+
+    client = app.test_client()
+    done = threading.Event()
+    read_latencies = []
+
+    def reader():
+        while not done.is_set():
+            started = time.perf_counter()
+            client.get('/api/posts')
+            read_latencies.append(time.perf_counter() - started)
+
+    def login(i):
+        started = time.perf_counter()
+        response = client.post('/api/auth/login', json={
+            'email': f'bench{i % args.users}@example.org',
+            'password': 'password'
+        })
+        return response.status_code, time.perf_counter() - started
+
+    read_thread = threading.Thread(target=reader)
+    read_thread.start()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        results = list(executor.map(login, range(args.logins)))
+    elapsed = time.perf_counter() - started
+
+    done.set()
+    read_thread.join()
+
+    ok = [latency for status, latency in results if status == 200]
+    return {
+        'hash_workers': workers,
+        'logins': len(results),
+        'succeeded': len(ok),
+        'rejected_busy': sum(1 for status, _ in results if status == 503),
+        'logins_per_sec': round(len(ok) / elapsed, 2),
+        'login_p50_ms': round(statistics.median(ok) * 1000, 2) if ok else None,
+        'read_p50_ms': round(statistics.median(read_latencies) * 1000, 2) if read_latencies else None,
+        'read_max_ms': round(max(read_latencies) * 1000, 2) if read_latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f'sqlite:///{tmp}/bench.db'
+        results = [run(0, args, database_url), run(args.workers, args, database_url)]
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
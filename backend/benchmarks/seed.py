@@ -0,0 +1,155 @@
+"""Seed a database with synthetic users, posts and comments
+
+    python -m benchmarks.seed --database-url sqlite:///bench.db \\
+        --users 10000 --posts 1000000 --comments 10000000
+
+Rows are generated deterministically from ``--seed`` and inserted with
+batched executemany. Every user's password is ``password``.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+    'tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam '
+    'quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo '
+    'consequat duis aute irure in reprehenderit voluptate velit esse cillum '
+    'fugiat nulla pariatur excepteur sint occaecat cupidatat non proident sunt '
+    'culpa qui officia deserunt mollit anim id est laborum python flask '
+    'database index query cache latency throughput postgres sqlite blog'
+).split()
+
+PASSWORD = 'password'
+
+
+def sentence(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def timestamps(rng, count, start, end):
+    """Yield ``count`` ascending timestamps between ``start`` and ``end``"""
+    step = (end - start) / max(count, 1)
+    for i in range(count):
+        yield start + step * i + timedelta(seconds=rng.random() * step.total_seconds())
+
+
+def insert_batches(table, rows, batch_size, label):
+    from app import db
+
+    started = time.perf_counter()
+    batch = []
+    total = 0
+
+    def flush():
+        nonlocal total
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+        total += len(batch)
+        rate = total / max(time.perf_counter() - started, 1e-9)
+        print(f'\r{label}: {total} rows ({rate:,.0f} rows/s)', end='', flush=True)
+        batch.clear()
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    print()
+
+
+def seed(args):
+    from app import db
+    from commands import rebuild_comment_counts, reset_id_sequences
+    from models import User, Post, Comment, make_excerpt, count_words, comment_path
+    from passwords import hash_password
+
+    rng = random.Random(args.seed)
+    end = datetime.utcnow()
+    start = end - timedelta(days=args.days)
+    signup_start = start - timedelta(days=30)
+
+    db.create_all()
+
+    # One hash shared by every user keeps seeding fast
+    password_hash = hash_password(PASSWORD, 'bcrypt', 4)
+
+    insert_batches(User.__table__, (
+        {
+            'id': i,
+            'nickname': f'user{i}',
+            'email': f'user{i}@example.org',
+            'password_hash': password_hash,
+            'created_at': created_at,
+            'updated_at': created_at,
+        }
+        for i, created_at in enumerate(timestamps(rng, args.users, signup_start, start), start=1)
+    ), args.batch_size, 'users')
+
+    def post_row(i, created_at):
+        content = '\n\n'.join(sentence(rng, 20, 80) for _ in range(rng.randint(1, 6)))
+        return {
+            'id': i,
+            'title': sentence(rng, 3, 10).capitalize(),
+            'content': content,
+            'excerpt': make_excerpt(content),
+            'word_count': count_words(content),
+            'author_id': rng.randint(1, args.users),
+            'created_at': created_at,
+            'updated_at': created_at,
+        }
+
+    insert_batches(Post.__table__, (
+        post_row(i, created_at)
+        for i, created_at in enumerate(timestamps(rng, args.posts, start, end), start=1)
+    ), args.batch_size, 'posts')
+
+    # Comments skew towards a minority of popular posts
+    def comment_post_id():
+        if rng.random() < 0.2:
+            return rng.randint(1, max(args.posts // 100, 1))
+        return rng.randint(1, args.posts)
+
+    insert_batches(Comment.__table__, (
+        {
+            'id': i,
+            'content': sentence(rng, 5, 40),
+            'post_id': comment_post_id(),
+            'author_id': rng.randint(1, args.users),
+            'path': comment_path(i),
+            'created_at': created_at,
+            'updated_at': created_at,
+        }
+        for i, created_at in enumerate(timestamps(rng, args.comments, start, end), start=1)
+    ), args.batch_size, 'comments')
+
+    print(f'comment counters: {rebuild_comment_counts()} posts')
+
+    reset_id_sequences('users', 'posts', 'comments')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed synthetic blog data')
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL', 'sqlite:///bench.db'))
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--comments', type=int, default=100000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        seed(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Cold start time and per-worker memory of the production server
+
+    pip install gunicorn
+    python -m benchmarks.startup --database-url sqlite:///bench.db --workers 4
+
+Times ``create_app()`` in a fresh interpreter, then starts
+``gunicorn -c gunicorn.conf.py`` with and without ``preload_app`` and
+reports the time until the first response and, after a warm-up of
+``--requests`` reads, each worker's memory from ``/proc``: RSS, PSS
+(shared pages split between the processes sharing them) and USS (pages
+private to the worker). Preloading imports the app once in the master,
+so workers share those pages until they write to them. Linux only.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks.asgi_reads import BACKEND_DIR, free_port
+
+CREATE_APP = (
+    'import time; started = time.perf_counter()\n'
+    'from app import create_app; create_app()\n'
+    'print(time.perf_counter() - started)'
+)
+
+
+def create_app_times(env, repeat):
+    """Seconds to import and build the app, and for the whole interpreter run"""
+    inside, total = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', CREATE_APP], cwd=BACKEND_DIR, env=env,
+                                check=True, capture_output=True, text=True).stdout
+        total.append(time.perf_counter() - started)
+        inside.append(float(output.split()[-1]))
+    return statistics.median(inside), statistics.median(total)
+
+
+def get(port, path, timeout=30):
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=timeout) as response:
+        response.read()
+        return response.status
+
+
+def wait_for_response(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with {process.returncode}')
+        try:
+            return get(port, '/api/posts?per_page=1')
+        except OSError:
+            time.sleep(0.02)
+    raise RuntimeError('server did not respond')
+
+
+def memory(pid):
+    """RSS, PSS and USS of a process in MiB"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss_mb': round(fields['Rss'], 1),
+        'pss_mb': round(fields['Pss'], 1),
+        'uss_mb': round(fields['Private_Clean'] + fields['Private_Dirty'], 1),
+    }
+
+
+def worker_pids(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def run_server(preload, args, env):
+    port = free_port()
+    env = {
+        **env,
+        'GUNICORN_BIND': f'127.0.0.1:{port}',
+        'GUNICORN_PRELOAD': 'true' if preload else 'false',
+        'WEB_CONCURRENCY': str(args.workers),
+    }
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                                '--log-level', 'warning'], cwd=BACKEND_DIR, env=env)
+    try:
+        wait_for_response(port, process)
+        first_response = time.perf_counter() - started
+
+        # Each request opens a new connection, so the warm-up reaches every worker
+        for i in range(args.requests):
+            get(port, f'/api/posts?page={i % 5 + 1}' if i % 2 else f'/api/posts/{i + 1}')
+
+        workers = [memory(pid) for pid in worker_pids(process.pid)]
+        master = memory(process.pid)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    return {
+        'first_response_s': round(first_response, 3),
+        'master': master,
+        'workers': len(workers),
+        **{key: round(statistics.mean(w[key] for w in workers), 1) for key in ('rss_mb', 'pss_mb', 'uss_mb')},
+        'total_pss_mb': round(master['pss_mb'] + sum(w['pss_mb'] for w in workers), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL', 'sqlite:///bench.db'))
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5, help='create_app() runs to take the median of')
+    parser.add_argument('--requests', type=int, default=400, help='Warm-up requests before measuring memory')
+    parser.add_argument('--output', help='Write results as JSON')
+    args = parser.parse_args()
+
+    env = {
+        **os.environ,
+        'DATABASE_URL': args.database_url,
+        'RESPONSE_CACHE_ENABLED': 'false',
+        'TASK_WORKERS': '0',
+    }
+
+    in_process, interpreter = create_app_times(env, args.repeat)
+    print(f'create_app(): {in_process * 1000:.0f} ms, whole interpreter {interpreter * 1000:.0f} ms')
+
+    report = {'create_app_s': round(in_process, 3), 'interpreter_s': round(interpreter, 3),
+              'workers': args.workers, 'servers': {}}
+    print(f'{"preload":8} {"first":>8} {"RSS":>8} {"PSS":>8} {"USS":>8} {"total PSS":>10}  (per worker, MiB)')
+    for preload in (True, False):
+        stats = report['servers']['preload' if preload else 'no_preload'] = run_server(preload, args, env)
+        print(f'{str(preload).lower():8} {stats["first_response_s"]:>7.2f}s {stats["rss_mb"]:>8.1f} '
+              f'{stats["pss_mb"]:>8.1f} {stats["uss_mb"]:>8.1f} {stats["total_pss_mb"]:>10.1f}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
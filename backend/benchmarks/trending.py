@@ -0,0 +1,122 @@
+"""Trending posts: incremental scores vs. a GROUP BY over comments
+
+Run against a seeded database, e.g. 10M comments:
+
+    python -m benchmarks.seed --database-url sqlite:///bench.db --comments 10000000
+    python -m benchmarks.trending --database-url sqlite:///bench.db
+
+Times the naive decayed-score aggregate that ``/api/posts/trending`` would
+otherwise run per request, one full reconcile, loading persisted scores,
+and the per-comment update and per-request ranking of ``trending``.
+"""
+import argparse
+import json
+import math
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+
+def timed(fn, repeat):
+    durations = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - started)
+    return result, statistics.median(durations) * 1000
+
+
+def naive_top(limit, half_life_hours, now):
+    """Score every post with a comment in the window, in SQL, then sort"""
+    from sqlalchemy import func, select
+    from app import db
+    from models import Comment
+
+    decay = math.log(2) / (half_life_hours * 3600)
+    since = now - timedelta(hours=10 * half_life_hours)
+    if db.engine.dialect.name == 'postgresql':
+        age = func.extract('epoch', now - Comment.created_at)
+    else:
+        age = (func.julianday(now) - func.julianday(Comment.created_at)) * 86400
+    score = func.sum(func.exp(-decay * age)).label('score')
+
+    return db.session.execute(
+        select(Comment.post_id, score)
+        .where(Comment.created_at >= since)
+        .group_by(Comment.post_id)
+        .order_by(score.desc())
+        .limit(limit)
+    ).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL', 'sqlite:///bench.db'))
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--updates', type=int, default=100000)
+    parser.add_argument('--output', help='Write results as JSON')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ['TASK_WORKERS'] = '0'
+
+    from app import create_app, db
+    from models import Post, Comment
+    from trending import Trending
+
+    app = create_app()
+    with app.app_context():
+        half_life = app.config['TRENDING_HALF_LIFE_HOURS']
+        comments = db.session.query(Comment.id).count()
+        # Score as of the newest comment so seeded data is "recent"
+        now = db.session.query(db.func.max(Comment.created_at)).scalar() or datetime.utcnow()
+        print(f'{comments:,} comments, half-life {half_life}h')
+
+        naive, naive_ms = timed(lambda: naive_top(args.limit, half_life, now), args.repeat)
+        print(f'GROUP BY per request:  {naive_ms:10.2f} ms')
+
+        ranking = Trending(app)
+        ranking.reconcile_interval = float('inf')
+        scores, reconcile_ms = timed(lambda: ranking.compute(now), 1)
+        print(f'reconcile (compute):   {reconcile_ms:10.2f} ms  ({len(scores)} posts kept)')
+
+        ranking.reconcile()
+        fresh = Trending(app)
+        fresh.reconcile_interval = float('inf')
+        _, load_ms = timed(fresh._load, 1)
+        print(f'load persisted scores: {load_ms:10.2f} ms')
+
+        ranking._scores = {post_id: score for post_id, score in scores.items()}
+        ranking._base = (now - datetime(1970, 1, 1)).total_seconds()
+        top, top_ms = timed(lambda: ranking.top(args.limit), args.repeat * 20)
+        print(f'top() per request:     {top_ms:10.4f} ms')
+
+        post_ids = [post_id for post_id, in db.session.query(Post.id).limit(10000)]
+        started = time.perf_counter()
+        for i in range(args.updates):
+            ranking.record(post_ids[i % len(post_ids)], now)
+        record_us = (time.perf_counter() - started) / args.updates * 1e6
+        print(f'record() per comment:  {record_us:10.2f} µs')
+
+        overlap = len({post_id for post_id, _ in naive} & {post_id for post_id, _ in
+                                                          sorted(scores.items(), key=lambda item: -item[1])[:args.limit]})
+        print(f'top-{args.limit} agreement with GROUP BY: {overlap}/{min(args.limit, len(naive))}')
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({
+                    'comments': comments,
+                    'group_by_ms': naive_ms,
+                    'reconcile_ms': reconcile_ms,
+                    'load_ms': load_ms,
+                    'top_ms': top_ms,
+                    'record_us': record_us,
+                    'agreement': overlap,
+                }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
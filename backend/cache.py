@@ -0,0 +1,255 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import g, request, make_response
+
+
+class CacheBackend:
+    """Storage interface for the response cache
+
+    Entries may be evicted at any time. Counters written with ``incr`` must
+    be kept for at least ``ttl`` seconds, since cache keys embed them.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def get_counter(self, key):
+        raise NotImplementedError
+
+    def incr(self, key, ttl):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """Thread-safe in-process LRU cache with per-entry TTL"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_counter(self, key):
+        with self._lock:
+            item = self._counters.get(key)
+            if item is None or item[0] <= time.monotonic():
+                return 0
+            return item[1]
+
+    def incr(self, key, ttl):
+        now = time.monotonic()
+        with self._lock:
+            _, value = self._counters.get(key, (0, 0))
+            self._counters[key] = (now + ttl, value + 1)
+            # Counters only need to outlive the entries that embed them
+            if len(self._counters) > self.max_entries:
+                self._counters = {k: v for k, v in self._counters.items() if v[0] > now}
+            return value + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class NullCache(CacheBackend):
+    """Backend that never stores anything"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def get_counter(self, key):
+        return 0
+
+    def incr(self, key, ttl):
+        return 0
+
+    def clear(self):
+        pass
+
+
+class ResponseCache:
+    """Cache of serialized GET responses with strong ETags
+
+    Entries are keyed on the request path and query arguments. Each cached
+    view declares tags such as ``post:{post_id}``; the current version of
+    every tag is part of the key, so ``invalidate()`` makes exactly the
+    entries carrying that tag unreachable.
+
+    The default backend is per process, so other workers only see an
+    invalidation once their copy expires after ``RESPONSE_CACHE_TTL``. Pass
+    a shared backend to ``init_app`` to invalidate across processes.
+
+    With read replicas, requests that ``replica_router`` keeps on the
+    primary bypass the cache, and a response read from a replica is not
+    stored while one of its tags was invalidated within the last
+    ``REPLICA_STICKY_SECONDS``. The replica may not have the write yet.
+    """
+
+    def __init__(self, app=None, backend=None):
+        self.backend = NullCache()
+        self.ttl = 0
+        self.replica_lag = 0
+        self.enabled = False
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app, backend)
+
+    def init_app(self, app, backend=None):
+        app.config.setdefault('RESPONSE_CACHE_ENABLED', True)
+        app.config.setdefault('RESPONSE_CACHE_TTL', 30)
+        app.config.setdefault('RESPONSE_CACHE_MAX_ENTRIES', 1024)
+
+        self.enabled = app.config['RESPONSE_CACHE_ENABLED']
+        self.ttl = app.config['RESPONSE_CACHE_TTL']
+        if app.config.get('DATABASE_REPLICA_URLS'):
+            self.replica_lag = app.config.get('REPLICA_STICKY_SECONDS', 0)
+        if backend is None:
+            backend = LRUCache(app.config['RESPONSE_CACHE_MAX_ENTRIES'])
+        self.backend = backend
+        app.extensions['response_cache'] = self
+
+    def key_for(self, path, args, tags, view_args):
+        """Cache key of a GET to ``path`` with ``(name, value)`` query ``args``
+
+        ``tags`` are resolved against the view's URL arguments ``view_args``.
+        """
+        args = '&'.join(f'{k}={v}' for k, v in sorted(args))
+        versions = ','.join(str(self.backend.get_counter(f'tag:{tag}'))
+                            for tag in self._resolve_tags(tags, view_args))
+        return f'response:{path}?{args}#{versions}'
+
+    def _resolve_tags(self, tags, kwargs):
+        resolved = []
+        for tag in tags:
+            if callable(tag):
+                resolved.extend(tag(**kwargs))
+            else:
+                resolved.append(tag.format(**kwargs))
+        return resolved
+
+    def lookup(self, key):
+        """Return the entry cached under ``key``, if any, counting the hit or miss"""
+        entry = self.backend.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def store(self, key, body, mimetype):
+        """Cache a response body under ``key`` and return its entry"""
+        entry = {
+            'body': body,
+            'mimetype': mimetype,
+            'etag': hashlib.sha1(body).hexdigest()
+        }
+        self.backend.set(key, entry, self.ttl)
+        return entry
+
+    def invalidate(self, *tags):
+        """Drop every cached response carrying any of ``tags``"""
+        for tag in tags:
+            self.backend.incr(f'tag:{tag}', self.ttl)
+            if self.replica_lag:
+                # Wall-clock time, so a shared backend works across processes
+                self.backend.set(f'invalidated:{tag}', time.time(), self.replica_lag)
+
+    def _replica_may_lag(self, tags, view_args):
+        """Whether this request read a replica that may miss a recent write to ``tags``"""
+        if not self.replica_lag or not g.get('replica_key'):
+            return False
+        now = time.time()
+        for tag in self._resolve_tags(tags, view_args):
+            invalidated_at = self.backend.get(f'invalidated:{tag}')
+            if invalidated_at is not None and now - invalidated_at < self.replica_lag:
+                return True
+        return False
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def cached(self, *tags):
+        """Cache a GET view's successful responses under ``tags``
+
+        Tags are format strings filled from the view's URL arguments,
+        e.g. ``@response_cache.cached('posts', 'post:{post_id}')``, or
+        callables that take those arguments and return a list of tags.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Users who just wrote read the primary; cached pages may predate their write
+                if not self.enabled or g.get('use_primary'):
+                    return view(*args, **kwargs)
+
+                key = self.key_for(request.path, request.args.items(multi=True), tags, kwargs)
+                entry = self.lookup(key)
+
+                if entry is None:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.is_streamed:
+                        return response
+                    if self._replica_may_lag(tags, kwargs):
+                        return response.make_conditional(request)
+                    entry = self.store(key, response.get_data(), response.mimetype)
+                    response.set_etag(entry['etag'])
+                else:
+                    response = make_response(entry['body'], 200)
+                    response.mimetype = entry['mimetype']
+                    response.set_etag(entry['etag'])
+
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+
+response_cache = ResponseCache()
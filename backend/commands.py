@@ -0,0 +1,347 @@
+import time
+import click
+from sqlalchemy import Text, bindparam, cast, func, inspect, select, text
+from sqlalchemy.schema import CreateColumn
+from app import db
+from models import User, Post, Comment, make_excerpt, count_words, keep_updated_at, COMMENT_PATH_WIDTH
+from tasks import tasks
+
+
+def rebuild_comment_counts():
+    """Recompute Post.comments_count for every post in one statement"""
+    counts = select(func.count(Comment.id))\
+        .where(Comment.post_id == Post.id)\
+        .scalar_subquery()
+
+    result = db.session.execute(
+        Post.__table__.update().values(keep_updated_at(Post.__table__)).values(comments_count=counts)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def _path_segment(column):
+    """SQL for ``models.comment_path``'s segment of the id in ``column``"""
+    if db.engine.dialect.name == 'postgresql':
+        return func.lpad(cast(column, Text), COMMENT_PATH_WIDTH, '0', type_=Text) + '/'
+    return func.printf(f'%0{COMMENT_PATH_WIDTH}d/', column, type_=Text)
+
+
+def rebuild_comment_threads():
+    """Fill in the path and depth of comments missing one, then recount replies
+
+    Paths are filled a level at a time, top-level comments first, so the
+    number of statements follows the depth of the deepest thread rather
+    than the number of comments. Returns the number of paths filled in.
+    """
+    comments = Comment.__table__
+    parent = comments.alias('parent')
+    child = comments.alias('child')
+
+    filled = db.session.execute(
+        comments.update()
+        .where(comments.c.path.is_(None), comments.c.parent_id.is_(None))
+        .values(keep_updated_at(comments))
+        .values(path=_path_segment(comments.c.id), depth=0)
+    ).rowcount
+    while True:
+        parent_path = select(parent.c.path).where(parent.c.id == comments.c.parent_id).scalar_subquery()
+        parent_depth = select(parent.c.depth).where(parent.c.id == comments.c.parent_id).scalar_subquery()
+        level = db.session.execute(
+            comments.update()
+            .where(comments.c.path.is_(None), parent_path.is_not(None))
+            .values(keep_updated_at(comments))
+            .values(path=parent_path + _path_segment(comments.c.id), depth=parent_depth + 1)
+        ).rowcount
+        if not level:
+            break
+        filled += level
+
+    replies = select(func.count(child.c.id))\
+        .where(child.c.parent_id == comments.c.id)\
+        .scalar_subquery()
+    db.session.execute(comments.update().values(keep_updated_at(comments)).values(replies_count=replies))
+    db.session.commit()
+    return filled
+
+
+def rebuild_post_excerpts(batch_size=1000):
+    """Recompute stored excerpts and word counts from post content"""
+    result = db.session.execute(
+        select(Post.id, Post.content)
+        .order_by(Post.id)
+        .execution_options(yield_per=batch_size)
+    )
+    update = Post.__table__.update()\
+        .where(Post.__table__.c.id == bindparam('post_id'))\
+        .values(keep_updated_at(Post.__table__))
+
+    total = 0
+    for batch in result.partitions():
+        db.session.execute(update, [
+            {
+                'post_id': row.id,
+                'excerpt': make_excerpt(row.content),
+                'word_count': count_words(row.content)
+            }
+            for row in batch
+        ])
+        total += len(batch)
+    db.session.commit()
+    return total
+
+
+def add_missing_columns():
+    """Add model columns missing from existing tables, and their indexes
+
+    ``create_all`` only creates whole tables, so databases created before
+    a column was added need this. New columns must be nullable or have a
+    server default. Returns the added columns as ``table.column``.
+    """
+    dialect = db.engine.dialect
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    added = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            definition = str(CreateColumn(column).compile(dialect=dialect))
+            for fk in column.foreign_keys:
+                definition += f' REFERENCES {fk.column.table.name} ({fk.column.name})'
+                if fk.ondelete:
+                    definition += f' ON DELETE {fk.ondelete}'
+            db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {definition}'))
+            added.append(f'{table.name}.{column.name}')
+    db.session.commit()
+
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    return added
+
+
+def reset_id_sequences(*tables):
+    """Move PostgreSQL id sequences past rows inserted with explicit ids"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for table in tables:
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"
+        ))
+    db.session.commit()
+
+
+@tasks.task
+def purge_post(post_id, batch_size=1000):
+    """Delete a post's comments in batches, then the post itself
+
+    Each batch commits on its own so no single transaction holds locks on
+    a whole large thread.
+    """
+    comments = Comment.__table__
+    while True:
+        batch = select(comments.c.id)\
+            .where(comments.c.post_id == post_id)\
+            .limit(batch_size)\
+            .scalar_subquery()
+        result = db.session.execute(comments.delete().where(comments.c.id.in_(batch)))
+        db.session.commit()
+        if result.rowcount < batch_size:
+            break
+
+    db.session.execute(Post.__table__.delete().where(Post.__table__.c.id == post_id))
+    db.session.commit()
+
+
+def register_commands(app):
+    """Register management commands on the Flask CLI"""
+
+    @app.cli.command('init-db')
+    def init_db():
+        """Create missing tables and search indexes; run once per deploy"""
+        existing = set(inspect(db.engine).get_table_names())
+        db.create_all(bind_key=None)
+        created = sorted(set(inspect(db.engine).get_table_names()) - existing)
+        click.echo(f'Created tables: {", ".join(created)}' if created else 'All tables already exist')
+
+    @app.cli.command('upgrade-db')
+    def upgrade_db():
+        """Bring a database created by an older release up to date
+
+        Creates missing tables, adds missing columns and indexes, then
+        fills the added columns from existing rows.
+        """
+        from search import rebuild_index
+
+        existing = set(inspect(db.engine).get_table_names())
+        db.create_all(bind_key=None)
+        created = sorted(set(inspect(db.engine).get_table_names()) - existing)
+        added = add_missing_columns()
+        click.echo(f'Created tables: {", ".join(created) or "none"}')
+        click.echo(f'Added columns: {", ".join(added) or "none"}')
+        if not created and not added:
+            return
+
+        click.echo(f'Rebuilt comment counters for {rebuild_comment_counts()} posts')
+        click.echo(f'Filled in thread paths of {rebuild_comment_threads()} comments')
+        click.echo(f'Rebuilt excerpts for {rebuild_post_excerpts()} posts')
+        rebuild_index()
+        click.echo('Rebuilt post search index')
+
+    @app.cli.command('rebuild-counters')
+    def rebuild_counters():
+        """Recompute Post.comments_count from the comments table"""
+        count = rebuild_comment_counts()
+        click.echo(f'Rebuilt comment counters for {count} posts')
+
+    @app.cli.command('rebuild-comment-threads')
+    def rebuild_comment_threads_command():
+        """Fill in reply paths of imported or older comments and recount replies"""
+        count = rebuild_comment_threads()
+        click.echo(f'Filled in thread paths of {count} comments')
+
+    @app.cli.command('rebuild-excerpts')
+    @click.option('--batch-size', default=1000, show_default=True)
+    def rebuild_excerpts(batch_size):
+        """Recompute stored excerpts and word counts from post content"""
+        total = rebuild_post_excerpts(batch_size)
+        click.echo(f'Rebuilt excerpts for {total} posts')
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index():
+        """Create the full-text search index if missing and reindex all posts"""
+        from search import rebuild_index
+
+        rebuild_index()
+        click.echo('Rebuilt post search index')
+
+    @app.cli.command('purge-deleted-posts')
+    @click.option('--batch-size', default=1000, show_default=True)
+    def purge_deleted_posts(batch_size):
+        """Finish purging posts marked as deleted, e.g. after a restart"""
+        post_ids = db.session.scalars(
+            select(Post.id).where(Post.deleted_at.is_not(None)).order_by(Post.id)
+        ).all()
+        for post_id in post_ids:
+            purge_post(post_id, batch_size)
+        click.echo(f'Purged {len(post_ids)} posts')
+
+    @app.cli.command('upgrade-foreign-keys')
+    def upgrade_foreign_keys():
+        """Recreate foreign keys created before ON DELETE CASCADE was added"""
+        if db.engine.dialect.name != 'postgresql':
+            raise click.ClickException(
+                'Only PostgreSQL constraints can be altered in place; recreate the database instead'
+            )
+
+        inspector = inspect(db.engine)
+        upgraded = 0
+        for model in (Post, Comment):
+            table = model.__tablename__
+            for fk in inspector.get_foreign_keys(table):
+                if (fk.get('options') or {}).get('ondelete', '').upper() == 'CASCADE':
+                    continue
+                column = fk['constrained_columns'][0]
+                db.session.execute(text(
+                    f'ALTER TABLE {table} DROP CONSTRAINT {fk["name"]}, '
+                    f'ADD CONSTRAINT {fk["name"]} FOREIGN KEY ({column}) '
+                    f'REFERENCES {fk["referred_table"]} (id) ON DELETE CASCADE'
+                ))
+                upgraded += 1
+        db.session.commit()
+        click.echo(f'Upgraded {upgraded} foreign keys')
+
+    @app.cli.command('import')
+    @click.argument('kind', type=click.Choice(['users', 'posts', 'comments']))
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']),
+                  help='Input format (default: from the file extension)')
+    @click.option('--batch-size', default=5000, show_default=True)
+    @click.option('--checkpoint', type=click.Path(dir_okay=False),
+                  help='Checkpoint file (default: PATH.checkpoint)')
+    @click.option('--restart', is_flag=True, help='Ignore an existing checkpoint')
+    @click.option('--no-rebuild', is_flag=True,
+                  help='Skip rebuilding counters, reply paths and the search index, e.g. between files')
+    def import_data(kind, path, fmt, batch_size, checkpoint, restart, no_rebuild):
+        """Bulk import users, posts or comments from NDJSON or CSV"""
+        from importer import run_import, InvalidRecord
+
+        started = time.perf_counter()
+        try:
+            count = run_import(kind, path, fmt, batch_size, checkpoint, restart,
+                               rebuild=not no_rebuild, progress=click.echo)
+        except InvalidRecord as e:
+            raise click.ClickException(str(e))
+
+        elapsed = time.perf_counter() - started
+        click.echo(f'Imported {count} {kind} in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f} rows/s)')
+        if kind == 'users':
+            click.echo('Restart web workers so their nickname index picks up imported users')
+
+    @app.cli.command('export-user')
+    @click.argument('nickname')
+    @click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default='ndjson', show_default=True)
+    @click.option('--include', type=click.Choice(['all', 'posts', 'comments']), default='all', show_default=True)
+    @click.option('--gzip', 'compress', is_flag=True, help='Gzip the output')
+    @click.option('--output', '-o', type=click.File('wb'), default='-', help='Output file (default stdout)')
+    @click.option('--batch-size', default=1000, show_default=True)
+    def export_user(nickname, fmt, include, compress, output, batch_size):
+        """Stream a user's posts and comments to a file"""
+        from export import export_stream, KINDS
+
+        user = User.query.filter_by(nickname=nickname).first()
+        if not user:
+            raise click.ClickException(f'User {nickname} not found')
+
+        kinds = KINDS if include == 'all' else (include,)
+        written = 0
+        for chunk in export_stream(user.id, fmt, kinds, compress, batch_size):
+            output.write(chunk)
+            written += len(chunk)
+
+        click.echo(f'Exported {nickname} ({written} bytes)', err=True)
+
+    @app.cli.command('worker')
+    @click.option('--concurrency', type=int, default=None,
+                  help='Worker threads (default: WORKER_CONCURRENCY)')
+    @click.option('--burst', is_flag=True, help='Exit once no job is due')
+    def worker(concurrency, burst):
+        """Run jobs from the durable job queue until stopped"""
+        import signal
+        import threading
+        from jobs import job_queue
+
+        concurrency = concurrency or app.config['WORKER_CONCURRENCY']
+        stop = threading.Event()
+
+        def request_stop(signum, frame):
+            # Let running jobs finish; unfinished ones would be retried anyway
+            click.echo('Stopping after running jobs finish', err=True)
+            stop.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        requeued = job_queue.requeue_stale()
+        if requeued:
+            click.echo(f'Requeued {requeued} stale jobs', err=True)
+        click.echo(f'Worker running {concurrency} threads', err=True)
+        job_queue.work(app, concurrency, stop, burst)
+
+    @app.cli.command('jobs-status')
+    def jobs_status():
+        """Show job queue depth and recent job latency"""
+        from jobs import job_queue
+
+        stats = job_queue.stats()
+        for status, count in stats['counts'].items():
+            click.echo(f'{status:>8}: {count}')
+        click.echo(f'oldest ready job: {stats["oldest_ready_seconds"]:.1f}s')
+        click.echo(f'last 5 minutes: {stats["recent"]} jobs, '
+                   f'{stats["wait_seconds_avg"]:.2f}s wait, {stats["run_seconds_avg"]:.2f}s run')
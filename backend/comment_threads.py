@@ -0,0 +1,82 @@
+"""Threaded comments stored as materialized paths
+
+Every comment keeps ``path``, the zero-padded ids of its ancestors and
+itself (see ``models.comment_path``), and its ``depth``. A post's whole
+thread, or the subtree under one comment, is then a contiguous range of
+paths, so the ``(post_id, path, depth)`` index returns it depth-first in
+one range scan, without a query per level or per comment.
+"""
+import base64
+import re
+from models import Comment, COMMENT_PATH_WIDTH, subtree_bounds
+from pagination import InvalidCursor
+from queries import comment_rows_select
+from serializers import serialize_comment_row
+
+PATH_PATTERN = re.compile(rf'(\d{{{COMMENT_PATH_WIDTH}}}/)+')
+
+
+def encode_path_cursor(path):
+    """Encode the path of the last comment on a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(path.encode()).decode().rstrip('=')
+
+
+def decode_path_cursor(cursor):
+    try:
+        path = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+    if not PATH_PATTERN.fullmatch(path):
+        raise InvalidCursor(cursor)
+    return path
+
+
+def tree_select(post_id, depth, root=None, cursor=None, per_page=100):
+    """Select one page of a post's comments in depth-first order
+
+    Only ``depth`` levels are included, counted from the top-level
+    comments, or from the replies of ``root`` (a comment on the post) when
+    given. The page continues after ``cursor`` and holds up to
+    ``per_page`` comments; one extra row tells ``tree_page`` whether more
+    follow.
+    """
+    low, high = subtree_bounds(root.path) if root is not None else ('', None)
+    first_depth = root.depth + 1 if root is not None else 0
+    if cursor:
+        low = max(low, decode_path_cursor(cursor))
+
+    query = comment_rows_select()\
+        .add_columns(Comment.path)\
+        .where(Comment.post_id == post_id,
+               Comment.path > low,
+               Comment.depth < first_depth + depth)
+    if high is not None:
+        query = query.where(Comment.path < high)
+    return query.order_by(Comment.path).limit(per_page + 1)
+
+
+def tree_page(rows, per_page):
+    """Nest rows fetched by ``tree_select`` and build the pagination fields
+
+    Each comment gets the ``replies`` fetched with it; fewer than its
+    ``replies_count`` means the depth limit cut the rest off. A reply whose
+    parent was on an earlier page starts a tree of its own, so clients
+    attach it by ``parent_id``.
+    """
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+
+    authors = {}
+    nodes = {}
+    trees = []
+    for row in rows:
+        node = nodes[row.id] = {**serialize_comment_row(row, authors), 'replies': []}
+        parent = nodes.get(row.parent_id)
+        (parent['replies'] if parent is not None else trees).append(node)
+
+    return trees, {
+        'per_page': per_page,
+        'has_next': has_next,
+        'next_cursor': encode_path_cursor(rows[-1].path) if has_next and rows else None
+    }
+
@@ -0,0 +1,175 @@
+"""Home timelines built by fan-out on write
+
+When a post is created, its id is pushed into the timeline of every
+follower of its author with a single ``INSERT ... SELECT``, off the
+request path. Reading a feed is then a keyset scan of one user's
+``timeline_entries``, however many authors they follow.
+
+Authors with at least ``FEED_FANOUT_MAX_FOLLOWERS`` followers are not
+fanned out; their recent posts are pulled at read time and merged in.
+Timelines keep roughly the newest ``FEED_TIMELINE_SIZE`` entries.
+Deleted posts drop out through ``ON DELETE CASCADE``.
+"""
+import random
+from flask import current_app
+from sqlalchemy import and_, exists, func, literal, select, tuple_
+from app import db
+from models import User, Post, Follow, TimelineEntry
+from pagination import encode_cursor, decode_cursor, InvalidCursor
+from queries import post_rows_query
+from tasks import tasks
+
+entries = TimelineEntry.__table__
+
+
+def _fanout_limit():
+    return current_app.config['FEED_FANOUT_MAX_FOLLOWERS']
+
+
+def _timeline_size():
+    return current_app.config['FEED_TIMELINE_SIZE']
+
+
+def is_pulled(user):
+    """Whether ``user``'s posts are merged in at read time instead of pushed"""
+    return user.followers_count >= _fanout_limit()
+
+
+def _not_in_timeline(user_id_column, post_id_column):
+    return ~exists().where(and_(entries.c.user_id == user_id_column,
+                                entries.c.post_id == post_id_column))
+
+
+@tasks.task
+def fan_out_post(post_id):
+    """Push a new post into its author's and followers' timelines"""
+    post = db.session.get(Post, post_id)
+    if post is None or post.is_deleted:
+        return
+
+    # The author always sees their own posts
+    db.session.execute(entries.insert().from_select(
+        ['user_id', 'post_id', 'created_at'],
+        select(literal(post.author_id), literal(post.id), literal(post.created_at))
+        .where(_not_in_timeline(post.author_id, post.id))
+    ))
+
+    follower_ids = []
+    if not is_pulled(post.author):
+        db.session.execute(entries.insert().from_select(
+            ['user_id', 'post_id', 'created_at'],
+            select(Follow.follower_id, literal(post.id), literal(post.created_at))
+            .where(Follow.followee_id == post.author_id,
+                   _not_in_timeline(Follow.follower_id, post.id))
+        ))
+        # Trimming costs a scan per timeline, so only every tenth of a
+        # timeline's worth of posts does it; timelines overshoot by ~10%
+        if random.random() < 10 / _timeline_size():
+            follower_ids = db.session.scalars(
+                select(Follow.follower_id).where(Follow.followee_id == post.author_id)
+            ).all()
+
+    db.session.commit()
+    if follower_ids:
+        trim_timelines(follower_ids + [post.author_id])
+
+
+def trim_timelines(user_ids, batch_size=500):
+    """Drop entries beyond ``FEED_TIMELINE_SIZE`` from the given timelines"""
+    size = _timeline_size()
+    for start in range(0, len(user_ids), batch_size):
+        ranked = select(
+            entries.c.user_id, entries.c.post_id,
+            func.row_number().over(
+                partition_by=entries.c.user_id,
+                order_by=(entries.c.created_at.desc(), entries.c.post_id.desc())
+            ).label('position')
+        ).where(entries.c.user_id.in_(user_ids[start:start + batch_size])).subquery()
+
+        db.session.execute(entries.delete().where(
+            tuple_(entries.c.user_id, entries.c.post_id).in_(
+                select(ranked.c.user_id, ranked.c.post_id).where(ranked.c.position > size)
+            )
+        ))
+        db.session.commit()
+
+
+@tasks.task
+def backfill_timeline(follower_id, followee_id):
+    """Copy a newly followed author's recent posts into the follower's timeline"""
+    followee = db.session.get(User, followee_id)
+    if followee is None or is_pulled(followee):
+        return
+
+    recent = select(Post.id, Post.created_at)\
+        .where(Post.author_id == followee_id, Post.deleted_at.is_(None))\
+        .order_by(Post.created_at.desc(), Post.id.desc())\
+        .limit(max(_timeline_size() // 10, 1))\
+        .subquery()
+
+    db.session.execute(entries.insert().from_select(
+        ['user_id', 'post_id', 'created_at'],
+        select(literal(follower_id), recent.c.id, recent.c.created_at)
+        .where(_not_in_timeline(follower_id, recent.c.id))
+    ))
+    db.session.commit()
+
+
+@tasks.task
+def remove_from_timeline(follower_id, followee_id):
+    """Remove an unfollowed author's posts from the follower's timeline"""
+    db.session.execute(entries.delete().where(
+        entries.c.user_id == follower_id,
+        entries.c.post_id.in_(select(Post.id).where(Post.author_id == followee_id))
+    ))
+    db.session.commit()
+
+
+def feed_page(user_id, cursor, per_page):
+    """One page of a user's home timeline, newest first
+
+    Returns ``(rows, meta)`` with rows from ``queries.post_rows_query``.
+    Feeds only page forwards, with ``next_cursor``.
+    """
+    position = None
+    if cursor:
+        created_at, post_id, direction = decode_cursor(cursor)
+        if direction != 'next':
+            raise InvalidCursor(cursor)
+        position = (created_at, post_id)
+
+    # Pushed entries
+    pushed = select(entries.c.created_at, entries.c.post_id)\
+        .where(entries.c.user_id == user_id)
+    if position:
+        pushed = pushed.where(tuple_(entries.c.created_at, entries.c.post_id) < tuple_(*position))
+    candidates = db.session.execute(
+        pushed.order_by(entries.c.created_at.desc(), entries.c.post_id.desc()).limit(per_page + 1)
+    ).all()
+
+    # Pulled posts from authors too widely followed to fan out
+    pulled_authors = select(Follow.followee_id)\
+        .join(User, User.id == Follow.followee_id)\
+        .where(Follow.follower_id == user_id, User.followers_count >= _fanout_limit())
+    pulled = select(Post.created_at, Post.id)\
+        .where(Post.author_id.in_(pulled_authors), Post.deleted_at.is_(None))
+    if position:
+        pulled = pulled.where(tuple_(Post.created_at, Post.id) < tuple_(*position))
+    candidates += db.session.execute(
+        pulled.order_by(Post.created_at.desc(), Post.id.desc()).limit(per_page + 1)
+    ).all()
+
+    keys = sorted(set(map(tuple, candidates)), reverse=True)[:per_page + 1]
+    has_next = len(keys) > per_page
+    keys = keys[:per_page]
+
+    rows = {
+        row.id: row
+        for row in post_rows_query().filter(Post.id.in_([post_id for _, post_id in keys]))
+    } if keys else {}
+
+    return [rows[post_id] for _, post_id in keys if post_id in rows], {
+        'per_page': per_page,
+        'has_next': has_next,
+        'next_cursor': encode_cursor(*keys[-1], 'next') if has_next else None
+    }
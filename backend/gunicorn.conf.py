@@ -0,0 +1,50 @@
+"""Production server settings
+
+    flask init-db                 # once per deploy, creates missing tables
+    gunicorn -c gunicorn.conf.py
+
+The app is imported once in the master (``preload_app``) and forked into
+one worker per available core, so imports and startup work are shared
+copy-on-write. Each worker serves requests on ``GUNICORN_THREADS``
+threads. An open comment stream holds one of them for up to
+``COMMENT_STREAM_TIMEOUT`` seconds (without a database connection), so
+the default leaves room for a few dozen listeners per worker; raise it
+with the number of expected listeners. Pooled database connections are
+never shared across the fork: workers drop the ones inherited from the
+master before serving.
+
+Unless ``PASSWORD_HASH_WORKERS`` is set, the cores are split between the
+workers' password hashing pools rather than each worker starting one
+process per core.
+"""
+import os
+
+from app import dispose_engines
+
+
+def _available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover - not on Linux
+        return os.cpu_count() or 1
+
+
+wsgi_app = 'wsgi:app'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', 0)) or _available_cores()
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 32))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = timeout
+# Recycle workers now and then; jitter keeps them from restarting together
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+if not os.getenv('PASSWORD_HASH_WORKERS'):
+    os.environ['PASSWORD_HASH_WORKERS'] = str(max(_available_cores() // workers, 1))
+
+
+def post_fork(server, worker):
+    if preload_app:
+        dispose_engines(server.app.wsgi())
@@ -0,0 +1,300 @@
+"""Bulk import users, posts and comments from NDJSON or CSV
+
+Records are read in batches and written with ``COPY`` on PostgreSQL or a
+single executemany per batch elsewhere, one transaction per batch. After
+every committed batch the number of records consumed is written to a
+checkpoint file, so a failed import resumes where it stopped.
+
+Expected fields, besides an optional ``id`` and ``created_at``/``updated_at``:
+
+* users: ``nickname``, ``email`` and either ``password`` (hashed here on
+  the password pool) or an existing bcrypt/werkzeug ``password_hash``
+* posts: ``title``, ``content``, ``author_id``
+* comments: ``content``, ``post_id``, ``author_id`` and, for replies,
+  ``parent_id``
+
+Derived columns (excerpts, word counts) are computed per row; comment
+counters, reply paths and the SQLite search index are rebuilt once at
+the end.
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import time
+from datetime import datetime
+from sqlalchemy import text
+from app import db
+from models import User, Post, Comment, make_excerpt, count_words
+from passwords import password_hasher
+
+TABLES = {
+    'users': User.__table__,
+    'posts': Post.__table__,
+    'comments': Comment.__table__,
+}
+
+REQUIRED_FIELDS = {
+    'users': ('nickname', 'email'),
+    'posts': ('title', 'content', 'author_id'),
+    'comments': ('content', 'post_id', 'author_id'),
+}
+
+
+class InvalidRecord(ValueError):
+    """Raised for input that cannot be imported"""
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    raise InvalidRecord(f'Cannot tell the format of {path}, pass --format')
+
+
+def read_records(path, fmt):
+    """Yield input records as dicts, one per line or CSV row"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _datetime(value):
+    if value in (None, ''):
+        return None
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def _base_row(record, now):
+    row = {}
+    if record.get('id') not in (None, ''):
+        row['id'] = int(record['id'])
+    created_at = _datetime(record.get('created_at')) or now
+    row['created_at'] = created_at
+    row['updated_at'] = _datetime(record.get('updated_at')) or created_at
+    return row
+
+
+def prepare_users(records, now):
+    rows = []
+    passwords = []
+    for record in records:
+        row = _base_row(record, now)
+        row['nickname'] = record['nickname'].strip()
+        # Normalized like signup, which login relies on
+        row['email'] = record['email'].strip().lower()
+        row['password_hash'] = record.get('password_hash') or None
+        if row['password_hash'] is None:
+            passwords.append((len(rows), record['password']))
+        rows.append(row)
+
+    if passwords:
+        hashes = password_hasher.hash_many([password for _, password in passwords])
+        for (index, _), password_hash in zip(passwords, hashes):
+            rows[index]['password_hash'] = password_hash
+    return rows
+
+
+def prepare_posts(records, now):
+    rows = []
+    for record in records:
+        row = _base_row(record, now)
+        content = record['content']
+        row.update({
+            'title': record['title'],
+            'content': content,
+            'author_id': int(record['author_id']),
+            'comments_count': 0,
+            'excerpt': make_excerpt(content),
+            'word_count': count_words(content),
+        })
+        rows.append(row)
+    return rows
+
+
+def prepare_comments(records, now):
+    rows = []
+    for record in records:
+        row = _base_row(record, now)
+        row.update({
+            'content': record['content'],
+            'post_id': int(record['post_id']),
+            'author_id': int(record['author_id']),
+            'parent_id': int(record['parent_id']) if record.get('parent_id') not in (None, '') else None,
+            'depth': 0,
+            'replies_count': 0,
+        })
+        rows.append(row)
+    return rows
+
+
+PREPARERS = {
+    'users': prepare_users,
+    'posts': prepare_posts,
+    'comments': prepare_comments,
+}
+
+
+def _copy(table, rows):
+    """Load rows with PostgreSQL COPY over the session's connection"""
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    # Non-numeric values are quoted, so '' stays an empty string and only
+    # None becomes an unquoted, NULL field
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    for row in rows:
+        writer.writerow([row[name] for name in columns])
+    buffer.seek(0)
+
+    connection = db.session.connection().connection.dbapi_connection
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {table.name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)',
+            buffer
+        )
+
+
+def write_batch(table, rows, use_copy):
+    keys = rows[0].keys()
+    if any(row.keys() != keys for row in rows):
+        raise InvalidRecord('every record in a batch must have the same fields (id set on all or none)')
+
+    if use_copy:
+        _copy(table, rows)
+    else:
+        db.session.execute(table.insert(), rows)
+    db.session.commit()
+
+
+class Checkpoint:
+    """Number of input records already committed, kept in a small JSON file"""
+
+    def __init__(self, path, kind, source):
+        self.path = path
+        self.kind = kind
+        self.source = os.path.abspath(source)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path) as f:
+            state = json.load(f)
+        if state.get('kind') != self.kind or state.get('source') != self.source:
+            raise InvalidRecord(f'Checkpoint {self.path} belongs to another import')
+        return state['records']
+
+    def save(self, records):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'kind': self.kind, 'source': self.source, 'records': records}, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _drop_search_triggers():
+    db.session.execute(text('DROP TRIGGER IF EXISTS posts_fts_insert'))
+    db.session.commit()
+
+
+def _restore_search_triggers():
+    from search import SQLITE_DDL
+
+    for statement in SQLITE_DDL:
+        db.session.execute(text(statement))
+    db.session.commit()
+
+
+def run_import(kind, path, fmt=None, batch_size=5000, checkpoint_path=None,
+               restart=False, rebuild=True, progress=print):
+    """Import ``path`` into the ``kind`` table; returns the number of rows written"""
+    from commands import rebuild_comment_counts, rebuild_comment_threads, reset_id_sequences
+
+    fmt = fmt or detect_format(path)
+    table = TABLES[kind]
+    prepare = PREPARERS[kind]
+    required = REQUIRED_FIELDS[kind]
+    dialect = db.engine.dialect.name
+    use_copy = dialect == 'postgresql'
+
+    checkpoint = Checkpoint(checkpoint_path or f'{path}.checkpoint', kind, path)
+    if restart:
+        checkpoint.clear()
+    skip = checkpoint.load()
+    if skip:
+        progress(f'Resuming after {skip} records')
+
+    # On SQLite each inserted post would update the FTS index row by row;
+    # drop the trigger and rebuild the index once at the end instead
+    defer_search = kind == 'posts' and dialect == 'sqlite'
+    if defer_search:
+        _drop_search_triggers()
+
+    started = time.perf_counter()
+    consumed = skip
+    written = 0
+    batch = []
+
+    def flush():
+        nonlocal consumed, written
+        rows = prepare(batch, datetime.utcnow())
+        write_batch(table, rows, use_copy)
+        consumed += len(batch)
+        written += len(rows)
+        checkpoint.save(consumed)
+        rate = written / max(time.perf_counter() - started, 1e-9)
+        progress(f'{kind}: {consumed} records ({rate:,.0f} rows/s)')
+        batch.clear()
+
+    try:
+        for number, record in enumerate(read_records(path, fmt), start=1):
+            if number <= skip:
+                continue
+            missing = [name for name in required if record.get(name) in (None, '')]
+            if missing:
+                raise InvalidRecord(f'record {number}: missing {", ".join(missing)}')
+            if kind == 'users' and not (record.get('password') or record.get('password_hash')):
+                raise InvalidRecord(f'record {number}: needs a password or password_hash')
+            batch.append(record)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    except Exception:
+        db.session.rollback()
+        if defer_search:
+            _restore_search_triggers()
+            progress('Import failed; resume it or run `flask rebuild-search-index`')
+        raise
+
+    if use_copy:
+        reset_id_sequences(table.name)
+
+    if rebuild:
+        if kind in ('posts', 'comments'):
+            progress(f'Rebuilt comment counters for {rebuild_comment_counts()} posts')
+        if kind == 'comments':
+            progress(f'Filled in thread paths of {rebuild_comment_threads()} comments')
+        if defer_search:
+            from search import rebuild_index
+
+            rebuild_index()
+            progress('Rebuilt post search index')
+    elif defer_search:
+        _restore_search_triggers()
+        progress('Search index not rebuilt; run `flask rebuild-search-index`')
+
+    checkpoint.clear()
+    return written
@@ -0,0 +1,238 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from flask import g, request, has_request_context, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+slow_query_log = logging.getLogger('blog.sql.slow')
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class QueryStats:
+    """SQL statement count and time of one request served outside Flask"""
+
+    __slots__ = ('statements', 'time')
+
+    def __init__(self):
+        self.statements = 0
+        self.time = 0.0
+
+
+# Set by the ASGI read path (``asgi.py``), which has no ``g`` to count into
+current_query_stats = contextvars.ContextVar('current_query_stats', default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_start_time'].pop()
+    instrumentation.record_query(statement, duration)
+
+
+class RouteStats:
+    """Request count, totals and a sliding window of latencies for one route"""
+
+    def __init__(self, window):
+        self.count = 0
+        self.duration_sum = 0.0
+        self.db_time_sum = 0.0
+        self.statements_sum = 0
+        self.durations = deque(maxlen=window)
+
+    def add(self, duration, db_time, statements):
+        self.count += 1
+        self.duration_sum += duration
+        self.db_time_sum += db_time
+        self.statements_sum += statements
+        self.durations.append(duration)
+
+    def quantiles(self):
+        ordered = sorted(self.durations)
+        if not ordered:
+            return {}
+        return {q: ordered[min(int(q * len(ordered)), len(ordered) - 1)] for q in QUANTILES}
+
+
+class Instrumentation:
+    """Per-request SQL and serialization timing with a Prometheus endpoint
+
+    Every request gets a ``Server-Timing`` header with its statement count,
+    database time and JSON serialization time. Latencies are aggregated per
+    route and exposed with p50/p95/p99 at ``/metrics``. Statements slower
+    than ``SLOW_QUERY_THRESHOLD_MS`` are logged to ``blog.sql.slow``.
+    """
+
+    def __init__(self, app=None):
+        self.slow_query_threshold = 0.2
+        self.window = 1024
+        self._routes = defaultdict(lambda: RouteStats(self.window))
+        self._statuses = defaultdict(int)
+        self._collectors = []
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_WINDOW', 1024)
+        app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', 200)
+
+        self.slow_query_threshold = app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000
+        self.window = app.config['METRICS_WINDOW']
+
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+        # Time JSON encoding by wrapping whichever provider the app uses
+        dumps = app.json.dumps
+
+        def timed_dumps(obj, **kwargs):
+            started = time.perf_counter()
+            try:
+                return dumps(obj, **kwargs)
+            finally:
+                if has_request_context() and 'request_started' in g:
+                    g.serialize_time += time.perf_counter() - started
+
+        app.json.dumps = timed_dumps
+
+        if app.config['METRICS_ENABLED']:
+            app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+        app.extensions['instrumentation'] = self
+
+    def register_collector(self, collector):
+        """Add a callable returning extra Prometheus exposition lines"""
+        self._collectors.append(collector)
+
+    def record_query(self, statement, duration):
+        if has_request_context() and 'request_started' in g:
+            g.sql_statements += 1
+            g.sql_time += duration
+        else:
+            stats = current_query_stats.get()
+            if stats is not None:
+                stats.statements += 1
+                stats.time += duration
+
+        if duration >= self.slow_query_threshold:
+            route = request.path if has_request_context() else '-'
+            slow_query_log.warning('slow query (%.1f ms) on %s: %s',
+                                   duration * 1000, route, ' '.join(statement.split())[:500])
+
+    def _start_request(self):
+        g.request_started = time.perf_counter()
+        g.sql_statements = 0
+        g.sql_time = 0.0
+        g.serialize_time = 0.0
+
+    def _finish_request(self, response):
+        if 'request_started' not in g:
+            return response
+
+        duration = time.perf_counter() - g.request_started
+        response.headers['Server-Timing'] = server_timing(
+            g.sql_statements, g.sql_time, g.serialize_time, duration
+        )
+
+        rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        self.record_request(request.method, rule, response.status_code,
+                            duration, g.sql_time, g.sql_statements)
+
+        return response
+
+    def record_request(self, method, rule, status, duration, db_time, statements):
+        """Add a finished request to the per-route metrics"""
+        with self._lock:
+            self._routes[(method, rule)].add(duration, db_time, statements)
+            self._statuses[(method, rule, status)] += 1
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._statuses.clear()
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            routes = [(key, stats.count, stats.duration_sum, stats.db_time_sum,
+                       stats.statements_sum, stats.quantiles())
+                      for key, stats in self._routes.items()]
+            statuses = list(self._statuses.items())
+
+        lines = [
+            '# HELP http_requests_total Requests handled, by route and status.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (method, rule, status), count in sorted(statuses):
+            lines.append(f'http_requests_total{{method="{method}",route="{rule}",status="{status}"}} {count}')
+
+        lines += [
+            '# HELP http_request_duration_seconds Request latency over a recent window.',
+            '# TYPE http_request_duration_seconds summary',
+        ]
+        for (method, rule), count, duration_sum, _, _, quantiles in sorted(routes):
+            labels = f'method="{method}",route="{rule}"'
+            for q, value in quantiles.items():
+                lines.append(f'http_request_duration_seconds{{{labels},quantile="{q}"}} {value:.6f}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {duration_sum:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {count}')
+
+        lines += [
+            '# HELP http_request_db_seconds_total Time spent in SQL statements.',
+            '# TYPE http_request_db_seconds_total counter',
+        ]
+        for (method, rule), _, _, db_time_sum, _, _ in sorted(routes):
+            lines.append(f'http_request_db_seconds_total{{method="{method}",route="{rule}"}} {db_time_sum:.6f}')
+
+        lines += [
+            '# HELP http_request_sql_statements_total SQL statements executed.',
+            '# TYPE http_request_sql_statements_total counter',
+        ]
+        for (method, rule), _, _, _, statements_sum, _ in sorted(routes):
+            lines.append(f'http_request_sql_statements_total{{method="{method}",route="{rule}"}} {statements_sum}')
+
+        for collector in self._collectors:
+            lines.extend(collector())
+
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def server_timing(statements, db_time, serialize_time, duration):
+    """Format a ``Server-Timing`` header value"""
+    return ', '.join([
+        f'db;desc="{statements} queries";dur={db_time * 1000:.2f}',
+        f'serialize;dur={serialize_time * 1000:.2f}',
+        f'total;dur={duration * 1000:.2f}',
+    ])
+
+
+def cache_collector(name, cache):
+    """Expose a cache's ``stats()`` hit/miss counters as Prometheus counters"""
+    def collect():
+        stats = cache.stats()
+        return [
+            f'# HELP {name}_hits_total {name} lookups served from cache.',
+            f'# TYPE {name}_hits_total counter',
+            f'{name}_hits_total {stats["hits"]}',
+            f'# HELP {name}_misses_total {name} lookups that missed.',
+            f'# TYPE {name}_misses_total counter',
+            f'{name}_misses_total {stats["misses"]}',
+        ]
+    return collect
+
+
+instrumentation = Instrumentation()
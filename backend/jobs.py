@@ -0,0 +1,277 @@
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+
+log = logging.getLogger('blog.jobs')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobQueue:
+    """Durable job queue stored in the ``jobs`` table
+
+    ``enqueue`` records a call to a function registered with
+    ``tasks.task``; ``flask worker`` processes claim and run queued jobs.
+    Failed jobs are retried up to ``JOB_MAX_ATTEMPTS`` times with
+    exponential backoff starting at ``JOB_BACKOFF_SECONDS``. Jobs running
+    longer than ``JOB_TIMEOUT`` seconds are assumed lost with their worker
+    and queued again, so job functions must be safe to run twice. An
+    idempotency key makes a second ``enqueue`` with the same key a no-op
+    for as long as the first job's row is kept (``JOB_RETENTION_HOURS``).
+    """
+
+    def __init__(self, app=None):
+        self.max_attempts = 5
+        self.backoff = 10
+        self.timeout = 600
+        self.poll_interval = 1.0
+        self.retention = timedelta(hours=24)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOB_MAX_ATTEMPTS', 5)
+        app.config.setdefault('JOB_BACKOFF_SECONDS', 10)
+        app.config.setdefault('JOB_TIMEOUT', 600)
+        app.config.setdefault('JOB_POLL_INTERVAL', 1.0)
+        app.config.setdefault('JOB_RETENTION_HOURS', 24)
+
+        self.max_attempts = app.config['JOB_MAX_ATTEMPTS']
+        self.backoff = app.config['JOB_BACKOFF_SECONDS']
+        self.timeout = app.config['JOB_TIMEOUT']
+        self.poll_interval = app.config['JOB_POLL_INTERVAL']
+        self.retention = timedelta(hours=app.config['JOB_RETENTION_HOURS'])
+        app.extensions['jobs'] = self
+
+    def enqueue(self, name, args=(), key=None, delay=0, max_attempts=None):
+        """Queue a call of the task ``name`` and commit; returns the job id"""
+        from models import Job
+
+        job = Job(
+            name=name,
+            args=list(args),
+            idempotency_key=key,
+            max_attempts=max_attempts or self.max_attempts,
+            run_at=datetime.utcnow() + timedelta(seconds=delay)
+        )
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            if key is None:
+                raise
+            return db.session.scalar(select(Job.id).where(Job.idempotency_key == key))
+        return job.id
+
+    def claim(self, worker_id):
+        """Mark the next due job as running by ``worker_id``; returns it or None"""
+        from models import Job
+
+        now = datetime.utcnow()
+        candidates = select(Job.id)\
+            .where(Job.status == QUEUED, Job.run_at <= now)\
+            .order_by(Job.run_at, Job.id)\
+            .limit(5)
+        if db.engine.dialect.name == 'postgresql':
+            candidates = candidates.with_for_update(skip_locked=True)
+
+        for job_id in db.session.scalars(candidates).all():
+            # Another worker may win the race for the same row
+            claimed = db.session.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == QUEUED)
+                .values(status=RUNNING, locked_by=worker_id, started_at=now,
+                        attempts=Job.attempts + 1)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if claimed:
+                db.session.commit()
+                return db.session.get(Job, job_id)
+        db.session.commit()
+        return None
+
+    def run(self, job):
+        """Run a claimed job and record its outcome"""
+        from tasks import tasks
+
+        try:
+            fn = tasks.registry[job.name]
+            fn(*job.args)
+        except Exception:
+            db.session.rollback()
+            error = traceback.format_exc(limit=5)
+            log.warning('job %s (%s) failed on attempt %s', job.id, job.name, job.attempts)
+            self._finish(job, error)
+        else:
+            self._finish(job)
+
+    def _finish(self, job, error=None):
+        from models import Job
+
+        job = db.session.get(Job, job.id)
+        now = datetime.utcnow()
+        if error is None:
+            job.status = DONE
+            job.last_error = None
+        elif job.attempts < job.max_attempts:
+            job.status = QUEUED
+            job.last_error = error
+            delay = self.backoff * 2 ** (job.attempts - 1)
+            job.run_at = now + timedelta(seconds=delay * random.uniform(1, 1.5))
+        else:
+            job.status = FAILED
+            job.last_error = error
+        job.finished_at = now
+        job.locked_by = None
+        db.session.commit()
+
+    def requeue_stale(self):
+        """Queue again jobs whose worker stopped without finishing them
+
+        A timeout counts as a failed attempt, so jobs that already used all
+        their attempts are marked failed instead. Returns the number queued.
+        """
+        from models import Job
+
+        now = datetime.utcnow()
+        stale = (Job.status == RUNNING, Job.started_at < now - timedelta(seconds=self.timeout))
+        failed = db.session.execute(
+            update(Job)
+            .where(*stale, Job.attempts >= Job.max_attempts)
+            .values(status=FAILED, locked_by=None, last_error='timed out', finished_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        count = db.session.execute(
+            update(Job)
+            .where(*stale)
+            .values(status=QUEUED, locked_by=None, last_error='timed out')
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if failed:
+            log.warning('%s stale jobs timed out on their last attempt', failed)
+        return count
+
+    def prune(self):
+        """Delete finished jobs older than the retention period"""
+        from models import Job
+
+        cutoff = datetime.utcnow() - self.retention
+        count = db.session.execute(
+            Job.__table__.delete().where(Job.status == DONE, Job.finished_at < cutoff)
+        ).rowcount
+        db.session.commit()
+        return count
+
+    def work(self, app, concurrency=1, stop=None, burst=False):
+        """Run jobs on ``concurrency`` threads until ``stop`` is set
+
+        With ``burst`` the workers exit once no job is due.
+        """
+        stop = stop or threading.Event()
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+
+        def loop(index):
+            worker_id = f'{prefix}:{index}'
+            while not stop.is_set():
+                with app.app_context():
+                    try:
+                        job = self.claim(worker_id)
+                        if job is not None:
+                            self.run(job)
+                            continue
+                    except Exception:
+                        log.exception('worker %s failed to claim or run a job', worker_id)
+                        db.session.rollback()
+                if burst:
+                    return
+                stop.wait(self.poll_interval)
+
+        def housekeeping():
+            while not stop.wait(60):
+                with app.app_context():
+                    try:
+                        self.requeue_stale()
+                        self.prune()
+                    except Exception:
+                        log.exception('job housekeeping failed')
+
+        threads = [threading.Thread(target=loop, args=(i,), name=f'worker-{i}')
+                   for i in range(concurrency)]
+        if not burst:
+            threads.append(threading.Thread(target=housekeeping, name='worker-housekeeping', daemon=True))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            if not thread.daemon:
+                thread.join()
+
+    def stats(self):
+        """Queue depth by status and latency of recently finished jobs"""
+        from models import Job
+
+        now = datetime.utcnow()
+        counts = dict(db.session.execute(
+            select(Job.status, func.count()).group_by(Job.status)
+        ).all())
+        oldest = db.session.scalar(
+            select(func.min(Job.run_at)).where(Job.status == QUEUED, Job.run_at <= now)
+        )
+        recent = db.session.execute(
+            select(Job.run_at, Job.started_at, Job.finished_at)
+            .where(Job.status == DONE, Job.finished_at >= now - timedelta(minutes=5))
+            .order_by(Job.finished_at.desc())
+            .limit(1000)
+        ).all()
+
+        waits = [(started - run_at).total_seconds() for run_at, started, _ in recent]
+        runs = [(finished - started).total_seconds() for _, started, finished in recent]
+        return {
+            'counts': {status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)},
+            'oldest_ready_seconds': (now - oldest).total_seconds() if oldest else 0.0,
+            'recent': len(recent),
+            'wait_seconds_avg': sum(waits) / len(waits) if waits else 0.0,
+            'run_seconds_avg': sum(runs) / len(runs) if runs else 0.0,
+        }
+
+
+def jobs_collector(queue):
+    """Expose queue depth and job latency as Prometheus gauges"""
+    def collect():
+        try:
+            stats = queue.stats()
+        except Exception:
+            db.session.rollback()
+            return []
+        lines = [
+            '# HELP jobs Jobs in the durable queue, by status.',
+            '# TYPE jobs gauge',
+        ]
+        lines += [f'jobs{{status="{status}"}} {count}' for status, count in stats['counts'].items()]
+        lines += [
+            '# HELP jobs_oldest_ready_seconds Age of the oldest job waiting to run.',
+            '# TYPE jobs_oldest_ready_seconds gauge',
+            f'jobs_oldest_ready_seconds {stats["oldest_ready_seconds"]:.3f}',
+            '# HELP jobs_wait_seconds Average time from due to started, last 5 minutes.',
+            '# TYPE jobs_wait_seconds gauge',
+            f'jobs_wait_seconds {stats["wait_seconds_avg"]:.3f}',
+            '# HELP jobs_run_seconds Average job run time, last 5 minutes.',
+            '# TYPE jobs_run_seconds gauge',
+            f'jobs_run_seconds {stats["run_seconds_avg"]:.3f}',
+        ]
+        return lines
+    return collect
+
+
+job_queue = JobQueue()
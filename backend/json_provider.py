@@ -0,0 +1,57 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that encodes with orjson when it is installed
+
+    Produces the same bytes as the default provider for the same
+    separators (``dumps`` without any is compact, as responses are outside
+    debug mode, rather than spaced like the stdlib's): keys are sorted, dates
+    still go through ``default`` (HTTP date format), and when
+    ``ensure_ascii`` is on, output containing non-ASCII text is re-encoded
+    with the stdlib so it keeps its ``\\uXXXX`` escapes. Anything orjson
+    cannot express (custom separators, other indents, unknown kwargs) also
+    falls back to the stdlib encoder.
+    """
+
+    def _options(self, kwargs):
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+
+        separators = kwargs.pop('separators', (',', ':'))
+        indent = kwargs.pop('indent', None)
+        if kwargs or separators != (',', ':') or indent not in (None, 2):
+            return None
+        if indent == 2:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+
+        options = self._options(dict(kwargs))
+        if options is None:
+            return super().dumps(obj, **kwargs)
+
+        try:
+            data = orjson.dumps(obj, default=self.default, option=options).decode()
+        except TypeError:
+            return super().dumps(obj, **kwargs)
+
+        if self.ensure_ascii and not data.isascii():
+            return super().dumps(obj, **kwargs)
+        return data
+
+
+def init_json_provider(app):
+    """Install the JSON provider named by ``JSON_PROVIDER`` (orjson or stdlib)"""
+    app.config.setdefault('JSON_PROVIDER', 'orjson')
+    if app.config['JSON_PROVIDER'] == 'orjson':
+        app.json = OrjsonProvider(app)
@@ -1,7 +1,60 @@
+import re
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
+from passwords import password_hasher
+from view_counter import view_counter
+
+EXCERPT_LENGTH = 280
+WORDS_PER_MINUTE = 200
+COMMENT_PATH_WIDTH = 10
+
+
+def make_excerpt(content, length=EXCERPT_LENGTH):
+    """Collapse whitespace and cut content at a word boundary"""
+    text = ' '.join(content.split())
+    if len(text) <= length:
+        return text
+    
+    cut = text[:length + 1]
+    if ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut[:length] + '…'
+
+
+def count_words(content):
+    """Count whitespace-separated words"""
+    return len(re.findall(r'\S+', content))
+
+
+def reading_time(word_count):
+    """Estimated minutes to read, at least one"""
+    return max(1, round(word_count / WORDS_PER_MINUTE))
+
+
+def keep_updated_at(table):
+    """Extra values for an UPDATE that must not touch ``updated_at``
+
+    ``updated_at`` records edits by users. Counter, cache and derived
+    column updates are not edits, but the column's ``onupdate`` fires for
+    every UPDATE that does not set it; setting it to itself stops that.
+    """
+    return {table.c.updated_at: table.c.updated_at}
+
+
+def comment_path(comment_id, parent_path=''):
+    """Materialized path of a comment: its ancestors' ids and its own
+
+    Ids are zero-padded to a fixed width, so sorting by path lists a
+    thread depth-first with replies in the order they were written.
+    """
+    return f'{parent_path}{comment_id:0{COMMENT_PATH_WIDTH}d}/'
+
+
+def subtree_bounds(path):
+    """``(low, high)`` such that ``low < p < high`` for every descendant path ``p``"""
+    # '0' sorts right after '/', the last character of every path
+    return path, path[:-1] + '0'
 
 
 class User(db.Model):
@@ -13,18 +66,27 @@ class User(db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    followers_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    following_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
-    posts = db.relationship('Post', backref='author', lazy='dynamic', cascade='all, delete-orphan')
-    comments = db.relationship('Comment', backref='author', lazy='dynamic', cascade='all, delete-orphan')
+    # Children are removed by ON DELETE CASCADE rather than loaded and deleted one by one
+    posts = db.relationship('Post', backref='author', lazy='dynamic',
+                            cascade='all, delete-orphan', passive_deletes=True)
+    comments = db.relationship('Comment', backref='author', lazy='dynamic',
+                               cascade='all, delete-orphan', passive_deletes=True)
     
     def set_password(self, password):
         """Set password hash"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
         """Check password against hash"""
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(password, self.password_hash)
+    
+    def password_needs_rehash(self):
+        """Check whether the stored hash uses outdated parameters"""
+        return password_hasher.needs_rehash(self.password_hash)
     
     def to_dict(self, include_email=False):
         """Convert user to dictionary"""
@@ -44,16 +106,37 @@ class User(db.Model):
 
 class Post(db.Model):
     __tablename__ = 'posts'
+    __table_args__ = (
+        db.Index('ix_posts_created_at_id', 'created_at', 'id'),
+        db.Index('ix_posts_author_id_created_at_id', 'author_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
-    author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    comments_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    excerpt = db.Column(db.String(EXCERPT_LENGTH + 1), nullable=False, default='', server_default='')
+    word_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    views = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
-    comments = db.relationship('Comment', backref='post', lazy='dynamic', cascade='all, delete-orphan')
+    comments = db.relationship('Comment', backref='post', lazy='dynamic',
+                               cascade='all, delete-orphan', passive_deletes=True)
+    
+    @property
+    def is_deleted(self):
+        """Whether the post is hidden and waiting to be purged"""
+        return self.deleted_at is not None
+    
+    def set_content(self, content):
+        """Set content along with its stored excerpt and word count"""
+        self.content = content
+        self.excerpt = make_excerpt(content)
+        self.word_count = count_words(content)
     
     def to_dict(self, include_content=True):
         """Convert post to dictionary"""
@@ -63,7 +146,11 @@ class Post(db.Model):
             'author': self.author.to_dict(),
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
-            'comments_count': self.comments.count()
+            'comments_count': self.comments_count,
+            'excerpt': self.excerpt,
+            'word_count': self.word_count,
+            'reading_time': reading_time(self.word_count),
+            'views': (self.views or 0) + view_counter.pending(self.id)
         }
         if include_content:
             data['content'] = self.content
@@ -75,11 +162,24 @@ class Post(db.Model):
 
 class Comment(db.Model):
     __tablename__ = 'comments'
+    __table_args__ = (
+        db.Index('ix_comments_post_id_created_at_id', 'post_id', 'created_at', 'id'),
+        db.Index('ix_comments_author_id_created_at_id', 'author_id', 'created_at', 'id'),
+        db.Index('ix_comments_post_id_parent_id_created_at_id', 'post_id', 'parent_id', 'created_at', 'id'),
+        db.Index('ix_comments_post_id_path_depth', 'post_id', 'path', 'depth'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
-    author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    # Replies: path is ``comment_path`` of the ancestors and the comment
+    # itself, set right after insert once the id is known (or by
+    # `flask rebuild-comment-threads` for imported rows)
+    parent_id = db.Column(db.Integer, db.ForeignKey('comments.id', ondelete='CASCADE'), index=True)
+    path = db.Column(db.Text().with_variant(db.Text(collation='C'), 'postgresql'))
+    depth = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    replies_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -90,9 +190,90 @@ class Comment(db.Model):
             'content': self.content,
             'author': self.author.to_dict(),
             'post_id': self.post_id,
+            'parent_id': self.parent_id,
+            'depth': self.depth,
+            'replies_count': self.replies_count,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
     
     def __repr__(self):
-        return f'<Comment {self.id}>' 
\ No newline at end of file
+        return f'<Comment {self.id}>' 
+
+
+class Follow(db.Model):
+    __tablename__ = 'follows'
+    __table_args__ = (
+        db.Index('ix_follows_followee_id_follower_id', 'followee_id', 'follower_id'),
+    )
+    
+    follower_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    followee_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Follow {self.follower_id} -> {self.followee_id}>'
+
+
+class TimelineEntry(db.Model):
+    """A post pushed into a follower's home timeline, newest first by created_at"""
+    __tablename__ = 'timeline_entries'
+    __table_args__ = (
+        db.Index('ix_timeline_entries_user_id_created_at_post_id', 'user_id', 'created_at', 'post_id'),
+    )
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<TimelineEntry {self.user_id}:{self.post_id}>'
+
+
+class TrendingScore(db.Model):
+    """Last reconciled trending score of a post, reloaded on startup"""
+    __tablename__ = 'trending_scores'
+    
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<TrendingScore {self.post_id}>'
+
+
+class Lease(db.Model):
+    """Time-limited claim on periodic work that one process should do for all"""
+    __tablename__ = 'leases'
+    
+    name = db.Column(db.String(64), primary_key=True)
+    holder = db.Column(db.String(128), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<Lease {self.name} {self.holder}>'
+
+
+class Job(db.Model):
+    """A unit of background work in the durable queue, see ``jobs.py``"""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    args = db.Column(db.JSON, nullable=False, default=list)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    idempotency_key = db.Column(db.String(200), unique=True, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    last_error = db.Column(db.Text, nullable=True)
+    locked_by = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.name}>'
@@ -0,0 +1,147 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_
+from app import db
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class NicknameIndex:
+    """In-process nickname index for autocomplete and user search
+
+    Keeps a sorted list of lowercased nicknames for prefix lookups and a
+    trigram map for substring lookups. The index is loaded on first use,
+    updated directly on signup and refreshed from the database every
+    ``NICKNAME_INDEX_REFRESH`` seconds: users created or updated since
+    the last refresh are re-read, which picks up signups in other
+    processes and renames, and the index is rebuilt when it holds more
+    users than the database, i.e. some were deleted.
+    """
+
+    # Users created or updated this long before the last refresh are re-read,
+    # so rows committed late by a concurrent transaction are not missed.
+    REFRESH_OVERLAP = timedelta(minutes=5)
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._clear()
+        self.refresh_interval = 30
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('NICKNAME_INDEX_REFRESH', 30)
+        self.refresh_interval = app.config['NICKNAME_INDEX_REFRESH']
+        app.extensions['nickname_index'] = self
+
+    def _clear(self):
+        self._keys = []
+        self._nicknames = {}
+        self._trigram_ids = defaultdict(set)
+        self._loaded = False
+        self._refreshed_at = 0.0
+        self._refreshed_at_utc = None
+
+    def _insert(self, user_id, nickname):
+        if user_id in self._nicknames:
+            if self._nicknames[user_id] == nickname:
+                return
+            self._remove(user_id)
+        key = nickname.lower()
+        bisect.insort(self._keys, (key, user_id))
+        self._nicknames[user_id] = nickname
+        for trigram in _trigrams(key):
+            self._trigram_ids[trigram].add(user_id)
+
+    def _remove(self, user_id):
+        key = self._nicknames.pop(user_id).lower()
+        del self._keys[bisect.bisect_left(self._keys, (key, user_id))]
+        for trigram in _trigrams(key):
+            ids = self._trigram_ids[trigram]
+            ids.discard(user_id)
+            if not ids:
+                del self._trigram_ids[trigram]
+
+    def _load(self, since=None):
+        from models import User
+
+        query = db.session.query(User.id, User.nickname)
+        if since is not None:
+            since -= self.REFRESH_OVERLAP
+            query = query.filter(or_(User.created_at >= since, User.updated_at >= since))
+
+        started_at = datetime.utcnow()
+        rows = query.all()
+        total = db.session.query(func.count(User.id)).scalar() if since is not None else None
+
+        with self._lock:
+            if since is None:
+                self._clear()
+            for user_id, nickname in rows:
+                self._insert(user_id, nickname)
+            self._loaded = True
+            self._refreshed_at = time.monotonic()
+            self._refreshed_at_utc = started_at
+            removed = total is not None and total < len(self._nicknames)
+
+        if removed:
+            self._load()
+
+    def _ensure_fresh(self):
+        if not self._loaded:
+            self._load()
+        elif time.monotonic() - self._refreshed_at > self.refresh_interval:
+            self._load(since=self._refreshed_at_utc)
+
+    def add(self, user_id, nickname):
+        """Index a newly created user"""
+        with self._lock:
+            self._insert(user_id, nickname)
+
+    def reset(self):
+        """Drop the index so it is reloaded on next use"""
+        with self._lock:
+            self._clear()
+
+    def prefix(self, query, limit=10):
+        """Return up to ``limit`` (id, nickname) pairs starting with ``query``"""
+        self._ensure_fresh()
+        key = query.lower()
+
+        with self._lock:
+            start = bisect.bisect_left(self._keys, (key,))
+            matches = []
+            for entry_key, user_id in self._keys[start:start + limit]:
+                if not entry_key.startswith(key):
+                    break
+                matches.append((user_id, self._nicknames[user_id]))
+
+        return matches
+
+    def search(self, query):
+        """Return ids of users whose nickname contains ``query``, by nickname"""
+        self._ensure_fresh()
+        key = query.lower()
+
+        with self._lock:
+            if len(key) < 3:
+                return [user_id for entry_key, user_id in self._keys if key in entry_key]
+
+            candidates = None
+            for trigram in _trigrams(key):
+                ids = self._trigram_ids.get(trigram, set())
+                candidates = ids if candidates is None else candidates & ids
+                if not candidates:
+                    return []
+
+            matches = [(self._nicknames[user_id].lower(), user_id) for user_id in candidates]
+
+        return [user_id for entry_key, user_id in sorted(matches) if key in entry_key]
+
+
+nickname_index = NicknameIndex()
@@ -0,0 +1,117 @@
+import base64
+import json
+from datetime import datetime
+from flask import request
+from sqlalchemy import tuple_
+
+
+class InvalidCursor(ValueError):
+    """Raised when a ?cursor= value cannot be decoded"""
+
+
+def encode_cursor(created_at, item_id, direction):
+    """Encode a (created_at, id) position as an opaque cursor string"""
+    raw = json.dumps([created_at.isoformat(), item_id, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor string into (created_at, id, direction)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, item_id, direction = json.loads(raw)
+        if direction not in ('next', 'prev'):
+            raise ValueError(direction)
+        return datetime.fromisoformat(created_at), int(item_id), direction
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def keyset_query(query, created_col, id_col, cursor, per_page, descending=True):
+    """Filter, order and limit ``query`` to the rows of one keyset page
+
+    Works on both ORM queries and ``select()`` statements. Returns the
+    query and the cursor's direction, to pass on to ``keyset_page``.
+    """
+    key = tuple_(created_col, id_col)
+    direction = 'next'
+
+    if cursor:
+        created_at, item_id, direction = decode_cursor(cursor)
+        position = tuple_(created_at, item_id)
+        # A "prev" cursor walks backwards from the first row of a page
+        if (direction == 'next') == descending:
+            query = query.filter(key < position)
+        else:
+            query = query.filter(key > position)
+
+    if (direction == 'next') == descending:
+        query = query.order_by(created_col.desc(), id_col.desc())
+    else:
+        query = query.order_by(created_col.asc(), id_col.asc())
+
+    return query.limit(per_page + 1), direction
+
+
+def keyset_page(items, created_col, id_col, cursor, per_page, direction):
+    """Trim rows fetched by a ``keyset_query`` to a page and build its pagination fields"""
+    has_more = len(items) > per_page
+    items = items[:per_page]
+
+    if direction == 'next':
+        has_next, has_prev = has_more, bool(cursor)
+    else:
+        items.reverse()
+        has_next, has_prev = True, has_more
+
+    def cursor_for(item, cursor_direction):
+        return encode_cursor(getattr(item, created_col.key), getattr(item, id_col.key),
+                             cursor_direction)
+
+    return items, {
+        'per_page': per_page,
+        'has_next': has_next,
+        'has_prev': has_prev,
+        'next_cursor': cursor_for(items[-1], 'next') if has_next and items else None,
+        'prev_cursor': cursor_for(items[0], 'prev') if has_prev and items else None
+    }
+
+
+def keyset_paginate(query, created_col, id_col, cursor, per_page, descending=True):
+    """Fetch one page of ``query`` after/before ``cursor`` without OFFSET or COUNT
+
+    Rows are ordered by (created_col, id_col), newest first when
+    ``descending``. An empty cursor returns the first page.
+    """
+    query, direction = keyset_query(query, created_col, id_col, cursor, per_page, descending)
+    return keyset_page(query.all(), created_col, id_col, cursor, per_page, direction)
+
+
+def paginate(query, created_col, id_col, descending=True, default_per_page=10):
+    """Paginate a query from the request's ?page= or ?cursor= arguments
+
+    Returns the page items and the pagination fields of the response. Passing
+    ``cursor`` (even empty) switches to keyset mode, which skips the total count.
+    """
+    per_page = request.args.get('per_page', default_per_page, type=int)
+
+    if 'cursor' in request.args:
+        return keyset_paginate(query, created_col, id_col, request.args['cursor'],
+                               per_page, descending=descending)
+
+    page = request.args.get('page', 1, type=int)
+    if descending:
+        query = query.order_by(created_col.desc(), id_col.desc())
+    else:
+        query = query.order_by(created_col.asc(), id_col.asc())
+
+    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+
+    return pagination.items, {
+        'total': pagination.total,
+        'pages': pagination.pages,
+        'current_page': page,
+        'per_page': per_page,
+        'has_next': pagination.has_next,
+        'has_prev': pagination.has_prev
+    }
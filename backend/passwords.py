@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+import threading
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Kept free of app/model imports: worker processes import this module.
+
+DEFAULT_COSTS = {
+    'bcrypt': 12,
+    'pbkdf2': 600000,
+    'scrypt': 32768,
+}
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full"""
+
+
+def hash_password(password, algorithm, cost):
+    """Hash ``password`` with the given algorithm and cost"""
+    if algorithm == 'bcrypt':
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=cost)).decode()
+    if algorithm == 'pbkdf2':
+        return generate_password_hash(password, method=f'pbkdf2:sha256:{cost}')
+    if algorithm == 'scrypt':
+        return generate_password_hash(password, method=f'scrypt:{cost}:8:1')
+    raise ValueError(f'Unknown password hash algorithm: {algorithm}')
+
+
+def verify_password(password, password_hash):
+    """Check ``password`` against a bcrypt or werkzeug hash"""
+    if password_hash.startswith('$2'):
+        return bcrypt.checkpw(password.encode(), password_hash.encode())
+    return check_password_hash(password_hash, password)
+
+
+def hash_parameters(password_hash):
+    """Return the (algorithm, cost) a stored hash was made with"""
+    if password_hash.startswith('$2'):
+        return 'bcrypt', int(password_hash.split('$')[2])
+
+    method = password_hash.split('$', 1)[0].split(':')
+    if method[0] == 'pbkdf2':
+        return 'pbkdf2', int(method[2]) if len(method) > 2 else None
+    if method[0] == 'scrypt':
+        return 'scrypt', int(method[1]) if len(method) > 1 else None
+    return method[0], None
+
+
+class PasswordHasher:
+    """Runs password hashing and verification on a bounded process pool
+
+    ``PASSWORD_HASH_WORKERS`` processes do the work so that a burst of
+    logins cannot pin every request thread; at most
+    ``PASSWORD_HASH_MAX_PENDING`` jobs may be queued before ``HasherBusy``
+    is raised. With zero workers hashing runs inline.
+    """
+
+    def __init__(self, app=None):
+        self.algorithm = 'bcrypt'
+        self.cost = DEFAULT_COSTS['bcrypt']
+        self.workers = 0
+        self.max_pending = 0
+        self._pool = None
+        self._pool_pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_ALGORITHM', 'bcrypt')
+        app.config.setdefault('PASSWORD_HASH_COST', None)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+        app.config.setdefault('PASSWORD_HASH_MAX_PENDING', None)
+
+        self.algorithm = app.config['PASSWORD_HASH_ALGORITHM']
+        if self.algorithm not in DEFAULT_COSTS:
+            raise ValueError(f'Unknown password hash algorithm: {self.algorithm}')
+        self.cost = app.config['PASSWORD_HASH_COST'] or DEFAULT_COSTS[self.algorithm]
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.max_pending = app.config['PASSWORD_HASH_MAX_PENDING'] or self.workers * 4
+        self._slots = threading.BoundedSemaphore(self.max_pending) if self.workers else None
+        self.shutdown()
+        app.extensions['password_hasher'] = self
+
+    def _get_pool(self):
+        # A pool inherited over fork is unusable, so each process makes its own
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            return self._get_pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """Hash a password with the configured algorithm and cost"""
+        return self._run(hash_password, password, self.algorithm, self.cost)
+
+    def hash_many(self, passwords):
+        """Hash a batch of passwords across the whole pool, for bulk jobs
+
+        Unlike ``hash`` this blocks instead of raising ``HasherBusy``.
+        """
+        if not self.workers:
+            return [hash_password(password, self.algorithm, self.cost) for password in passwords]
+
+        chunksize = max(len(passwords) // (self.workers * 4), 1)
+        return list(self._get_pool().map(
+            hash_password, passwords,
+            repeat(self.algorithm), repeat(self.cost),
+            chunksize=chunksize
+        ))
+
+    def verify(self, password, password_hash):
+        """Check a password against a stored hash"""
+        return self._run(verify_password, password, password_hash)
+
+    def needs_rehash(self, password_hash):
+        """Whether a stored hash was made with outdated parameters"""
+        return hash_parameters(password_hash) != (self.algorithm, self.cost)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False)
+            self._pool = None
+            self._pool_pid = None
+
+
+password_hasher = PasswordHasher()
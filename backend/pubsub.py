@@ -0,0 +1,206 @@
+import queue
+import threading
+import uuid
+from collections import OrderedDict, deque, namedtuple
+from flask import current_app
+
+Event = namedtuple('Event', 'id event data')
+
+
+class SubscriptionClosed(Exception):
+    """Raised by ``Subscription.get`` once the broker has dropped it"""
+
+
+class Subscription:
+    """One listener on a channel, with a bounded queue of pending events
+
+    ``missed`` is set when the requested ``Last-Event-ID`` is no longer in
+    the channel history, so the client should refetch instead of resuming.
+    """
+
+    def __init__(self, broker, channel, queue_size, backlog=(), missed=False):
+        self.broker = broker
+        self.channel = channel
+        self.missed = missed
+        self.closed = False
+        self._backlog = deque(backlog)
+        self._queue = queue.Queue(maxsize=queue_size)
+
+    def offer(self, event):
+        """Queue an event without blocking; False if the queue is full"""
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def get(self, timeout=None):
+        """Next event, or None if nothing arrived within ``timeout``"""
+        if self._backlog:
+            return self._backlog.popleft()
+        if self.closed:
+            raise SubscriptionClosed()
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            if self.closed:
+                raise SubscriptionClosed()
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    """Transport interface for ``PubSub``
+
+    A broker delivers events published on a channel to every current
+    subscriber of that channel and keeps a short history for resuming
+    with ``Last-Event-ID``. Event ids are opaque strings chosen by the
+    broker. A broker shared between processes (e.g. one backed by Redis)
+    lets every worker see every event.
+    """
+
+    def publish(self, channel, event, data):
+        raise NotImplementedError
+
+    def subscribe(self, channel, last_event_id=None):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class _Channel:
+    def __init__(self, history):
+        self.sequence = 0
+        self.history = deque(maxlen=history)
+        self.subscribers = set()
+
+
+class LocalBroker(Broker):
+    """In-process broker; only subscribers in the same process see events
+
+    Each subscriber has a queue of ``queue_size`` events. Publishing never
+    blocks: a subscriber whose queue is full is dropped, and its client
+    reconnects and catches up from the last ``history`` events of the
+    channel. At most ``max_channels`` idle channel histories are kept.
+    """
+
+    def __init__(self, history=100, queue_size=64, max_channels=10000):
+        self.history = history
+        self.queue_size = queue_size
+        self.max_channels = max_channels
+        # Ids from another process or an earlier run never match this epoch
+        self.epoch = uuid.uuid4().hex[:8]
+        self._channels = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _channel(self, name):
+        channel = self._channels.get(name)
+        if channel is None:
+            channel = self._channels[name] = _Channel(self.history)
+            if len(self._channels) > self.max_channels:
+                idle = [key for key, value in self._channels.items()
+                        if not value.subscribers and key != name]
+                for key in idle[:len(self._channels) - self.max_channels]:
+                    del self._channels[key]
+        self._channels.move_to_end(name)
+        return channel
+
+    def _sequence(self, event_id):
+        epoch, _, sequence = (event_id or '').partition('-')
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        return int(sequence)
+
+    def publish(self, channel, event, data):
+        with self._lock:
+            state = self._channel(channel)
+            state.sequence += 1
+            message = Event(f'{self.epoch}-{state.sequence}', event, data)
+            state.history.append(message)
+
+            for subscription in list(state.subscribers):
+                if not subscription.offer(message):
+                    subscription.closed = True
+                    state.subscribers.discard(subscription)
+            return message.id
+
+    def subscribe(self, channel, last_event_id=None):
+        with self._lock:
+            state = self._channel(channel)
+            backlog, missed = [], False
+
+            if last_event_id:
+                sequence = self._sequence(last_event_id)
+                oldest = state.history[0] if state.history else None
+                if sequence is None or sequence > state.sequence:
+                    missed = True
+                elif oldest is not None and sequence < self._sequence(oldest.id) - 1:
+                    missed = True
+                else:
+                    backlog = [message for message in state.history
+                               if self._sequence(message.id) > sequence]
+
+            subscription = Subscription(self, channel, self.queue_size, backlog, missed)
+            state.subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscription.closed = True
+            state = self._channels.get(subscription.channel)
+            if state is not None:
+                state.subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(state.subscribers) for state in self._channels.values())
+
+
+class PubSub:
+    """Publish/subscribe bus for live updates, e.g. comment streams
+
+    Payloads are JSON-encoded once at publish time and handed to the
+    broker as strings. The default ``LocalBroker`` only reaches clients
+    connected to the same process; pass a shared broker to ``init_app`` to
+    fan events out across workers.
+    """
+
+    def __init__(self, app=None, broker=None):
+        self.broker = LocalBroker()
+        if app is not None:
+            self.init_app(app, broker)
+
+    def init_app(self, app, broker=None):
+        app.config.setdefault('PUBSUB_HISTORY', 100)
+        app.config.setdefault('PUBSUB_QUEUE_SIZE', 64)
+        app.config.setdefault('PUBSUB_MAX_CHANNELS', 10000)
+
+        if broker is None:
+            broker = LocalBroker(app.config['PUBSUB_HISTORY'],
+                                 app.config['PUBSUB_QUEUE_SIZE'],
+                                 app.config['PUBSUB_MAX_CHANNELS'])
+        self.broker = broker
+        app.extensions['pubsub'] = self
+
+    def publish(self, channel, event, payload):
+        """Send ``payload`` to every subscriber of ``channel``; returns the event id"""
+        return self.broker.publish(channel, event, current_app.json.dumps(payload))
+
+    def subscribe(self, channel, last_event_id=None):
+        return self.broker.subscribe(channel, last_event_id)
+
+
+def format_sse(event):
+    """Encode an event in the text/event-stream wire format"""
+    lines = []
+    if event.id is not None:
+        lines.append(f'id: {event.id}')
+    lines.append(f'event: {event.event}')
+    lines.extend(f'data: {line}' for line in event.data.split('\n'))
+    return '\n'.join(lines) + '\n\n'
+
+
+pubsub = PubSub()
@@ -0,0 +1,60 @@
+from sqlalchemy import select
+from app import db
+from models import User, Post, Comment
+
+AUTHOR_COLUMNS = (
+    User.id.label('author_id'),
+    User.nickname.label('author_nickname'),
+    User.created_at.label('author_created_at'),
+    User.updated_at.label('author_updated_at'),
+)
+
+POST_ROW_COLUMNS = (
+    Post.id, Post.title, Post.created_at, Post.updated_at, Post.comments_count,
+    Post.excerpt, Post.word_count, Post.views,
+    *AUTHOR_COLUMNS
+)
+
+COMMENT_ROW_COLUMNS = (
+    Comment.id, Comment.content, Comment.post_id, Comment.parent_id, Comment.depth,
+    Comment.replies_count, Comment.created_at, Comment.updated_at,
+    *AUTHOR_COLUMNS
+)
+
+
+def post_rows_query():
+    """Post listing columns joined with their author, without ORM objects
+
+    Rows carry exactly what ``serialize_post_row`` needs; ``content`` is
+    not selected, listings show the stored ``excerpt`` instead. Posts
+    waiting to be purged are left out.
+    """
+    return db.session.query(*POST_ROW_COLUMNS)\
+        .join(User, Post.author_id == User.id)\
+        .filter(Post.deleted_at.is_(None))
+
+
+def comment_rows_query():
+    """Comment columns joined with their author, without ORM objects
+
+    Comments on posts waiting to be purged are left out.
+    """
+    return db.session.query(*COMMENT_ROW_COLUMNS)\
+        .join(User, Comment.author_id == User.id)\
+        .join(Post, Comment.post_id == Post.id)\
+        .filter(Post.deleted_at.is_(None))
+
+
+def post_rows_select():
+    """``post_rows_query`` as a ``select()``, for sessions other than ``db.session``"""
+    return select(*POST_ROW_COLUMNS)\
+        .join(User, Post.author_id == User.id)\
+        .where(Post.deleted_at.is_(None))
+
+
+def comment_rows_select():
+    """``comment_rows_query`` as a ``select()``, for sessions other than ``db.session``"""
+    return select(*COMMENT_ROW_COLUMNS)\
+        .join(User, Comment.author_id == User.id)\
+        .join(Post, Comment.post_id == Post.id)\
+        .where(Post.deleted_at.is_(None))
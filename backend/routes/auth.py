@@ -1,12 +1,30 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
 from email_validator import validate_email, EmailNotValidError
 from app import db
 from models import User
+from nickname_index import nickname_index
+from passwords import HasherBusy
+from user_cache import user_cache
+from cache import response_cache
 
 auth_bp = Blueprint('auth', __name__)
 
 
+def create_user_token(user_id, nickname):
+    """Create an access token, embedding the nickname when JWT_USER_CLAIMS is on
+
+    Routes check ownership by nickname against the ``nickname`` claim
+    without loading the user; nicknames cannot change. The subject is the
+    user id as a string, as the JWT spec requires; read it back with
+    ``int(get_jwt_identity())``.
+    """
+    claims = None
+    if current_app.config['JWT_USER_CLAIMS'] and nickname:
+        claims = {'nickname': nickname}
+    return create_access_token(identity=str(user_id), additional_claims=claims)
+
+
 @auth_bp.route('/signup', methods=['POST'])
 def signup():
     """User registration endpoint"""
@@ -47,9 +65,10 @@ def signup():
         
         db.session.add(user)
         db.session.commit()
+        nickname_index.add(user.id, user.nickname)
         
         # Create access token
-        access_token = create_access_token(identity=user.id)
+        access_token = create_user_token(user.id, user.nickname)
         
         return jsonify({
             'message': 'User registered successfully',
@@ -57,6 +76,9 @@ def signup():
             'user': user.to_dict(include_email=True)
         }), 201
         
+    except HasherBusy:
+        db.session.rollback()
+        return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Registration failed'}), 500
@@ -80,8 +102,17 @@ def login():
         if not user or not user.check_password(password):
             return jsonify({'error': 'Invalid email or password'}), 401
         
+        # Upgrade hashes made with old algorithm/cost settings
+        if user.password_needs_rehash():
+            try:
+                user.set_password(password)
+                db.session.commit()
+                response_cache.invalidate(f'user:{user.id}')
+            except Exception:
+                db.session.rollback()
+        
         # Create access token
-        access_token = create_access_token(identity=user.id)
+        access_token = create_user_token(user.id, user.nickname)
         
         return jsonify({
             'message': 'Login successful',
@@ -89,6 +120,8 @@ def login():
             'user': user.to_dict(include_email=True)
         }), 200
         
+    except HasherBusy:
+        return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': 'Login failed'}), 500
 
@@ -98,14 +131,14 @@ def login():
 def get_current_user():
     """Get current user information"""
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        current_user_id = int(get_jwt_identity())
+        user = user_cache.get(current_user_id, include_email=True)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
         return jsonify({
-            'user': user.to_dict(include_email=True)
+            'user': user
         }), 200
         
     except Exception as e:
@@ -117,8 +150,8 @@ def get_current_user():
 def refresh():
     """Refresh access token"""
     try:
-        current_user_id = get_jwt_identity()
-        new_token = create_access_token(identity=current_user_id)
+        current_user_id = int(get_jwt_identity())
+        new_token = create_user_token(current_user_id, get_jwt().get('nickname'))
         
         return jsonify({
             'access_token': new_token
@@ -1,46 +1,157 @@
-from flask import Blueprint, request, jsonify
+import time
+from flask import Blueprint, request, jsonify, current_app, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import select
+from sqlalchemy.orm import defer, selectinload
 from app import db
-from models import User, Post, Comment
+from models import Post, Comment, comment_path, subtree_bounds, keep_updated_at
+from queries import comment_rows_query
+from serializers import serialize_comment_rows
+from pagination import paginate, InvalidCursor
+from cache import response_cache
+from user_cache import user_cache
+from batch import parse_ids, id_tags, fetch_by_ids, InvalidIds
+from pubsub import pubsub, format_sse, Event, SubscriptionClosed
+from trending import trending
+from comment_threads import tree_select, tree_page
 
 comments_bp = Blueprint('comments', __name__)
 
 
 @comments_bp.route('/post/<int:post_id>', methods=['GET'])
+@response_cache.cached('post:{post_id}:comments')
 def get_post_comments(post_id):
-    """Get comments for a specific post"""
+    """Get top-level comments (or replies to ?parent_id=) of a post, or ?view=tree
+
+    The tree view nests up to ?depth= levels of replies, of the whole
+    thread or under ?root=, in pages of comments continued by ?cursor=.
+    """
     try:
-        post = Post.query.get(post_id)
+        post = Post.query.options(defer(Post.content)).get(post_id)
         
-        if not post:
+        if not post or post.is_deleted:
             return jsonify({'error': 'Post not found'}), 404
         
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
+        view = request.args.get('view', 'list')
+        if view == 'tree':
+            depth = request.args.get('depth', current_app.config['COMMENT_MAX_DEPTH'], type=int)
+            per_page = request.args.get('per_page', 100, type=int)
+            if depth < 1 or per_page < 1:
+                return jsonify({'error': 'depth and per_page must be positive'}), 400
+            
+            root = None
+            if 'root' in request.args:
+                root = Comment.query.options(defer(Comment.content)).get(request.args.get('root', 0, type=int))
+                if not root or root.post_id != post_id:
+                    return jsonify({'error': 'Comment not found'}), 404
+            
+            rows = db.session.execute(
+                tree_select(post_id, depth, root, request.args.get('cursor'), per_page)
+            ).all()
+            comments, pagination = tree_page(rows, per_page)
+            
+            return jsonify({
+                'comments': comments,
+                **pagination
+            }), 200
+        
+        if view != 'list':
+            return jsonify({'error': 'view must be list or tree'}), 400
+        
+        parent_id = request.args.get('parent_id', type=int)
+        comments, pagination = paginate(comment_rows_query().filter(Comment.post_id == post_id,
+                                                                    Comment.parent_id == parent_id),
+                                        Comment.created_at, Comment.id,
+                                        descending=False, default_per_page=20)
         
-        comments = Comment.query.filter_by(post_id=post_id)\
-                              .order_by(Comment.created_at.asc())\
-                              .paginate(page=page, per_page=per_page, error_out=False)
+        return jsonify({
+            'comments': serialize_comment_rows(comments),
+            **pagination
+        }), 200
+        
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to get comments'}), 500
+
+
+@comments_bp.route('/batch', methods=['GET'])
+@response_cache.cached(id_tags('comment'))
+def get_comments_batch():
+    """Get several comments by ID, in the requested order"""
+    try:
+        ids = parse_ids()
+        query = Comment.query\
+            .options(selectinload(Comment.author))\
+            .join(Post, Comment.post_id == Post.id)\
+            .filter(Post.deleted_at.is_(None))
+        comments, missing = fetch_by_ids(query, Comment.id, ids)
         
         return jsonify({
-            'comments': [comment.to_dict() for comment in comments.items],
-            'total': comments.total,
-            'pages': comments.pages,
-            'current_page': page,
-            'per_page': per_page,
-            'has_next': comments.has_next,
-            'has_prev': comments.has_prev
+            'comments': [comment.to_dict() for comment in comments],
+            'missing': missing
         }), 200
         
+    except InvalidIds as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to get comments'}), 500
 
 
+@comments_bp.route('/post/<int:post_id>/stream', methods=['GET'])
+def stream_post_comments(post_id):
+    """Stream comment changes on a post as server-sent events
+
+    Reconnecting clients send ``Last-Event-ID`` (or ``?last_event_id=``) to
+    receive what they missed; if that is no longer available a ``reset``
+    event tells them to refetch the comment list.
+    """
+    try:
+        post = Post.query.options(defer(Post.content)).get(post_id)
+        
+        if not post or post.is_deleted:
+            return jsonify({'error': 'Post not found'}), 404
+        
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        keepalive = current_app.config['COMMENT_STREAM_KEEPALIVE']
+        timeout = current_app.config['COMMENT_STREAM_TIMEOUT']
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to open comment stream'}), 500
+    
+    # Runs after the request context is gone, so it must not touch the database
+    def stream():
+        deadline = time.monotonic() + timeout
+        subscription = pubsub.subscribe(f'post:{post_id}:comments', last_event_id)
+        try:
+            yield 'retry: 3000\n\n'
+            if subscription.missed:
+                yield format_sse(Event(None, 'reset', '{}'))
+            
+            # Streams end periodically; the client reconnects with Last-Event-ID
+            while time.monotonic() < deadline:
+                try:
+                    event = subscription.get(timeout=min(keepalive, max(deadline - time.monotonic(), 0)))
+                except SubscriptionClosed:
+                    return
+                yield format_sse(event) if event is not None else ': keepalive\n\n'
+        finally:
+            subscription.close()
+    
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @comments_bp.route('/<int:comment_id>', methods=['GET'])
 def get_comment(comment_id):
     """Get a specific comment by ID"""
     try:
-        comment = Comment.query.get(comment_id)
+        comment = Comment.query\
+            .join(Post, Comment.post_id == Post.id)\
+            .filter(Comment.id == comment_id, Post.deleted_at.is_(None))\
+            .first()
         
         if not comment:
             return jsonify({'error': 'Comment not found'}), 404
@@ -58,7 +169,7 @@ def get_comment(comment_id):
 def create_comment():
     """Create a new comment"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         data = request.get_json()
         
         if not data or not all(k in data for k in ('content', 'post_id')):
@@ -66,28 +177,59 @@ def create_comment():
         
         content = data['content'].strip()
         post_id = data['post_id']
+        parent_id = data.get('parent_id')
         
         if not content:
             return jsonify({'error': 'Content cannot be empty'}), 400
         
         # Check if post exists
-        post = Post.query.get(post_id)
-        if not post:
+        post = Post.query.options(defer(Post.content)).get(post_id)
+        if not post or post.is_deleted:
             return jsonify({'error': 'Post not found'}), 404
         
+        parent = None
+        if parent_id is not None:
+            parent = Comment.query.options(defer(Comment.content)).get(parent_id)
+            if not parent or parent.post_id != post.id:
+                return jsonify({'error': 'Parent comment not found'}), 404
+            if parent.depth + 1 >= current_app.config['COMMENT_MAX_DEPTH']:
+                return jsonify({'error': 'Replies are nested too deeply'}), 400
+        
         # Create new comment
         comment = Comment(
             content=content,
             post_id=post_id,
-            author_id=current_user_id
+            author_id=current_user_id,
+            parent_id=parent.id if parent else None,
+            depth=parent.depth + 1 if parent else 0
         )
         
         db.session.add(comment)
+        # The path ends with the comment's own id, known once it is inserted;
+        # setting updated_at stops its onupdate from firing for the path
+        db.session.flush()
+        comment.path = comment_path(comment.id, parent.path if parent else '')
+        comment.updated_at = comment.created_at
+        Post.query.filter_by(id=post_id).update(
+            {Post.comments_count: Post.comments_count + 1, **keep_updated_at(Post.__table__)},
+            synchronize_session=False
+        )
+        if parent:
+            Comment.query.filter_by(id=parent.id).update(
+                {Comment.replies_count: Comment.replies_count + 1, **keep_updated_at(Comment.__table__)},
+                synchronize_session=False
+            )
         db.session.commit()
+        parent_tags = [f'comment:{parent.id}'] if parent else []
+        response_cache.invalidate('posts', f'post:{post_id}', f'post:{post_id}:comments', *parent_tags)
+        
+        trending.record(post_id, comment.created_at)
+        comment_data = comment.to_dict()
+        pubsub.publish(f'post:{post_id}:comments', 'comment.created', comment_data)
         
         return jsonify({
             'message': 'Comment created successfully',
-            'comment': comment.to_dict()
+            'comment': comment_data
         }), 201
         
     except Exception as e:
@@ -100,7 +242,7 @@ def create_comment():
 def update_comment(comment_id):
     """Update a comment (only by author)"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         comment = Comment.query.get(comment_id)
         
         if not comment:
@@ -121,10 +263,14 @@ def update_comment(comment_id):
         
         comment.content = content
         db.session.commit()
+        response_cache.invalidate(f'post:{comment.post_id}:comments', f'comment:{comment_id}')
+        
+        comment_data = comment.to_dict()
+        pubsub.publish(f'post:{comment.post_id}:comments', 'comment.updated', comment_data)
         
         return jsonify({
             'message': 'Comment updated successfully',
-            'comment': comment.to_dict()
+            'comment': comment_data
         }), 200
         
     except Exception as e:
@@ -137,7 +283,7 @@ def update_comment(comment_id):
 def delete_comment(comment_id):
     """Delete a comment (only by author)"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         comment = Comment.query.get(comment_id)
         
         if not comment:
@@ -146,8 +292,35 @@ def delete_comment(comment_id):
         if comment.author_id != current_user_id:
             return jsonify({'error': 'You can only delete your own comments'}), 403
         
+        # Replies go with the comment (ON DELETE CASCADE); collect them first
+        removed = [(comment_id, comment.created_at)]
+        if comment.path is not None:
+            low, high = subtree_bounds(comment.path)
+            removed += db.session.execute(
+                select(Comment.id, Comment.created_at)
+                .where(Comment.post_id == comment.post_id,
+                       Comment.path > low, Comment.path < high)
+                .order_by(Comment.path)
+            ).all()
+        
         db.session.delete(comment)
+        Post.query.filter_by(id=comment.post_id).update(
+            {Post.comments_count: Post.comments_count - len(removed), **keep_updated_at(Post.__table__)},
+            synchronize_session=False
+        )
+        if comment.parent_id is not None:
+            Comment.query.filter_by(id=comment.parent_id).update(
+                {Comment.replies_count: Comment.replies_count - 1, **keep_updated_at(Comment.__table__)},
+                synchronize_session=False
+            )
         db.session.commit()
+        parent_tags = [f'comment:{comment.parent_id}'] if comment.parent_id is not None else []
+        response_cache.invalidate('posts', f'post:{comment.post_id}', f'post:{comment.post_id}:comments',
+                                  *parent_tags, *(f'comment:{removed_id}' for removed_id, _ in removed))
+        for removed_id, created_at in removed:
+            trending.discard(comment.post_id, created_at)
+            pubsub.publish(f'post:{comment.post_id}:comments', 'comment.deleted',
+                           {'id': removed_id, 'post_id': comment.post_id})
         
         return jsonify({
             'message': 'Comment deleted successfully'
@@ -162,27 +335,19 @@ def delete_comment(comment_id):
 def get_user_comments(user_id):
     """Get comments by a specific user"""
     try:
-        user = User.query.get(user_id)
-        
-        if not user:
+        if not user_cache.get(user_id):
             return jsonify({'error': 'User not found'}), 404
         
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
-        
-        comments = Comment.query.filter_by(author_id=user_id)\
-                              .order_by(Comment.created_at.desc())\
-                              .paginate(page=page, per_page=per_page, error_out=False)
+        comments, pagination = paginate(comment_rows_query().filter(Comment.author_id == user_id),
+                                        Comment.created_at, Comment.id,
+                                        default_per_page=20)
         
         return jsonify({
-            'comments': [comment.to_dict() for comment in comments.items],
-            'total': comments.total,
-            'pages': comments.pages,
-            'current_page': page,
-            'per_page': per_page,
-            'has_next': comments.has_next,
-            'has_prev': comments.has_prev
+            'comments': serialize_comment_rows(comments),
+            **pagination
         }), 200
         
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to get user comments'}), 500 
\ No newline at end of file
@@ -1,42 +1,123 @@
-from flask import Blueprint, request, jsonify
+import math
+from datetime import datetime
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.orm import defer, selectinload
 from app import db
 from models import User, Post
+from queries import post_rows_query
+from serializers import serialize_post_row, serialize_post_rows
+from pagination import paginate, InvalidCursor
+from search import fulltext_search, supports_fulltext
+from cache import response_cache
+from tasks import tasks
+from trending import trending
+from view_counter import view_counter
+from feed import fan_out_post, feed_page
+from commands import purge_post
+from batch import parse_ids, id_tags, fetch_by_ids, InvalidIds
 
 posts_bp = Blueprint('posts', __name__)
 
 
 @posts_bp.route('', methods=['GET'])
+@response_cache.cached('posts')
 def get_posts():
-    """Get all posts with pagination"""
+    """Get all posts with page or cursor pagination"""
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
+        posts, pagination = paginate(post_rows_query(), Post.created_at, Post.id)
         
-        posts = Post.query.order_by(Post.created_at.desc())\
-                         .paginate(page=page, per_page=per_page, error_out=False)
+        return jsonify({
+            'posts': serialize_post_rows(posts),
+            **pagination
+        }), 200
+        
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to get posts'}), 500
+
+
+@posts_bp.route('/feed', methods=['GET'])
+@jwt_required()
+def get_feed():
+    """Get the current user's home timeline with cursor pagination"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        per_page = min(max(request.args.get('per_page', 10, type=int), 1), 100)
+        
+        posts, pagination = feed_page(current_user_id, request.args.get('cursor'), per_page)
         
         return jsonify({
-            'posts': [post.to_dict(include_content=False) for post in posts.items],
-            'total': posts.total,
-            'pages': posts.pages,
-            'current_page': page,
-            'per_page': per_page,
-            'has_next': posts.has_next,
-            'has_prev': posts.has_prev
+            'posts': serialize_post_rows(posts),
+            **pagination
+        }), 200
+        
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to get feed'}), 500
+
+
+@posts_bp.route('/trending', methods=['GET'])
+@response_cache.cached('posts')
+def get_trending_posts():
+    """Get posts ranked by recent comment activity"""
+    try:
+        limit = min(max(request.args.get('limit', 20, type=int), 1), trending.size)
+        
+        # Ask for spare candidates in case some were deleted since they scored
+        ranked = trending.top(limit * 2)
+        rows = {
+            row.id: row
+            for row in post_rows_query().filter(Post.id.in_([post_id for post_id, _ in ranked]))
+        } if ranked else {}
+        
+        authors = {}
+        posts = []
+        for post_id, score in ranked:
+            if post_id in rows:
+                posts.append({**serialize_post_row(rows[post_id], authors), 'trending_score': round(score, 4)})
+            if len(posts) == limit:
+                break
+        
+        return jsonify({
+            'posts': posts
         }), 200
         
+    except Exception as e:
+        return jsonify({'error': 'Failed to get trending posts'}), 500
+
+
+@posts_bp.route('/batch', methods=['GET'])
+@response_cache.cached(id_tags('post'))
+def get_posts_batch():
+    """Get several posts by ID, in the requested order"""
+    try:
+        ids = parse_ids()
+        query = Post.query.options(selectinload(Post.author)).filter(Post.deleted_at.is_(None))
+        posts, missing = fetch_by_ids(query, Post.id, ids)
+        
+        return jsonify({
+            'posts': [post.to_dict(include_content=True) for post in posts],
+            'missing': missing
+        }), 200
+        
+    except InvalidIds as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to get posts'}), 500
 
 
 @posts_bp.route('/<int:post_id>', methods=['GET'])
+@view_counter.counts('post_id')
+@response_cache.cached('post:{post_id}')
 def get_post(post_id):
     """Get a specific post by ID"""
     try:
         post = Post.query.get(post_id)
         
-        if not post:
+        if not post or post.is_deleted:
             return jsonify({'error': 'Post not found'}), 404
         
         return jsonify({
@@ -52,7 +133,7 @@ def get_post(post_id):
 def create_post():
     """Create a new post"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         data = request.get_json()
         
         if not data or not all(k in data for k in ('title', 'content')):
@@ -70,12 +151,14 @@ def create_post():
         # Create new post
         post = Post(
             title=title,
-            content=content,
             author_id=current_user_id
         )
+        post.set_content(content)
         
         db.session.add(post)
         db.session.commit()
+        response_cache.invalidate('posts')
+        tasks.enqueue(fan_out_post, post.id, key=f'fan_out_post:{post.id}')
         
         return jsonify({
             'message': 'Post created successfully',
@@ -92,10 +175,10 @@ def create_post():
 def update_post(post_id):
     """Update a post (only by author)"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         post = Post.query.get(post_id)
         
-        if not post:
+        if not post or post.is_deleted:
             return jsonify({'error': 'Post not found'}), 404
         
         if post.author_id != current_user_id:
@@ -119,9 +202,10 @@ def update_post(post_id):
             content = data['content'].strip()
             if not content:
                 return jsonify({'error': 'Content cannot be empty'}), 400
-            post.content = content
+            post.set_content(content)
         
         db.session.commit()
+        response_cache.invalidate('posts', f'post:{post_id}')
         
         return jsonify({
             'message': 'Post updated successfully',
@@ -138,17 +222,34 @@ def update_post(post_id):
 def delete_post(post_id):
     """Delete a post (only by author)"""
     try:
-        current_user_id = get_jwt_identity()
-        post = Post.query.get(post_id)
+        current_user_id = int(get_jwt_identity())
+        post = Post.query.options(defer(Post.content)).get(post_id)
         
-        if not post:
+        if not post or post.is_deleted:
             return jsonify({'error': 'Post not found'}), 404
         
         if post.author_id != current_user_id:
             return jsonify({'error': 'You can only delete your own posts'}), 403
         
+        # Large threads are hidden now and their comments purged in batches later
+        threshold = current_app.config['POST_PURGE_THRESHOLD']
+        if threshold and post.comments_count >= threshold:
+            post.deleted_at = datetime.utcnow()
+            db.session.commit()
+            response_cache.invalidate('posts', f'post:{post_id}', f'post:{post_id}:comments')
+            tasks.enqueue(purge_post, post_id, current_app.config['POST_PURGE_BATCH_SIZE'],
+                          key=f'purge_post:{post_id}')
+            trending.remove(post_id)
+            
+            return jsonify({
+                'message': 'Post deletion scheduled'
+            }), 202
+        
+        # Comments go with it through ON DELETE CASCADE
         db.session.delete(post)
         db.session.commit()
+        response_cache.invalidate('posts', f'post:{post_id}', f'post:{post_id}:comments')
+        trending.remove(post_id)
         
         return jsonify({
             'message': 'Post deleted successfully'
@@ -161,7 +262,12 @@ def delete_post(post_id):
 
 @posts_bp.route('/search', methods=['GET'])
 def search_posts():
-    """Search posts by title and content"""
+    """Search posts by title and content
+
+    Uses the full-text index by default, ranked by relevance (``sort=rank``)
+    or by date (``sort=recent``). ``mode=substring`` keeps the old
+    ILIKE matching.
+    """
     try:
         query = request.args.get('q', '').strip()
         
@@ -171,17 +277,48 @@ def search_posts():
         if len(query) < 2:
             return jsonify({'error': 'Search query must be at least 2 characters'}), 400
         
-        page = request.args.get('page', 1, type=int)
+        mode = request.args.get('mode', current_app.config['POST_SEARCH_MODE'])
+        sort = request.args.get('sort', 'rank')
+        
+        if mode not in ('fulltext', 'substring'):
+            return jsonify({'error': 'Search mode must be fulltext or substring'}), 400
+        
+        if sort not in ('rank', 'recent'):
+            return jsonify({'error': 'Sort must be rank or recent'}), 400
+        
+        page = max(request.args.get('page', 1, type=int), 1)
         per_page = request.args.get('per_page', 10, type=int)
         
-        posts = Post.query.filter(
+        if mode == 'fulltext' and supports_fulltext():
+            results, total = fulltext_search(query, page, per_page, order=sort)
+            
+            authors = {}
+            posts = []
+            for row, snippet in results:
+                data = serialize_post_row(row, authors)
+                data['snippet'] = snippet
+                posts.append(data)
+            
+            pages = math.ceil(total / per_page) if per_page > 0 else 0
+            
+            return jsonify({
+                'posts': posts,
+                'total': total,
+                'pages': pages,
+                'current_page': page,
+                'per_page': per_page,
+                'has_next': page < pages,
+                'has_prev': page > 1
+            }), 200
+        
+        posts = post_rows_query().filter(
             (Post.title.ilike(f'%{query}%')) | 
             (Post.content.ilike(f'%{query}%'))
         ).order_by(Post.created_at.desc())\
          .paginate(page=page, per_page=per_page, error_out=False)
         
         return jsonify({
-            'posts': [post.to_dict(include_content=False) for post in posts.items],
+            'posts': serialize_post_rows(posts.items),
             'total': posts.total,
             'pages': posts.pages,
             'current_page': page,
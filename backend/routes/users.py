@@ -1,11 +1,40 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+import math
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from app import db
-from models import User, Post
+from models import User, Post, Follow, keep_updated_at
+from queries import post_rows_query
+from serializers import serialize_post_rows
+from pagination import paginate, InvalidCursor
+from nickname_index import nickname_index
+from export import export_stream, FORMATS, KINDS
+from cache import response_cache
+from batch import parse_ids, id_tags, fetch_by_ids, InvalidIds
+from tasks import tasks
+from feed import backfill_timeline, remove_from_timeline
 
 users_bp = Blueprint('users', __name__)
 
 
+@users_bp.route('/batch', methods=['GET'])
+@response_cache.cached(id_tags('user'))
+def get_users_batch():
+    """Get several users by ID, in the requested order"""
+    try:
+        ids = parse_ids()
+        users, missing = fetch_by_ids(User.query, User.id, ids)
+        
+        return jsonify({
+            'users': [user.to_dict() for user in users],
+            'missing': missing
+        }), 200
+        
+    except InvalidIds as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to get users'}), 500
+
+
 @users_bp.route('/<nickname>', methods=['GET'])
 def get_user_profile(nickname):
     """Get user profile by nickname"""
@@ -16,26 +45,19 @@ def get_user_profile(nickname):
             return jsonify({'error': 'User not found'}), 404
         
         # Get user's posts
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        
-        posts = Post.query.filter_by(author_id=user.id)\
-                         .order_by(Post.created_at.desc())\
-                         .paginate(page=page, per_page=per_page, error_out=False)
+        posts, pagination = paginate(post_rows_query().filter(Post.author_id == user.id),
+                                     Post.created_at, Post.id)
         
         return jsonify({
             'user': user.to_dict(),
             'posts': {
-                'items': [post.to_dict(include_content=False) for post in posts.items],
-                'total': posts.total,
-                'pages': posts.pages,
-                'current_page': page,
-                'per_page': per_page,
-                'has_next': posts.has_next,
-                'has_prev': posts.has_prev
+                'items': serialize_post_rows(posts),
+                **pagination
             }
         }), 200
         
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to get user profile'}), 500
 
@@ -49,27 +71,141 @@ def get_user_posts(nickname):
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        
-        posts = Post.query.filter_by(author_id=user.id)\
-                         .order_by(Post.created_at.desc())\
-                         .paginate(page=page, per_page=per_page, error_out=False)
+        posts, pagination = paginate(post_rows_query().filter(Post.author_id == user.id),
+                                     Post.created_at, Post.id)
         
         return jsonify({
-            'posts': [post.to_dict(include_content=False) for post in posts.items],
-            'total': posts.total,
-            'pages': posts.pages,
-            'current_page': page,
-            'per_page': per_page,
-            'has_next': posts.has_next,
-            'has_prev': posts.has_prev
+            'posts': serialize_post_rows(posts),
+            **pagination
         }), 200
         
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to get user posts'}), 500
 
 
+def _adjust_follow_counts(follower_id, followee_id, delta):
+    User.query.filter_by(id=followee_id).update(
+        {User.followers_count: User.followers_count + delta, **keep_updated_at(User.__table__)},
+        synchronize_session=False
+    )
+    User.query.filter_by(id=follower_id).update(
+        {User.following_count: User.following_count + delta, **keep_updated_at(User.__table__)},
+        synchronize_session=False
+    )
+
+
+@users_bp.route('/<nickname>/follow', methods=['POST'])
+@jwt_required()
+def follow_user(nickname):
+    """Follow a user"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        if get_jwt().get('nickname') == nickname:
+            return jsonify({'error': 'You cannot follow yourself'}), 400
+        
+        user = User.query.filter_by(nickname=nickname).first()
+        
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if user.id == current_user_id:
+            return jsonify({'error': 'You cannot follow yourself'}), 400
+        
+        if db.session.get(Follow, (current_user_id, user.id)):
+            return jsonify({'message': 'Already following'}), 200
+        
+        db.session.add(Follow(follower_id=current_user_id, followee_id=user.id))
+        _adjust_follow_counts(current_user_id, user.id, 1)
+        db.session.commit()
+        tasks.enqueue(backfill_timeline, current_user_id, user.id)
+        
+        return jsonify({
+            'message': f'Now following {user.nickname}'
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to follow user'}), 500
+
+
+@users_bp.route('/<nickname>/follow', methods=['DELETE'])
+@jwt_required()
+def unfollow_user(nickname):
+    """Stop following a user"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        user = User.query.filter_by(nickname=nickname).first()
+        
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        follow = db.session.get(Follow, (current_user_id, user.id))
+        if not follow:
+            return jsonify({'error': 'You are not following this user'}), 404
+        
+        db.session.delete(follow)
+        _adjust_follow_counts(current_user_id, user.id, -1)
+        db.session.commit()
+        tasks.enqueue(remove_from_timeline, current_user_id, user.id)
+        
+        return jsonify({
+            'message': f'Unfollowed {user.nickname}'
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to unfollow user'}), 500
+
+
+@users_bp.route('/<nickname>/export', methods=['GET'])
+@jwt_required()
+def export_user_content(nickname):
+    """Stream all of a user's posts and comments as NDJSON or CSV"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        claimed_nickname = get_jwt().get('nickname')
+        
+        # The nickname claim answers the ownership check without a lookup
+        if claimed_nickname is not None:
+            if claimed_nickname != nickname:
+                return jsonify({'error': 'You can only export your own content'}), 403
+            user_id = current_user_id
+        else:
+            user = User.query.filter_by(nickname=nickname).first()
+            
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
+            
+            if user.id != current_user_id:
+                return jsonify({'error': 'You can only export your own content'}), 403
+            user_id = user.id
+        
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in FORMATS:
+            return jsonify({'error': f'Format must be one of: {", ".join(FORMATS)}'}), 400
+        
+        kinds = [kind.strip() for kind in request.args.get('include', ','.join(KINDS)).split(',')]
+        if not kinds or any(kind not in KINDS for kind in kinds):
+            return jsonify({'error': f'Include must be a list of: {", ".join(KINDS)}'}), 400
+        
+        compress = request.args.get('gzip', 'false').lower() in ('1', 'true')
+        
+        response = Response(
+            stream_with_context(export_stream(user_id, fmt, kinds, compress)),
+            mimetype=FORMATS[fmt]
+        )
+        response.headers['Content-Disposition'] = f'attachment; filename="user-{user_id}.{fmt}"'
+        response.headers['Cache-Control'] = 'no-store'
+        if compress:
+            response.headers['Content-Encoding'] = 'gzip'
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to export user content'}), 500
+
+
 @users_bp.route('/search', methods=['GET'])
 def search_users():
     """Search users by nickname"""
@@ -82,22 +218,46 @@ def search_users():
         if len(query) < 2:
             return jsonify({'error': 'Search query must be at least 2 characters'}), 400
         
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = max(request.args.get('per_page', 10, type=int), 1)
+        
+        user_ids = nickname_index.search(query)
+        page_ids = user_ids[(page - 1) * per_page:page * per_page]
         
-        users = User.query.filter(User.nickname.ilike(f'%{query}%'))\
-                         .order_by(User.nickname)\
-                         .paginate(page=page, per_page=per_page, error_out=False)
+        users = {user.id: user for user in User.query.filter(User.id.in_(page_ids))} if page_ids else {}
+        total = len(user_ids)
+        pages = math.ceil(total / per_page)
         
         return jsonify({
-            'users': [user.to_dict() for user in users.items],
-            'total': users.total,
-            'pages': users.pages,
+            'users': [users[user_id].to_dict() for user_id in page_ids if user_id in users],
+            'total': total,
+            'pages': pages,
             'current_page': page,
             'per_page': per_page,
-            'has_next': users.has_next,
-            'has_prev': users.has_prev
+            'has_next': page < pages,
+            'has_prev': page > 1
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Search failed'}), 500
+
+
+@users_bp.route('/autocomplete', methods=['GET'])
+def autocomplete_users():
+    """Suggest users whose nickname starts with the query"""
+    try:
+        query = request.args.get('q', '').strip()
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+        
+        if not query:
+            return jsonify({'error': 'Search query is required'}), 400
+        
+        return jsonify({
+            'users': [
+                {'id': user_id, 'nickname': nickname}
+                for user_id, nickname in nickname_index.prefix(query, limit)
+            ]
         }), 200
         
     except Exception as e:
-        return jsonify({'error': 'Search failed'}), 500 
\ No newline at end of file
+        return jsonify({'error': 'Autocomplete failed'}), 500 
\ No newline at end of file
@@ -0,0 +1,100 @@
+import itertools
+import math
+import time
+from flask import g, request, has_request_context
+from flask_sqlalchemy.session import Session
+from itsdangerous import BadSignature, URLSafeSerializer
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRouter:
+    """Sends read-only request traffic to replica databases round-robin
+
+    Replicas are configured as SQLAlchemy binds named ``replica_<n>``. A
+    request is served from a replica only if it is a GET/HEAD, the session
+    has nothing pending, and the client has not written within the last
+    ``REPLICA_STICKY_SECONDS``. Each request sticks to one replica so its
+    reads see a single snapshot. Everything else, including CLI commands
+    and background work, uses the primary.
+
+    The time of a client's last write travels in a signed cookie rather
+    than process memory, so it holds whichever worker serves the next read.
+    """
+
+    cookie_name = 'last_write'
+
+    def __init__(self, app=None):
+        self.replica_keys = []
+        self.sticky_seconds = 0
+        self._counter = itertools.count()
+        self._serializer = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('DATABASE_REPLICA_URLS', [])
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 5)
+
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+        self.replica_keys = []
+        for i, url in enumerate(app.config['DATABASE_REPLICA_URLS']):
+            key = f'replica_{i}'
+            binds[key] = url
+            self.replica_keys.append(key)
+        self.sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+        self._serializer = URLSafeSerializer(app.config['SECRET_KEY'], salt='replica-sticky')
+
+        if self.replica_keys:
+            app.before_request(self._check_sticky)
+            app.after_request(self._record_write)
+
+        app.extensions['replica_router'] = self
+
+    def _check_sticky(self):
+        if request.method not in READ_METHODS:
+            return
+
+        cookie = request.cookies.get(self.cookie_name)
+        if cookie is None:
+            return
+        try:
+            wrote_at = float(self._serializer.loads(cookie))
+        except (BadSignature, TypeError, ValueError):
+            return
+        if time.time() - wrote_at < self.sticky_seconds:
+            g.use_primary = True
+
+    def _record_write(self, response):
+        if request.method not in READ_METHODS and response.status_code < 400:
+            response.set_cookie(self.cookie_name, self._serializer.dumps(time.time()),
+                                max_age=math.ceil(self.sticky_seconds), httponly=True, samesite='Lax')
+        return response
+
+    def replica_for(self, session):
+        """Return the replica engine for this session, or None for the primary"""
+        if not self.replica_keys or not has_request_context():
+            return None
+        if request.method not in READ_METHODS or g.get('use_primary'):
+            return None
+        if session._flushing or session.new or session.dirty or session.deleted:
+            g.use_primary = True
+            return None
+
+        if 'replica_key' not in g:
+            g.replica_key = self.replica_keys[next(self._counter) % len(self.replica_keys)]
+        return session._db.engines[g.replica_key]
+
+
+replica_router = ReplicaRouter()
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that lets ``replica_router`` pick the engine"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            replica = replica_router.replica_for(self)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
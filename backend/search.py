@@ -0,0 +1,160 @@
+import html
+import re
+from sqlalchemy import DDL, column, event, func, literal_column, select, table, text
+from app import db
+from models import Post
+from queries import post_rows_select
+
+# Highlight markers are private-use characters so that the snippet can be
+# HTML-escaped before they are swapped for <mark> tags.
+_START_SEL = '\ue000'
+_STOP_SEL = '\ue001'
+
+POSTGRES_DDL = [
+    """
+    ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(content, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_posts_search_vector ON posts USING GIN (search_vector)",
+]
+
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+        title, content, content='posts', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+        INSERT INTO posts_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+        INSERT INTO posts_fts (posts_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE OF title, content ON posts BEGIN
+        INSERT INTO posts_fts (posts_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO posts_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+]
+
+posts_fts = table('posts_fts', column('rowid'))
+
+for statement in POSTGRES_DDL:
+    event.listen(Post.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+for statement in SQLITE_DDL:
+    event.listen(Post.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+
+def supports_fulltext():
+    """Whether the current database has a full-text search backend"""
+    return db.engine.dialect.name in ('postgresql', 'sqlite')
+
+
+def rebuild_index():
+    """Create missing search objects and reindex every post"""
+    dialect = db.engine.dialect.name
+
+    if dialect == 'postgresql':
+        # The generated column backfills itself when it is added
+        for statement in POSTGRES_DDL:
+            db.session.execute(text(statement))
+    elif dialect == 'sqlite':
+        for statement in SQLITE_DDL:
+            db.session.execute(text(statement))
+        db.session.execute(text("INSERT INTO posts_fts (posts_fts) VALUES ('rebuild')"))
+    else:
+        raise RuntimeError(f'Full-text search is not supported on {dialect}')
+
+    db.session.commit()
+
+
+def _fts5_query(query):
+    """Turn free text into an FTS5 expression matching every word"""
+    words = re.findall(r'\w+', query)
+    return ' '.join('"{}"'.format(word) for word in words)
+
+
+def _highlight(snippet):
+    """Escape a raw snippet and wrap matched terms in <mark> tags"""
+    if snippet is None:
+        return None
+    return html.escape(snippet)\
+               .replace(_START_SEL, '<mark>')\
+               .replace(_STOP_SEL, '</mark>')
+
+
+def fulltext_statements(query, dialect, order='rank'):
+    """Build the full-text search statements for ``dialect``
+
+    Returns ``(count, rows)``: a statement counting every match and an
+    ordered ``select()`` of ``queries.post_rows_select`` rows plus a raw
+    ``snippet``, still to be offset and limited. Returns None when the
+    query has nothing to match.
+    """
+    if dialect == 'postgresql':
+        tsquery = func.websearch_to_tsquery('english', query)
+        vector = literal_column('posts.search_vector')
+        base = post_rows_select().where(vector.op('@@')(tsquery))
+        rank = func.ts_rank_cd(vector, tsquery)
+        snippet = func.ts_headline(
+            'english', Post.content, tsquery,
+            f'StartSel="{_START_SEL}", StopSel="{_STOP_SEL}", MaxWords=35, MinWords=15'
+        )
+        rank_order = rank.desc()
+    elif dialect == 'sqlite':
+        match = _fts5_query(query)
+        if not match:
+            return None
+        base = post_rows_select()\
+            .join(posts_fts, posts_fts.c.rowid == Post.id)\
+            .where(literal_column('posts_fts').op('MATCH')(match))
+        # bm25() is lower-is-better; title matches weigh more than body matches
+        rank = literal_column('bm25(posts_fts, 10.0, 1.0)')
+        snippet = literal_column(
+            f"snippet(posts_fts, 1, '{_START_SEL}', '{_STOP_SEL}', '…', 24)"
+        )
+        rank_order = rank.asc()
+    else:
+        raise RuntimeError(f'Full-text search is not supported on {dialect}')
+
+    if order == 'recent':
+        ordering = (Post.created_at.desc(), Post.id.desc())
+    else:
+        ordering = (rank_order, Post.id.desc())
+
+    count = select(func.count()).select_from(base.subquery())
+    rows = base.add_columns(snippet.label('snippet')).order_by(*ordering)
+    return count, rows
+
+
+def with_snippets(rows):
+    """Pair search result rows with their highlighted snippets"""
+    return [(row, _highlight(row.snippet)) for row in rows]
+
+
+def fulltext_search(query, page, per_page, order='rank'):
+    """Search posts with the database's full-text index
+
+    Returns ``(results, total)`` where results is a list of
+    ``(row, snippet)`` pairs for the requested page, with rows from
+    ``queries.post_rows_query``.
+    """
+    statements = fulltext_statements(query, db.engine.dialect.name, order)
+    if statements is None:
+        return [], 0
+    count, rows = statements
+
+    total = db.session.scalar(count)
+    rows = db.session.execute(rows.offset((page - 1) * per_page).limit(per_page)).all()
+
+    return with_snippets(rows), total
@@ -0,0 +1,62 @@
+"""Build API dicts straight from projected rows
+
+These produce the same shapes as ``Post.to_dict(include_content=False)``
+and ``Comment.to_dict()`` for rows from ``queries.post_rows_query`` and
+``queries.comment_rows_query``. Author dicts are built once per author
+per page.
+"""
+from models import reading_time
+from view_counter import view_counter
+
+
+def _author(row, authors):
+    author = authors.get(row.author_id)
+    if author is None:
+        author = authors[row.author_id] = {
+            'id': row.author_id,
+            'nickname': row.author_nickname,
+            'created_at': row.author_created_at.isoformat(),
+            'updated_at': row.author_updated_at.isoformat()
+        }
+    return author
+
+
+def serialize_post_row(row, authors=None):
+    """Serialize a post listing row"""
+    return {
+        'id': row.id,
+        'title': row.title,
+        'author': _author(row, {} if authors is None else authors),
+        'created_at': row.created_at.isoformat(),
+        'updated_at': row.updated_at.isoformat(),
+        'comments_count': row.comments_count,
+        'excerpt': row.excerpt,
+        'word_count': row.word_count,
+        'reading_time': reading_time(row.word_count),
+        'views': row.views + view_counter.pending(row.id)
+    }
+
+
+def serialize_comment_row(row, authors=None):
+    """Serialize a comment row"""
+    return {
+        'id': row.id,
+        'content': row.content,
+        'author': _author(row, {} if authors is None else authors),
+        'post_id': row.post_id,
+        'parent_id': row.parent_id,
+        'depth': row.depth,
+        'replies_count': row.replies_count,
+        'created_at': row.created_at.isoformat(),
+        'updated_at': row.updated_at.isoformat()
+    }
+
+
+def serialize_post_rows(rows):
+    authors = {}
+    return [serialize_post_row(row, authors) for row in rows]
+
+
+def serialize_comment_rows(rows):
+    authors = {}
+    return [serialize_comment_row(row, authors) for row in rows]
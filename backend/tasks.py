@@ -0,0 +1,91 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+
+log = logging.getLogger('blog.tasks')
+
+
+class TaskRunner:
+    """Runs short background jobs off the request thread
+
+    Jobs run on a per-process thread pool of ``TASK_WORKERS`` threads, each
+    inside its own application context (and so its own database session).
+    Jobs are not persisted: anything still queued when the process exits
+    is lost, so callers must leave enough state behind to redo the work.
+    With zero workers jobs run inline, which is handy for the CLI.
+
+    Functions registered with ``task`` can instead go to the durable queue
+    in ``jobs.py`` by setting ``TASK_BACKEND=jobs``; they are then run by
+    ``flask worker`` processes, retried on failure and survive restarts.
+    Their arguments must be JSON serializable.
+    """
+
+    def __init__(self, app=None):
+        self.workers = 0
+        self.backend = 'thread'
+        self.registry = {}
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TASK_WORKERS', 2)
+        app.config.setdefault('TASK_BACKEND', 'thread')
+        self.workers = app.config['TASK_WORKERS']
+        self.backend = app.config['TASK_BACKEND']
+        app.extensions['tasks'] = self
+
+    def _get_pool(self):
+        # Threads do not survive a fork, so each process makes its own pool
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix='task')
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def task(self, fn):
+        """Register ``fn`` so it can be queued durably by name"""
+        fn.task_name = f'{fn.__module__}.{fn.__name__}'
+        self.registry[fn.task_name] = fn
+        return fn
+
+    def enqueue(self, fn, *args, key=None, **kwargs):
+        """Run ``fn(*args, **kwargs)`` in the background within an app context
+
+        With the ``jobs`` backend, registered tasks are stored in the job
+        queue instead and ``key`` makes repeated calls queue the job once.
+        """
+        if self.backend == 'jobs' and getattr(fn, 'task_name', None) in self.registry:
+            from jobs import job_queue
+            if kwargs:
+                raise TypeError('queued tasks take positional arguments only')
+            return job_queue.enqueue(fn.task_name, args, key=key)
+
+        app = current_app._get_current_object()
+
+        def run():
+            with app.app_context():
+                try:
+                    fn(*args, **kwargs)
+                except Exception:
+                    log.exception('task %s failed', fn.__name__)
+
+        if not self.workers:
+            run()
+            return None
+        return self._get_pool().submit(run)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=wait)
+            self._pool = None
+            self._pool_pid = None
+
+
+tasks = TaskRunner()
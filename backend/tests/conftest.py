@@ -0,0 +1,92 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_ENVIRONMENT = {
+    'DATABASE_URL': 'sqlite://',
+    'DATABASE_REPLICA_URLS': '',
+    'JWT_SECRET_KEY': 'test-secret-key-that-is-long-enough-for-hs256',
+    'RESPONSE_CACHE_ENABLED': 'false',
+    'VIEW_COUNTER_ENABLED': 'false',
+    'METRICS_ENABLED': 'false',
+    'TASK_BACKEND': 'thread',
+    'TASK_WORKERS': '0',
+    'PASSWORD_HASH_WORKERS': '0',
+}
+
+
+@pytest.fixture
+def make_app(monkeypatch):
+    """Call ``make_app(**environment)`` to build an app with overridden settings"""
+    from app import create_app
+
+    def make(**overrides):
+        for name, value in {**TEST_ENVIRONMENT, **overrides}.items():
+            monkeypatch.setenv(name, value)
+        app = create_app()
+        app.config['TESTING'] = True
+        return app
+
+    return make
+
+
+@pytest.fixture
+def app_environment():
+    """Settings to override for ``app``; test modules may redefine this"""
+    return {}
+
+
+@pytest.fixture
+def app(make_app, app_environment):
+    from app import db
+
+    app = make_app(**app_environment)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def count_statements(app):
+    """Call ``count_statements(fn)`` to run ``fn`` and get the SQL statements it issued"""
+    from app import db
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+
+    def count(fn):
+        statements.clear()
+        fn()
+        return len(statements)
+
+    yield count
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+
+@pytest.fixture
+def author(app):
+    """A user and the Authorization header to act as them"""
+    from flask_jwt_extended import create_access_token
+    from app import db
+    from models import User
+
+    user = User(nickname='author', email='author@example.org', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    token = create_access_token(identity=str(user.id))
+    return {'id': user.id, 'nickname': user.nickname, 'headers': {'Authorization': f'Bearer {token}'}}
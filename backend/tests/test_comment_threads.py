@@ -0,0 +1,65 @@
+"""Replies nest under their parent and deleting a comment removes its subtree"""
+import pytest
+
+from app import db
+from models import Post, Comment
+from trending import trending
+
+
+@pytest.fixture
+def thread(client, author):
+    """root ─ reply ─ nested, and a second top-level comment"""
+    post_id = client.post('/api/posts', json={'title': 'Thread', 'content': 'Discuss'},
+                          headers=author['headers']).get_json()['post']['id']
+
+    def comment(content, parent=None):
+        response = client.post('/api/comments', headers=author['headers'],
+                               json={'post_id': post_id, 'content': content, 'parent_id': parent})
+        assert response.status_code == 201
+        return response.get_json()['comment']['id']
+
+    root = comment('root')
+    reply = comment('reply', root)
+    nested = comment('nested', reply)
+    other = comment('other')
+    return {'post': post_id, 'root': root, 'reply': reply, 'nested': nested, 'other': other}
+
+
+def tree(client, post_id):
+    def shape(comments):
+        return [(comment['content'], shape(comment['replies'])) for comment in comments]
+    return shape(client.get(f'/api/comments/post/{post_id}?view=tree').get_json()['comments'])
+
+
+def test_replies_nest_and_count(client, thread):
+    assert tree(client, thread['post']) == [
+        ('root', [('reply', [('nested', [])])]),
+        ('other', []),
+    ]
+    assert db.session.get(Post, thread['post']).comments_count == 4
+    assert db.session.get(Comment, thread['root']).replies_count == 1
+    assert db.session.get(Comment, thread['nested']).depth == 2
+
+
+def test_delete_removes_subtree_and_updates_counters(client, author, thread):
+    score = dict(trending.top())[thread['post']]
+
+    response = client.delete(f'/api/comments/{thread["reply"]}', headers=author['headers'])
+    assert response.status_code == 200
+
+    db.session.expire_all()
+    assert tree(client, thread['post']) == [('root', []), ('other', [])]
+    assert db.session.get(Comment, thread['nested']) is None
+    assert db.session.get(Post, thread['post']).comments_count == 2
+    assert db.session.get(Comment, thread['root']).replies_count == 0
+    # Both removed comments, each weighing about 1 when new, leave the trending score
+    assert score - dict(trending.top())[thread['post']] == pytest.approx(2, rel=1e-3)
+
+
+def test_deleting_a_leaf_leaves_its_parent(client, author, thread):
+    client.delete(f'/api/comments/{thread["nested"]}', headers=author['headers'])
+
+    db.session.expire_all()
+    assert tree(client, thread['post']) == [('root', [('reply', [])]), ('other', [])]
+    assert db.session.get(Post, thread['post']).comments_count == 3
+    assert db.session.get(Comment, thread['reply']).replies_count == 0
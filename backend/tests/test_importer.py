@@ -0,0 +1,74 @@
+"""A failed import resumes after its last committed batch"""
+import json
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from importer import InvalidRecord, run_import
+from models import Post
+
+
+def write_records(path, records):
+    path.write_text(''.join(json.dumps(record) + '\n' for record in records))
+
+
+def post_records(author_id, ids):
+    return [{'id': post_id, 'title': f'Post {post_id}', 'content': f'Body of post {post_id}',
+             'author_id': author_id} for post_id in ids]
+
+
+def imported_ids():
+    return [post_id for post_id, in db.session.query(Post.id).order_by(Post.id)]
+
+
+def test_resumes_after_a_failing_batch(author, tmp_path):
+    source = tmp_path / 'posts.ndjson'
+    # Post 2 comes back in the second batch and breaks its primary key
+    write_records(source, post_records(author['id'], [1, 2, 3, 2, 5, 6, 7]))
+
+    with pytest.raises(IntegrityError):
+        run_import('posts', str(source), batch_size=3, progress=lambda message: None)
+    assert imported_ids() == [1, 2, 3]
+    assert json.loads((tmp_path / 'posts.ndjson.checkpoint').read_text())['records'] == 3
+
+    write_records(source, post_records(author['id'], [1, 2, 3, 4, 5, 6, 7]))
+    messages = []
+    assert run_import('posts', str(source), batch_size=3, progress=messages.append) == 4
+
+    assert 'Resuming after 3 records' in messages
+    assert imported_ids() == [1, 2, 3, 4, 5, 6, 7]
+    assert not (tmp_path / 'posts.ndjson.checkpoint').exists()
+    assert db.session.get(Post, 4).excerpt == 'Body of post 4'
+
+
+def test_invalid_record_stops_after_committed_batches(author, tmp_path):
+    source = tmp_path / 'posts.ndjson'
+    records = post_records(author['id'], [1, 2, 3, 4])
+    del records[3]['title']
+    write_records(source, records)
+
+    with pytest.raises(InvalidRecord, match='record 4: missing title'):
+        run_import('posts', str(source), batch_size=2, progress=lambda message: None)
+
+    assert imported_ids() == [1, 2]
+
+
+def test_restart_ignores_the_checkpoint(author, tmp_path):
+    source = tmp_path / 'posts.ndjson'
+    write_records(source, post_records(author['id'], [1, 2]))
+    (tmp_path / 'posts.ndjson.checkpoint').write_text(json.dumps(
+        {'kind': 'posts', 'source': str(source), 'records': 2}))
+
+    assert run_import('posts', str(source), restart=True, progress=lambda message: None) == 2
+    assert imported_ids() == [1, 2]
+
+
+def test_checkpoint_of_another_import_is_refused(author, tmp_path):
+    source = tmp_path / 'posts.ndjson'
+    write_records(source, post_records(author['id'], [1]))
+    (tmp_path / 'posts.ndjson.checkpoint').write_text(json.dumps(
+        {'kind': 'comments', 'source': str(source), 'records': 1}))
+
+    with pytest.raises(InvalidRecord, match='belongs to another import'):
+        run_import('posts', str(source), progress=lambda message: None)
@@ -0,0 +1,117 @@
+"""Queued jobs are claimed once, retried with backoff and recovered when stale"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from jobs import job_queue, QUEUED, RUNNING, DONE, FAILED
+from models import Job
+from tasks import tasks
+
+calls = []
+
+
+@tasks.task
+def flaky(fail_times):
+    calls.append(fail_times)
+    if len(calls) <= fail_times:
+        raise RuntimeError('flaky failure')
+
+
+@pytest.fixture
+def app_environment():
+    return {'JOB_MAX_ATTEMPTS': '3', 'JOB_BACKOFF_SECONDS': '10', 'JOB_TIMEOUT': '60'}
+
+
+@pytest.fixture(autouse=True)
+def reset_calls():
+    calls.clear()
+
+
+def make_due(job_id):
+    db.session.get(Job, job_id).run_at = datetime.utcnow()
+    db.session.commit()
+
+
+def claim_and_run():
+    job = job_queue.claim('test-worker')
+    assert job is not None
+    job_queue.run(job)
+    return db.session.get(Job, job.id)
+
+
+def test_idempotency_key_queues_once(app):
+    first = job_queue.enqueue(flaky.task_name, [0], key='once')
+
+    assert job_queue.enqueue(flaky.task_name, [0], key='once') == first
+    assert db.session.query(Job).count() == 1
+
+
+def test_claimed_job_is_not_claimed_again(app):
+    job_queue.enqueue(flaky.task_name, [0])
+
+    job = job_queue.claim('one')
+
+    assert job.status == RUNNING and job.locked_by == 'one' and job.attempts == 1
+    assert job_queue.claim('two') is None
+
+
+def test_successful_job_is_done(app):
+    job_queue.enqueue(flaky.task_name, [0])
+
+    job = claim_and_run()
+
+    assert job.status == DONE
+    assert job.last_error is None
+    assert calls == [0]
+
+
+def test_failed_job_is_retried_with_backoff(app):
+    job_id = job_queue.enqueue(flaky.task_name, [1])
+
+    job = claim_and_run()
+
+    assert job.status == QUEUED
+    assert 'flaky failure' in job.last_error
+    # First retry waits JOB_BACKOFF_SECONDS, with up to 50% jitter
+    delay = (job.run_at - job.finished_at).total_seconds()
+    assert 10 <= delay <= 15
+    assert job_queue.claim('test-worker') is None
+
+    make_due(job_id)
+    assert claim_and_run().status == DONE
+    assert len(calls) == 2
+
+
+def test_job_fails_after_max_attempts(app):
+    job_id = job_queue.enqueue(flaky.task_name, [10])
+
+    for _ in range(3):
+        job = claim_and_run()
+        make_due(job_id)
+
+    assert job.status == FAILED
+    assert job.attempts == 3
+    assert job_queue.claim('test-worker') is None
+
+
+def test_stale_jobs_are_requeued_or_failed(app):
+    long_ago = datetime.utcnow() - timedelta(minutes=5)
+    recent = datetime.utcnow()
+    jobs = {
+        'retry': Job(name=flaky.task_name, args=[0], status=RUNNING, attempts=1, max_attempts=3,
+                     started_at=long_ago, locked_by='lost'),
+        'exhausted': Job(name=flaky.task_name, args=[0], status=RUNNING, attempts=3, max_attempts=3,
+                         started_at=long_ago, locked_by='lost'),
+        'running': Job(name=flaky.task_name, args=[0], status=RUNNING, attempts=1, max_attempts=3,
+                       started_at=recent, locked_by='alive'),
+    }
+    db.session.add_all(jobs.values())
+    db.session.commit()
+
+    assert job_queue.requeue_stale() == 1
+
+    db.session.expire_all()
+    assert (jobs['retry'].status, jobs['retry'].locked_by) == (QUEUED, None)
+    assert (jobs['exhausted'].status, jobs['exhausted'].last_error) == (FAILED, 'timed out')
+    assert jobs['running'].status == RUNNING
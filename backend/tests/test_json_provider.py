@@ -0,0 +1,37 @@
+"""The orjson provider is in use and encodes like Flask's default one"""
+import uuid
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import pytest
+from flask.json.provider import DefaultJSONProvider
+
+import json_provider
+from json_provider import OrjsonProvider
+
+PAYLOADS = {
+    'datetime': {'created_at': datetime(2024, 5, 17, 13, 45, 30)},
+    'aware datetime': {'created_at': datetime(2024, 5, 17, 13, 45, 30, tzinfo=timezone.utc)},
+    'date': {'day': date(2024, 5, 17)},
+    'decimal': {'price': Decimal('19.90'), 'ratio': Decimal('0.1')},
+    'uuid': {'id': uuid.UUID('12345678-1234-5678-1234-567812345678')},
+    'unsorted keys': {'b': 1, 'a': [1, 2.5, None, True], 'c': {'z': 'x', 'y': 'w'}},
+    'non-ascii': {'title': 'Crème brûlée ☕'},
+}
+
+
+def test_app_uses_orjson(app):
+    assert json_provider.orjson is not None
+    assert isinstance(app.json, OrjsonProvider)
+
+
+@pytest.mark.parametrize('payload', PAYLOADS.values(), ids=PAYLOADS.keys())
+def test_encodes_like_the_stdlib_provider(app, payload):
+    compact = {'separators': (',', ':')}
+    assert app.json.dumps(payload, **compact) == DefaultJSONProvider(app).dumps(payload, **compact)
+
+
+def test_responses_match_the_stdlib_provider(app):
+    payload = {**PAYLOADS['datetime'], **PAYLOADS['decimal']}
+    with app.test_request_context():
+        assert app.json.response(payload).get_data() == DefaultJSONProvider(app).response(payload).get_data()
@@ -0,0 +1,56 @@
+"""The nickname index follows users created, renamed and deleted elsewhere"""
+import pytest
+
+from app import db
+from models import User
+from nickname_index import nickname_index
+
+
+@pytest.fixture
+def users(make_app):
+    app = make_app(NICKNAME_INDEX_REFRESH='0')
+    with app.app_context():
+        db.create_all()
+        nickname_index.reset()
+        users = [User(nickname=nickname, email=f'{nickname}@example.org', password_hash='x')
+                 for nickname in ('alice', 'alicia', 'bob')]
+        db.session.add_all(users)
+        db.session.commit()
+        yield {user.nickname: user for user in users}
+        nickname_index.reset()
+        db.session.remove()
+        db.drop_all()
+
+
+def nicknames(pairs):
+    return [nickname for _, nickname in pairs]
+
+
+def test_picks_up_users_created_elsewhere(users):
+    assert nicknames(nickname_index.prefix('ali')) == ['alice', 'alicia']
+
+    db.session.add(User(nickname='alina', email='alina@example.org', password_hash='x'))
+    db.session.commit()
+
+    assert nicknames(nickname_index.prefix('ali')) == ['alice', 'alicia', 'alina']
+
+
+def test_forgets_deleted_users(users):
+    assert nicknames(nickname_index.prefix('ali')) == ['alice', 'alicia']
+
+    db.session.delete(users['alicia'])
+    db.session.commit()
+
+    assert nicknames(nickname_index.prefix('ali')) == ['alice']
+    assert nickname_index.search('lic') == [users['alice'].id]
+
+
+def test_follows_renames(users):
+    assert nickname_index.search('bob') == [users['bob'].id]
+
+    users['bob'].nickname = 'robert'
+    db.session.commit()
+
+    assert nickname_index.search('bob') == []
+    assert nickname_index.prefix('bo') == []
+    assert nicknames(nickname_index.prefix('rob')) == ['robert']
@@ -0,0 +1,68 @@
+"""Keyset cursors walk every row once, in order, in both directions"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from models import Post
+from pagination import InvalidCursor, decode_cursor, encode_cursor
+
+
+@pytest.fixture
+def post_ids(author):
+    """20 posts, newest first; pairs share a created_at so ties fall to the id"""
+    start = datetime(2024, 1, 1)
+    posts = [Post(title=f'Post {i}', content='Text', author_id=author['id'],
+                  created_at=start + timedelta(minutes=i // 2))
+             for i in range(20)]
+    db.session.add_all(posts)
+    db.session.commit()
+    return [post.id for post in sorted(posts, key=lambda post: (post.created_at, post.id), reverse=True)]
+
+
+def walk(client, cursor_field, cursor='', per_page=7):
+    """Follow ``cursor_field`` cursors from ``cursor``; returns every page's response"""
+    pages = []
+    while cursor is not None:
+        response = client.get(f'/api/posts?cursor={cursor}&per_page={per_page}')
+        assert response.status_code == 200
+        pages.append(response.get_json())
+        cursor = pages[-1][cursor_field]
+    return pages
+
+
+def ids(pages):
+    return [post['id'] for page in pages for post in page['posts']]
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 17, 13, 45, 30, 123456)
+    assert decode_cursor(encode_cursor(created_at, 42, 'prev')) == (created_at, 42, 'prev')
+
+
+@pytest.mark.parametrize('cursor', ['not base64!', 'W10', encode_cursor(datetime(2024, 1, 1), 1, 'up')])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_next_cursors_visit_every_post_once(client, post_ids):
+    pages = walk(client, 'next_cursor')
+
+    assert [len(page['posts']) for page in pages] == [7, 7, 6]
+    assert ids(pages) == post_ids
+
+
+def test_prev_cursors_walk_back_to_the_first_page(client, post_ids):
+    *_, last = walk(client, 'next_cursor')
+
+    pages = walk(client, 'prev_cursor', last['prev_cursor'])
+
+    assert [len(page['posts']) for page in pages] == [7, 7]
+    assert ids(reversed(pages)) == post_ids[:14]
+    assert all(page['has_next'] for page in pages)
+    assert not pages[-1]['has_prev']
+
+
+def test_invalid_cursor_is_a_bad_request(client):
+    assert client.get('/api/posts?cursor=garbage').status_code == 400
@@ -0,0 +1,76 @@
+"""List endpoints issue a fixed number of SQL statements, whatever the page size
+
+A statement per row (an N+1 query, e.g. a lazy-loaded author) would make
+the larger page issue more statements than the smaller one.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from models import User, Post, Comment, comment_path, make_excerpt, count_words
+
+MAX_STATEMENTS = 4
+PAGE_SIZES = (5, 50)
+
+
+@pytest.fixture
+def seeded(app):
+    """Three authors taking turns on 60 posts and on 60 comments on the first post"""
+    start = datetime.utcnow() - timedelta(days=1)
+    users = [
+        User(nickname=f'author{i}', email=f'author{i}@example.org', password_hash='x')
+        for i in range(3)
+    ]
+    db.session.add_all(users)
+    db.session.flush()
+
+    posts = []
+    for i in range(60):
+        content = f'Notes on database indexes, part {i}'
+        posts.append(Post(title=f'Database post {i}', content=content, excerpt=make_excerpt(content),
+                          word_count=count_words(content), author_id=users[i % 3].id,
+                          created_at=start + timedelta(minutes=i)))
+    db.session.add_all(posts)
+    db.session.flush()
+
+    for i in range(60):
+        comment = Comment(content=f'Comment {i}', post_id=posts[0].id, author_id=users[i % 3].id,
+                          created_at=start + timedelta(minutes=i))
+        db.session.add(comment)
+        db.session.flush()
+        comment.path = comment_path(comment.id)
+    posts[0].comments_count = 60
+    db.session.commit()
+    return {'nickname': users[0].nickname, 'user_id': users[0].id, 'post_id': posts[0].id}
+
+
+LIST_ENDPOINTS = {
+    'posts': '/api/posts?per_page={per_page}',
+    'posts cursor': '/api/posts?cursor=&per_page={per_page}',
+    'post search': '/api/posts/search?q=database&per_page={per_page}',
+    'user profile': '/api/users/{nickname}?per_page={per_page}',
+    'user posts': '/api/users/{nickname}/posts?per_page={per_page}',
+    'post comments': '/api/comments/post/{post_id}?per_page={per_page}',
+    'post comment tree': '/api/comments/post/{post_id}?view=tree&per_page={per_page}',
+    'user comments': '/api/comments/user/{user_id}?per_page={per_page}',
+}
+
+
+@pytest.mark.parametrize('path', LIST_ENDPOINTS.values(), ids=LIST_ENDPOINTS.keys())
+def test_list_endpoint_statement_count_does_not_grow_with_page_size(client, count_statements, seeded, path):
+    # Warm per-process caches (nickname index, user cache) outside the count
+    client.get(path.format(per_page=1, **seeded))
+
+    counts = {}
+    for per_page in PAGE_SIZES:
+        url = path.format(per_page=per_page, **seeded)
+
+        def fetch():
+            response = client.get(url)
+            assert response.status_code == 200, response.get_json()
+
+        counts[per_page] = count_statements(fetch)
+
+    assert counts[PAGE_SIZES[0]] == counts[PAGE_SIZES[1]], counts
+    assert counts[PAGE_SIZES[1]] <= MAX_STATEMENTS, counts
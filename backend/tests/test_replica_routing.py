@@ -0,0 +1,73 @@
+"""GET requests read a replica unless the client wrote recently"""
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import db
+from models import User
+
+
+@pytest.fixture
+def replicated(make_app, tmp_path):
+    """An app on two SQLite files, the replica lagging behind with no rows at all"""
+    app = make_app(DATABASE_URL=f'sqlite:///{tmp_path / "primary.db"}',
+                   DATABASE_REPLICA_URLS=f'sqlite:///{tmp_path / "replica.db"}')
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines['replica_0'])
+        user = User(nickname='writer', email='writer@example.org', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        token = create_access_token(identity=str(user.id))
+    yield app, {'Authorization': f'Bearer {token}'}
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    # init_app registers a metadata per bind on the shared db object
+    db.metadatas.pop('replica_0', None)
+
+
+def post_titles(client):
+    response = client.get('/api/posts')
+    assert response.status_code == 200
+    return [post['title'] for post in response.get_json()['posts']]
+
+
+def test_reads_go_to_the_replica(replicated):
+    app, headers = replicated
+    writer = app.test_client()
+
+    response = writer.post('/api/posts', json={'title': 'Fresh', 'content': 'Just written'}, headers=headers)
+    assert response.status_code == 201
+
+    assert post_titles(app.test_client()) == []
+
+
+def test_writer_reads_its_own_writes(replicated):
+    app, headers = replicated
+    writer = app.test_client()
+
+    writer.post('/api/posts', json={'title': 'Fresh', 'content': 'Just written'}, headers=headers)
+
+    assert post_titles(writer) == ['Fresh']
+
+
+def test_stickiness_survives_a_different_worker(replicated):
+    app, headers = replicated
+    writer = app.test_client()
+    writer.post('/api/posts', json={'title': 'Fresh', 'content': 'Just written'}, headers=headers)
+
+    # Another process has none of this one's state, only the request's cookie
+    cookie = writer.get_cookie('last_write')
+    other_worker = app.test_client()
+    other_worker.set_cookie('last_write', cookie.value)
+
+    assert post_titles(other_worker) == ['Fresh']
+
+
+def test_forged_cookie_is_ignored(replicated):
+    app, _ = replicated
+    client = app.test_client()
+    client.set_cookie('last_write', '9999999999')
+
+    assert post_titles(client) == []
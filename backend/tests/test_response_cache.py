@@ -0,0 +1,80 @@
+"""Cached responses revalidate with ETags and never outlive the writes they show"""
+import pytest
+
+from cache import response_cache
+
+
+@pytest.fixture
+def app_environment():
+    return {'RESPONSE_CACHE_ENABLED': 'true'}
+
+
+@pytest.fixture
+def post_id(client, author):
+    response = client.post('/api/posts', json={'title': 'First', 'content': 'Hello'},
+                           headers=author['headers'])
+    return response.get_json()['post']['id']
+
+
+def titles(client):
+    return [post['title'] for post in client.get('/api/posts').get_json()['posts']]
+
+
+def test_repeated_get_is_served_from_the_cache(client, post_id):
+    first = client.get('/api/posts')
+    hits = response_cache.hits
+
+    second = client.get('/api/posts')
+
+    assert response_cache.hits == hits + 1
+    assert second.get_data() == first.get_data()
+    assert second.headers['ETag'] == first.headers['ETag']
+
+
+def test_matching_etag_gets_not_modified(client, post_id):
+    etag = client.get('/api/posts').headers['ETag']
+
+    response = client.get('/api/posts', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.get_data() == b''
+
+
+def test_new_post_invalidates_listing(client, author, post_id):
+    etag = client.get('/api/posts').headers['ETag']
+
+    client.post('/api/posts', json={'title': 'Second', 'content': 'Again'}, headers=author['headers'])
+
+    response = client.get('/api/posts', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert titles(client) == ['Second', 'First']
+
+
+def test_update_invalidates_post_and_listing(client, author, post_id):
+    assert client.get(f'/api/posts/{post_id}').get_json()['post']['title'] == 'First'
+    assert titles(client) == ['First']
+
+    client.put(f'/api/posts/{post_id}', json={'title': 'Edited'}, headers=author['headers'])
+
+    assert client.get(f'/api/posts/{post_id}').get_json()['post']['title'] == 'Edited'
+    assert titles(client) == ['Edited']
+
+
+def test_comment_invalidates_thread_and_counts(client, author, post_id):
+    assert client.get(f'/api/comments/post/{post_id}').get_json()['comments'] == []
+    assert client.get('/api/posts').get_json()['posts'][0]['comments_count'] == 0
+
+    client.post('/api/comments', json={'post_id': post_id, 'content': 'Nice'}, headers=author['headers'])
+
+    comments = client.get(f'/api/comments/post/{post_id}').get_json()['comments']
+    assert [comment['content'] for comment in comments] == ['Nice']
+    assert client.get('/api/posts').get_json()['posts'][0]['comments_count'] == 1
+
+
+def test_delete_invalidates_post(client, author, post_id):
+    assert client.get(f'/api/posts/{post_id}').status_code == 200
+
+    client.delete(f'/api/posts/{post_id}', headers=author['headers'])
+
+    assert client.get(f'/api/posts/{post_id}').status_code == 404
+    assert titles(client) == []
@@ -0,0 +1,62 @@
+"""``flask upgrade-db`` brings a database from the first release up to date"""
+import pytest
+from sqlalchemy import text
+
+from app import db
+
+ORIGINAL_SCHEMA = (
+    '''CREATE TABLE users (
+        id INTEGER PRIMARY KEY, nickname VARCHAR(50) NOT NULL UNIQUE, email VARCHAR(120) NOT NULL UNIQUE,
+        password_hash VARCHAR(255) NOT NULL, created_at DATETIME, updated_at DATETIME)''',
+    '''CREATE TABLE posts (
+        id INTEGER PRIMARY KEY, title VARCHAR(200) NOT NULL, content TEXT NOT NULL,
+        author_id INTEGER NOT NULL REFERENCES users (id), created_at DATETIME, updated_at DATETIME)''',
+    '''CREATE TABLE comments (
+        id INTEGER PRIMARY KEY, content TEXT NOT NULL, post_id INTEGER NOT NULL REFERENCES posts (id),
+        author_id INTEGER NOT NULL REFERENCES users (id), created_at DATETIME, updated_at DATETIME)''',
+    "INSERT INTO users VALUES (1, 'old', 'old@example.org', 'x', '2024-01-01', '2024-01-01')",
+    "INSERT INTO posts VALUES (1, 'Old post', 'Written before the upgrade', 1, '2024-01-01', '2024-01-01')",
+    "INSERT INTO comments VALUES (1, 'First', 1, 1, '2024-01-02', '2024-01-02')",
+    "INSERT INTO comments VALUES (2, 'Second', 1, 1, '2024-01-03', '2024-01-03')",
+)
+
+
+@pytest.fixture
+def old_app(make_app, tmp_path):
+    app = make_app(DATABASE_URL=f'sqlite:///{tmp_path / "old.db"}')
+    with app.app_context():
+        with db.engine.begin() as connection:
+            for statement in ORIGINAL_SCHEMA:
+                connection.execute(text(statement))
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_upgrade_adds_columns_and_fills_them(old_app):
+    assert old_app.test_client().get('/api/posts').status_code == 500
+
+    result = old_app.test_cli_runner().invoke(args=['upgrade-db'])
+    assert result.exit_code == 0, result.output
+    assert 'comments.path' in result.output
+
+    client = old_app.test_client()
+    response = client.get('/api/posts')
+    assert response.status_code == 200
+    [post] = response.get_json()['posts']
+    assert post['comments_count'] == 2
+    assert post['excerpt'] == 'Written before the upgrade'
+
+    comments = client.get('/api/comments/post/1?view=tree').get_json()['comments']
+    assert [comment['content'] for comment in comments] == ['First', 'Second']
+    assert client.get('/api/posts/search?q=upgrade').get_json()['posts'][0]['id'] == 1
+
+
+def test_upgrade_is_idempotent(old_app):
+    runner = old_app.test_cli_runner()
+    runner.invoke(args=['upgrade-db'])
+
+    result = runner.invoke(args=['upgrade-db'])
+    assert result.exit_code == 0, result.output
+    assert 'Added columns: none' in result.output
@@ -0,0 +1,55 @@
+"""Cached users are evicted once the transaction that changed them commits"""
+import pytest
+
+from app import db
+from models import User
+from user_cache import user_cache
+
+
+@pytest.fixture
+def user(app):
+    user_cache.clear()
+    user = User(nickname='cached', email='cached@example.org', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def test_update_is_visible_after_commit(user):
+    assert user_cache.get(user.id)['nickname'] == 'cached'
+
+    user.nickname = 'renamed'
+    db.session.commit()
+
+    assert user_cache.get(user.id)['nickname'] == 'renamed'
+
+
+def test_read_between_flush_and_commit_does_not_outlive_the_commit(user):
+    stale = user_cache.get(user.id, include_email=True)
+    user.nickname = 'renamed'
+    db.session.flush()
+    # Another request reloads the committed (old) row before this one commits
+    user_cache.backend.set(user.id, stale, user_cache.ttl)
+
+    db.session.commit()
+
+    assert user_cache.get(user.id)['nickname'] == 'renamed'
+
+
+def test_rollback_keeps_nothing_to_evict(user):
+    user.nickname = 'renamed'
+    db.session.flush()
+    db.session.rollback()
+
+    assert user_cache.get(user.id)['nickname'] == 'cached'
+    db.session.commit()
+    assert user_cache.backend.get(user.id) is not None
+
+
+def test_deleted_user_has_no_comments(client, user):
+    assert client.get(f'/api/comments/user/{user.id}').status_code == 200
+
+    db.session.delete(user)
+    db.session.commit()
+
+    assert client.get(f'/api/comments/user/{user.id}').status_code == 404
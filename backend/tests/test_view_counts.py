@@ -0,0 +1,58 @@
+"""Post views count every GET, cached or not, without waiting for a flush"""
+import pytest
+
+from app import db
+from models import User, Post
+from view_counter import view_counter
+
+
+@pytest.fixture
+def counted(make_app):
+    app = make_app(RESPONSE_CACHE_ENABLED='true', VIEW_COUNTER_ENABLED='true',
+                   VIEW_COUNTER_FLUSH_INTERVAL='3600')
+    with app.app_context():
+        db.create_all()
+        user = User(nickname='author', email='author@example.org', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        post = Post(title='Counted', content='Read me', author_id=user.id)
+        db.session.add(post)
+        db.session.commit()
+        yield app, post.id
+        view_counter.flush()
+        db.session.remove()
+        db.drop_all()
+
+
+def get_views(client, post_id, **headers):
+    response = client.get(f'/api/posts/{post_id}', headers=headers)
+    return response, response.get_json()['post']['views'] if response.status_code == 200 else None
+
+
+def test_cached_responses_show_current_views(counted):
+    app, post_id = counted
+    client = app.test_client()
+
+    assert [get_views(client, post_id)[1] for _ in range(4)] == [1, 2, 3, 4]
+
+
+def test_views_include_flushed_and_pending(counted):
+    app, post_id = counted
+    client = app.test_client()
+    get_views(client, post_id)
+    get_views(client, post_id)
+    view_counter.flush()
+
+    assert get_views(client, post_id)[1] == 3
+    assert db.session.get(Post, post_id).views == 2
+
+
+def test_etag_changes_with_views(counted):
+    app, post_id = counted
+    client = app.test_client()
+    first, _ = get_views(client, post_id)
+
+    response, views = get_views(client, post_id, **{'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 200
+    assert views == 2
+    assert response.headers['ETag'] != first.headers['ETag']
@@ -0,0 +1,271 @@
+import heapq
+import math
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+from app import db
+
+EPOCH = datetime(1970, 1, 1)
+
+# Rescale stored weights before exp() gets anywhere near float overflow
+MAX_EXPONENT = 500
+
+
+def _seconds(moment):
+    return (moment - EPOCH).total_seconds()
+
+
+class Trending:
+    """Incrementally maintained ranking of posts by decayed comment activity
+
+    A post's score is the sum of ``0.5 ** (age / half-life)`` over its
+    comments: a fresh comment counts 1, one half-life old counts 0.5. To
+    avoid touching every score as time passes, each comment instead adds
+    ``exp(λ(t - t0))`` for a fixed base time ``t0``; the ordering is the
+    same and the real score is that sum times ``exp(-λ(now - t0))``.
+
+    Only the best ``TRENDING_SIZE * 10`` posts are kept. Comment creation
+    and deletion adjust scores in O(1). Every
+    ``TRENDING_RECONCILE_INTERVAL`` seconds one process, holding the
+    ``trending`` lease, recomputes the scores from recent comments and
+    stores them in ``trending_scores``; the others reload them from there,
+    as new processes do on start. Between reconciles each process only
+    sees the comments written through it.
+    """
+
+    def __init__(self, app=None):
+        self.decay = math.log(2) / (6 * 3600)
+        self.size = 100
+        self.capacity = 1000
+        self.reconcile_interval = 300
+        self._scores = {}
+        self._base = 0.0
+        self._loaded = False
+        self._reconciled_at = 0.0
+        self._persisted_at = None
+        self._reconciling = False
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TRENDING_HALF_LIFE_HOURS', 6)
+        app.config.setdefault('TRENDING_SIZE', 100)
+        app.config.setdefault('TRENDING_RECONCILE_INTERVAL', 300)
+
+        self.decay = math.log(2) / (app.config['TRENDING_HALF_LIFE_HOURS'] * 3600)
+        self.size = app.config['TRENDING_SIZE']
+        self.capacity = self.size * 10
+        self.reconcile_interval = app.config['TRENDING_RECONCILE_INTERVAL']
+        app.extensions['trending'] = self
+
+    def _weight(self, moment):
+        return math.exp(self.decay * (_seconds(moment) - self._base))
+
+    def _rebase(self, now):
+        # Caller holds the lock
+        exponent = self.decay * (_seconds(now) - self._base)
+        if exponent > MAX_EXPONENT:
+            factor = math.exp(-exponent)
+            self._scores = {post_id: score * factor for post_id, score in self._scores.items()}
+            self._base = _seconds(now)
+
+    def _trim(self):
+        # Caller holds the lock; trimming in bulk keeps inserts amortized O(1)
+        if len(self._scores) > self.capacity * 2:
+            self._scores = dict(heapq.nlargest(self.capacity, self._scores.items(),
+                                               key=lambda item: item[1]))
+
+    def _load(self):
+        from models import TrendingScore
+
+        now = datetime.utcnow()
+        rows = db.session.execute(select(TrendingScore.post_id, TrendingScore.score,
+                                         TrendingScore.computed_at)).all()
+        with self._lock:
+            if self._loaded:
+                return
+            self._base = _seconds(now)
+            for post_id, score, computed_at in rows:
+                self._scores[post_id] = score * self._weight(computed_at)
+            self._persisted_at = max((row.computed_at for row in rows), default=None)
+            self._loaded = True
+            # Nothing persisted yet: reconcile right away rather than after an interval
+            self._reconciled_at = time.monotonic() if rows else 0.0
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self._load()
+
+    def record(self, post_id, created_at=None):
+        """Count a new comment on ``post_id``"""
+        self._ensure_loaded()
+        now = datetime.utcnow()
+        with self._lock:
+            self._rebase(now)
+            self._scores[post_id] = self._scores.get(post_id, 0.0) + self._weight(created_at or now)
+            self._trim()
+        self.maybe_reconcile()
+
+    def discard(self, post_id, created_at):
+        """Take back the contribution of a deleted comment made at ``created_at``"""
+        self._ensure_loaded()
+        with self._lock:
+            if post_id in self._scores:
+                self._scores[post_id] = max(self._scores[post_id] - self._weight(created_at), 0.0)
+
+    def remove(self, post_id):
+        """Forget a deleted post"""
+        with self._lock:
+            self._scores.pop(post_id, None)
+
+    def top(self, limit=None):
+        """Return ``[(post_id, score)]`` for the highest scoring posts"""
+        self._ensure_loaded()
+        self.maybe_reconcile()
+        now = datetime.utcnow()
+        with self._lock:
+            scale = math.exp(-self.decay * (_seconds(now) - self._base))
+            best = heapq.nlargest(limit or self.size, self._scores.items(), key=lambda item: item[1])
+        return [(post_id, score * scale) for post_id, score in best if score > 0]
+
+    def maybe_reconcile(self):
+        """Schedule a background reconcile or reload if the last one is too old"""
+        from tasks import tasks
+
+        with self._lock:
+            if self._reconciling or time.monotonic() - self._reconciled_at < self.reconcile_interval:
+                return
+            self._reconciling = True
+        tasks.enqueue(self._refresh)
+
+    def _refresh(self):
+        # A session of its own on the primary: with TASK_WORKERS=0 this runs
+        # inside a GET request, whose session may be reading a replica
+        try:
+            with Session(db.engine) as session:
+                if self._acquire_lease(session):
+                    self.reconcile(session)
+                else:
+                    self.reload(session)
+        finally:
+            with self._lock:
+                self._reconciling = False
+                self._reconciled_at = time.monotonic()
+
+    def _acquire_lease(self, session):
+        """Claim the ``trending`` lease for one interval; False if another process holds it"""
+        from models import Lease
+
+        now = datetime.utcnow()
+        lease = Lease.__table__
+        holder = f'{socket.gethostname()}:{os.getpid()}'
+        expires_at = now + timedelta(seconds=self.reconcile_interval)
+        taken = session.execute(
+            lease.update()
+            .where(lease.c.name == 'trending', lease.c.expires_at <= now)
+            .values(holder=holder, expires_at=expires_at)
+        ).rowcount
+        if not taken:
+            try:
+                session.execute(lease.insert().values(name='trending', holder=holder, expires_at=expires_at))
+            except IntegrityError:
+                session.rollback()
+                return False
+        session.commit()
+        return True
+
+    def reload(self, session=None):
+        """Replace in-memory scores with the ones last persisted by a reconcile"""
+        from models import TrendingScore
+
+        session = session or db.session
+        now = datetime.utcnow()
+        rows = session.execute(select(TrendingScore.post_id, TrendingScore.score,
+                                      TrendingScore.computed_at)).all()
+        session.rollback()
+        persisted_at = max((row.computed_at for row in rows), default=None)
+        if persisted_at is None or persisted_at == self._persisted_at:
+            return
+        with self._lock:
+            self._base = _seconds(now)
+            self._scores = {post_id: score * self._weight(computed_at)
+                            for post_id, score, computed_at in rows}
+            self._persisted_at = persisted_at
+            self._loaded = True
+
+    def compute(self, now=None, session=None):
+        """Score posts from the comments table; returns ``{post_id: score}``
+
+        Comments older than ten half-lives add under 0.1% and are skipped.
+        The sum runs in SQL; SQLite builds without math functions fall back
+        to summing in Python.
+        """
+        from models import Post, Comment
+
+        session = session or db.session
+        now = now or datetime.utcnow()
+        since = now - timedelta(seconds=10 * math.log(2) / self.decay)
+        recent = (Comment.created_at >= since, Post.deleted_at.is_(None))
+
+        if db.engine.dialect.name == 'postgresql':
+            age = func.extract('epoch', now - Comment.created_at)
+        else:
+            age = (func.julianday(now) - func.julianday(Comment.created_at)) * 86400
+        score = func.sum(func.exp(-self.decay * age)).label('score')
+
+        try:
+            rows = session.execute(
+                select(Comment.post_id, score)
+                .join(Post, Comment.post_id == Post.id)
+                .where(*recent)
+                .group_by(Comment.post_id)
+                .order_by(score.desc())
+                .limit(self.capacity)
+            ).all()
+            return {post_id: value for post_id, value in rows}
+        except OperationalError:
+            session.rollback()
+
+        result = session.execute(
+            select(Comment.post_id, Comment.created_at)
+            .join(Post, Comment.post_id == Post.id)
+            .where(*recent)
+            .execution_options(yield_per=10000)
+        )
+        scores = {}
+        now_seconds = _seconds(now)
+        for post_id, created_at in result:
+            scores[post_id] = scores.get(post_id, 0.0) + \
+                math.exp(-self.decay * (now_seconds - _seconds(created_at)))
+        return dict(heapq.nlargest(self.capacity, scores.items(), key=lambda item: item[1]))
+
+    def reconcile(self, session=None):
+        """Replace in-memory scores with ones computed from the database and persist them"""
+        from models import TrendingScore
+
+        session = session or db.session
+        now = datetime.utcnow()
+        scores = self.compute(now, session)
+
+        session.execute(TrendingScore.__table__.delete())
+        if scores:
+            session.execute(TrendingScore.__table__.insert(), [
+                {'post_id': post_id, 'score': score, 'computed_at': now}
+                for post_id, score in scores.items()
+            ])
+        session.commit()
+
+        with self._lock:
+            self._base = _seconds(now)
+            self._scores = scores
+            self._persisted_at = now
+            self._loaded = True
+
+
+trending = Trending()
@@ -0,0 +1,84 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from cache import LRUCache
+from models import User
+
+
+class UserCache:
+    """Per-process LRU+TTL cache of serialized users keyed by id
+
+    Entries hold ``User.to_dict(include_email=True)`` and are dropped
+    when a transaction that updated or deleted the user through the ORM
+    commits, so a concurrent read of the old row cannot outlive it.
+    """
+
+    def __init__(self, app=None):
+        self.backend = LRUCache()
+        self.ttl = 60
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('USER_CACHE_TTL', 60)
+        app.config.setdefault('USER_CACHE_MAX_ENTRIES', 4096)
+
+        self.ttl = app.config['USER_CACHE_TTL']
+        self.backend = LRUCache(app.config['USER_CACHE_MAX_ENTRIES'])
+        app.extensions['user_cache'] = self
+
+    def get(self, user_id, include_email=False):
+        """Return the user as a dict, or None if it does not exist"""
+        data = self.backend.get(user_id)
+        if data is None:
+            self.misses += 1
+            user = db.session.get(User, user_id)
+            if user is None:
+                return None
+            data = user.to_dict(include_email=True)
+            self.backend.set(user_id, data, self.ttl)
+        else:
+            self.hits += 1
+
+        if include_email:
+            return dict(data)
+        return {k: v for k, v in data.items() if k != 'email'}
+
+    def invalidate(self, user_id):
+        self.backend.delete(user_id)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.backend)}
+
+
+user_cache = UserCache()
+
+
+EVICT_KEY = 'user_cache_evict'
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    # Evict now for reads in this transaction, and again on commit: a
+    # concurrent reader may cache the old row until then
+    changed = {obj.id for obj in session.dirty | session.deleted if isinstance(obj, User)}
+    for user_id in changed:
+        user_cache.invalidate(user_id)
+    if changed:
+        session.info.setdefault(EVICT_KEY, set()).update(changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _evict_committed_users(session):
+    for user_id in session.info.pop(EVICT_KEY, ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_users(session):
+    session.info.pop(EVICT_KEY, None)
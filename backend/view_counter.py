@@ -0,0 +1,167 @@
+import atexit
+import hashlib
+import logging
+import os
+import threading
+from collections import Counter
+from functools import wraps
+from flask import current_app, request
+from sqlalchemy import bindparam, select
+from app import db
+
+log = logging.getLogger('blog.views')
+
+
+class ViewCounter:
+    """Write-behind post view counts
+
+    Views are counted in memory per process and added to ``posts.views``
+    in one batched UPDATE every ``VIEW_COUNTER_FLUSH_INTERVAL`` seconds, or
+    sooner once ``VIEW_COUNTER_FLUSH_THRESHOLD`` views are pending. Pending
+    views are flushed when the process exits normally; a crash loses at
+    most one interval. Counts shown to clients are the stored value plus
+    this process's pending views, so they are approximate.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.flush_interval = 10
+        self.flush_threshold = 1000
+        self.flushed = 0
+        self._pending = Counter()
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher_pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('VIEW_COUNTER_ENABLED', True)
+        app.config.setdefault('VIEW_COUNTER_FLUSH_INTERVAL', 10)
+        app.config.setdefault('VIEW_COUNTER_FLUSH_THRESHOLD', 1000)
+
+        self.enabled = app.config['VIEW_COUNTER_ENABLED']
+        self.flush_interval = app.config['VIEW_COUNTER_FLUSH_INTERVAL']
+        self.flush_threshold = app.config['VIEW_COUNTER_FLUSH_THRESHOLD']
+        if self.enabled:
+            atexit.register(self._flush_at_exit, app)
+        app.extensions['view_counter'] = self
+
+    def _ensure_flusher(self):
+        # Threads do not survive a fork, so each process starts its own
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            app = current_app._get_current_object()
+            threading.Thread(target=self._run_flusher, args=(app,),
+                             name='view-counter', daemon=True).start()
+
+    def _run_flusher(self, app):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            with app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    log.exception('view count flush failed')
+
+    def _flush_at_exit(self, app):
+        if self._pending_total:
+            with app.app_context():
+                self.flush()
+
+    def record(self, post_id):
+        """Count one view of ``post_id``"""
+        if not self.enabled:
+            return
+        self._ensure_flusher()
+        with self._lock:
+            self._pending[post_id] += 1
+            self._pending_total += 1
+            if self._pending_total >= self.flush_threshold:
+                self._wake.set()
+
+    def pending(self, post_id):
+        """Views of ``post_id`` not yet written to the database"""
+        return self._pending.get(post_id, 0)
+
+    def flush(self):
+        """Write pending views to the database; returns the number of posts updated"""
+        from models import Post, keep_updated_at
+
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._pending_total = 0
+        if not pending:
+            return 0
+
+        posts = Post.__table__
+        update = posts.update()\
+            .where(posts.c.id == bindparam('post_id'))\
+            .values(keep_updated_at(posts))\
+            .values(views=posts.c.views + bindparam('count'))
+        try:
+            # A fixed order keeps concurrent flushes from deadlocking on row locks
+            db.session.execute(update, [
+                {'post_id': post_id, 'count': count}
+                for post_id, count in sorted(pending.items())
+            ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                self._pending.update(pending)
+                self._pending_total += sum(pending.values())
+            raise
+
+        self.flushed += sum(pending.values())
+        return len(pending)
+
+    def with_views(self, body, post_id, stored):
+        """Return a ``{'post': ...}`` JSON body and its views, set to ``stored`` plus pending"""
+        data = current_app.json.loads(body)
+        views = data['post']['views'] = stored + self.pending(post_id)
+        return current_app.json.response(data).get_data(), views
+
+    def counts(self, arg):
+        """Count a view on every successful GET of the decorated post view
+
+        ``arg`` names the URL argument holding the post id. Place it above
+        ``response_cache.cached`` so cache hits are counted too; their
+        ``views`` are then set from the stored count plus pending views on
+        the way out rather than frozen when the body was cached.
+        """
+        from models import Post
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                response = current_app.make_response(view(*args, **kwargs))
+                if request.method != 'GET' or response.status_code not in (200, 304):
+                    return response
+
+                post_id = kwargs[arg]
+                self.record(post_id)
+                if response.status_code != 200:
+                    return response
+
+                stored = db.session.scalar(select(Post.views).where(Post.id == post_id)) or 0
+                etag = response.get_etag()[0] or hashlib.sha1(response.get_data()).hexdigest()
+                body, views = self.with_views(response.get_data(), post_id, stored)
+                response.set_data(body)
+                # Unlike the cached body's ETag, this one changes with the views
+                response.set_etag(f'{etag}.{views}')
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        return {'pending': self._pending_total, 'flushed': self.flushed}
+
+
+view_counter = ViewCounter()
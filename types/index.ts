@@ -14,6 +14,11 @@ export interface Post {
   created_at: string;
   updated_at: string;
   comments_count: number;
+  excerpt: string;
+  word_count: number;
+  reading_time: number;
+  views: number;
+  snippet?: string;
 }
 
 export interface Comment {
@@ -21,6 +26,10 @@ export interface Comment {
   content: string;
   author: User;
   post_id: number;
+  parent_id: number | null;
+  depth: number;
+  replies_count: number;
+  replies?: Comment[];
   created_at: string;
   updated_at: string;
 }
@@ -36,6 +45,15 @@ export interface PaginatedResponse<T> {
   per_page: number;
   has_next: boolean;
   has_prev: boolean;
+  next_cursor?: string | null;
+  prev_cursor?: string | null;
+}
+
+export interface BatchResponse<T> {
+  posts?: T[];
+  comments?: T[];
+  users?: T[];
+  missing: number[];
 }
 
 export interface AuthResponse {
@@ -61,6 +79,7 @@ export interface UpdatePostData {
 export interface CreateCommentData {
   content: string;
   post_id: number;
+  parent_id?: number;
 }
 
 export interface LoginData {